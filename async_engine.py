@@ -0,0 +1,410 @@
+"""Async func for work with Gurtam API.
+
+Async counterpart of engine.py built on aiohttp.
+One AsyncClient is opened per server, it keeps a pool of keep-alive
+connections and a semaphore limiting the number of requests in flight.
+Every request waits for the same rate limiter of the server as client.post,
+an expired session is renewed with client.renew_sid and throttled requests
+are repeated with the same backoff. run_bounded takes coroutines from an
+iterable only when there is a free slot, so thousands of rows do not turn
+into thousands of waiting tasks.
+
+engine.get_cards reads the cards of a chunk with run_batches, all core/batch
+requests of the chunk are in flight at the same time.
+
+Example:
+    async with AsyncClient(URL[4]) as client:
+        sid = await get_ssid(client, TOKEN[4])
+        await run_bounded(
+            (update_name(client, sid, uid, name) for uid, name in rows),
+            limit=100,
+        )
+"""
+
+import asyncio
+import json
+from typing import Awaitable, Iterable
+
+import aiohttp
+
+from client import (
+    GATEWAY_STATUS,
+    SESSION_ERRORS,
+    THROTTLE_ERRORS,
+    THROTTLE_STATUS,
+    backoff_delay,
+    current_sid,
+    get_limiter,
+    is_read,
+    renew_sid,
+)
+from config import logger
+from constant import (
+    ASYNC_LIMIT,
+    BATCH_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEP_ALIVE,
+    HTTP_READ_TIMEOUT,
+    RETRY_COUNT,
+)
+
+
+class AsyncClient:
+    """Connection to one wialon server.
+
+    Args:
+        URL (str): server address
+        limit (int): maximum number of requests in flight
+    """
+
+    def __init__(self, URL: str, limit: int = ASYNC_LIMIT):
+        self.URL = URL
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.limit, force_close=not HTTP_KEEP_ALIVE
+            ),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT
+            ),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def call(self, svc: str, params: dict, sid: str | None = None):
+        """Send one request to the wialon API.
+
+        The request is repeated like client.post: throttled requests and
+        connection errors with backoff, gateway errors only for reads,
+        an expired session after the re-login without a pause.
+
+        Args:
+            svc (str): service name, for example "core/search_item"
+            params (dict): service parameters
+            sid (str, optional): session id
+
+        Returns:
+            dict | list: decoded server response, {"error": -1} if the
+            answer is not json
+        """
+        data = {"svc": svc, "params": json.dumps(params)}
+        if sid is not None:
+            data["sid"] = sid
+        limiter = get_limiter(self.URL)
+        for attempt in range(RETRY_COUNT + 1):
+            if data.get("sid"):
+                data["sid"] = current_sid(data["sid"])
+            await asyncio.sleep(limiter.reserve())
+            try:
+                async with self._semaphore:
+                    async with self._session.post(self.URL, data=data) as response:
+                        status = response.status
+                        text = await response.text()
+            except aiohttp.ClientConnectionError as e:
+                if attempt == RETRY_COUNT:
+                    raise
+                logger.warning(f"нет соединения с {self.URL}: {e}, повтор")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            try:
+                result = json.loads(text)
+            except ValueError:
+                result = {"error": -1}
+            code = result.get("error") if isinstance(result, dict) else None
+            if status in THROTTLE_STATUS or code in THROTTLE_ERRORS:
+                limiter.throttled()
+            elif status in GATEWAY_STATUS:
+                limiter.throttled()
+                if not is_read(data):
+                    logger.error(f"запрос {svc} не повторяется, ответ {status}")
+                    return result
+            elif code in SESSION_ERRORS and data.get("sid"):
+                if await asyncio.to_thread(renew_sid, self.URL, data["sid"]) is None:
+                    return result
+                continue
+            else:
+                limiter.success()
+                logger.debug(f"{svc}: {params}, результат: {result}")
+                return result
+            if attempt == RETRY_COUNT:
+                logger.error(f"запрос {svc} не выполнен: {text}")
+                return result
+            await asyncio.sleep(backoff_delay(attempt))
+        return result
+
+
+async def run_bounded(coros: Iterable[Awaitable], limit: int = ASYNC_LIMIT) -> list:
+    """Run coroutines with at most limit of them at the same time.
+
+    Coroutines are taken from the iterable lazily, a new one starts
+    only when one of the running coroutines is finished.
+
+    Args:
+        coros (Iterable[Awaitable]): coroutines to run
+        limit (int): maximum number of running coroutines
+
+    Returns:
+        list: results in the order of coros, an exception instead of
+        the result if the coroutine failed
+    """
+    results = {}
+    running = {}
+    iterator = enumerate(coros)
+    exhausted = False
+    while running or not exhausted:
+        while not exhausted and len(running) < limit:
+            try:
+                number, coro = next(iterator)
+            except StopIteration:
+                exhausted = True
+                break
+            running[asyncio.ensure_future(coro)] = number
+        if not running:
+            break
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            number = running.pop(task)
+            if task.exception() is not None:
+                logger.error(f"ошибка запроса: {task.exception()}")
+                results[number] = task.exception()
+            else:
+                results[number] = task.result()
+    return [results[number] for number in range(len(results))]
+
+
+async def get_ssid(client: AsyncClient, TOKEN: str) -> str:
+    """Authorize by token and getting the session number.
+
+    Args:
+        client (AsyncClient): server connection
+        TOKEN (str): secret key
+
+    Returns:
+        str: eid - session id on vialon
+    """
+    response = await client.call("token/login", {"token": TOKEN})
+    return response.get("eid")
+
+
+async def search_items(
+    client: AsyncClient,
+    sid: str,
+    spec: dict,
+    flags: int,
+    start: int = 0,
+    end: int = 0,
+) -> dict:
+    """Search items.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        spec (dict): search specification (itemsType, propName, ...)
+        flags (int): data flags
+        start (int): index of the first item
+        end (int): index of the last item, 0 - all items
+
+    Returns:
+        dict: {"totalItemsCount": <int>, "items": [...], ...}
+    """
+    return await client.call(
+        "core/search_items",
+        {"spec": spec, "force": 1, "flags": flags, "from": start, "to": end},
+        sid,
+    )
+
+
+async def search_item(client: AsyncClient, sid: str, item_id: int, flags: int) -> dict:
+    """Search item by id.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        item_id (int): item id
+        flags (int): data flags
+
+    Returns:
+        dict: {"item": {...}, "flags": <int>}
+    """
+    return await client.call("core/search_item", {"id": item_id, "flags": flags}, sid)
+
+
+async def update_name(client: AsyncClient, sid: str, unit_id: int, name: str) -> dict:
+    """Update object name.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        unit_id (int): unit/object id
+        name (str): new name
+
+    Returns:
+        dict: {"nm": new_name}
+    """
+    return await client.call(
+        "item/update_name", {"itemId": unit_id, "name": name.strip()}, sid
+    )
+
+
+async def update_phone(client: AsyncClient, sid: str, unit_id: int, phone: str) -> dict:
+    """Update object phone.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        unit_id (int): unit/object id
+        phone (str): new phone number
+
+    Returns:
+        dict: {"ph": new phone}
+    """
+    return await client.call(
+        "unit/update_phone", {"itemId": unit_id, "phoneNumber": phone}, sid
+    )
+
+
+async def update_admin_field(
+    client: AsyncClient,
+    sid: str,
+    unit_id: int,
+    field_id: int,
+    name: str,
+    value: str,
+) -> list:
+    """Update admin field.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        unit_id (int): unit/object id
+        field_id (int): field id
+        name (str): field name
+        value (str): new value
+
+    Returns:
+        list: [field id, {"id": <long>, "n": <text>, "v": <text>}]
+    """
+    return await client.call(
+        "item/update_admin_field",
+        {
+            "itemId": unit_id,
+            "id": field_id,
+            "callMode": "update",
+            "n": name,
+            "v": value,
+        },
+        sid,
+    )
+
+
+async def update_custom_field(
+    client: AsyncClient,
+    sid: str,
+    unit_id: int,
+    field_id: int,
+    name: str,
+    value: str,
+) -> list:
+    """Update custom field.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        unit_id (int): unit/object id
+        field_id (int): field id
+        name (str): field name
+        value (str): new value
+
+    Returns:
+        list: [field id, {"id": <long>, "n": <text>, "v": <text>}]
+    """
+    return await client.call(
+        "item/update_custom_field",
+        {
+            "itemId": unit_id,
+            "id": field_id,
+            "callMode": "update",
+            "n": name,
+            "v": value,
+        },
+        sid,
+    )
+
+
+async def batch(
+    client: AsyncClient, sid: str, requests_list: list[dict], flags: int = 0
+) -> list:
+    """Send several requests in one core/batch.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        requests_list (list[dict]): [{"svc": <text>, "params": {...}}]
+        flags (int): 0 - continue on errors, 1 - stop on the first error
+
+    Returns:
+        list: results of the requests in the same order
+    """
+    return await client.call(
+        "core/batch", {"params": requests_list, "flags": flags}, sid
+    )
+
+
+async def batch_all(
+    client: AsyncClient, sid: str, requests_list: list[dict], size: int | None = None
+) -> list:
+    """Send many requests as core/batch of size requests at the same time.
+
+    Args:
+        client (AsyncClient): server connection
+        sid (str): session id
+        requests_list (list[dict]): [{"svc": <text>, "params": {...}}]
+        size (int | None): requests in one core/batch, BATCH_SIZE if not set
+
+    Returns:
+        list: results in the order of requests_list, {"error": code} for
+        the requests of a core/batch that failed as a whole
+    """
+    size = size or BATCH_SIZE
+    parts = [
+        requests_list[start : start + size]
+        for start in range(0, len(requests_list), size)
+    ]
+    answers = await run_bounded(
+        (batch(client, sid, part) for part in parts), client.limit
+    )
+    results = []
+    for part, answer in zip(parts, answers):
+        if not isinstance(answer, list):
+            logger.error(f"core/batch не выполнен: {answer}")
+            error = answer.get("error", -1) if isinstance(answer, dict) else -1
+            answer = [{"error": error}] * len(part)
+        results.extend(answer)
+    return results
+
+
+def run_batches(sid: str, URL: str, requests_list: list[dict]) -> list:
+    """Send the requests with batch_all from synchronous code.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        requests_list (list[dict]): [{"svc": <text>, "params": {...}}]
+
+    Returns:
+        list: results in the order of requests_list, see batch_all
+    """
+
+    async def send():
+        async with AsyncClient(URL) as client:
+            return await batch_all(client, sid, requests_list)
+
+    if not requests_list:
+        return []
+    return asyncio.run(send())
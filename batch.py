@@ -0,0 +1,88 @@
+"""Coalescing of requests of many objects into one core/batch.
+
+Requests are collected with a key of the row they belong to and sent
+BATCH_SIZE at a time. The result and the error code of every request
+are mapped back to the key.
+
+Example:
+    with BatchCoalescer(sid, url) as coalescer:
+        for number, unit in enumerate(rows):
+            coalescer.add(number, "item/update_name", {...})
+    coalescer.errors  # {row number: [error codes]}
+"""
+
+import json
+from collections import defaultdict
+from typing import Hashable
+
+from client import post
+from config import logger
+from constant import BATCH_SIZE
+
+
+class BatchCoalescer:
+    """Collector of requests for core/batch.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        size (int): maximum number of requests in one core/batch
+    """
+
+    def __init__(self, sid: str, URL: str, size: int = BATCH_SIZE):
+        self.sid = sid
+        self.URL = URL
+        self.size = size
+        self.requests_sent = 0
+        self.results = defaultdict(list)
+        self.errors = defaultdict(list)
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def add(self, key: Hashable, svc: str, params: dict) -> None:
+        """Add a request, send the batch when it is full.
+
+        Args:
+            key (Hashable): key of the row the request belongs to
+            svc (str): service name
+            params (dict): service parameters
+        """
+        self._pending.append((key, {"svc": svc, "params": params}))
+        if len(self._pending) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send collected requests and map the results to the rows.
+
+        An item of core/batch that failed comes back as {"error": code},
+        if the whole batch failed the error is written to every row.
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        param = {
+            "svc": "core/batch",
+            "params": json.dumps(
+                {"params": [request for _, request in pending], "flags": 0}
+            ),
+            "sid": self.sid,
+        }
+        logger.debug(f"отправка {len(pending)} запросов одним core/batch")
+        self.requests_sent += 1
+        try:
+            response = post(self.URL, data=param).json()
+        except Exception as e:
+            logger.error(f"core/batch не выполнен: {e}")
+            response = {"error": -1}
+        if not isinstance(response, list):
+            logger.error(f"core/batch не выполнен: {response}")
+            response = [response] * len(pending)
+        for (key, _), result in zip(pending, response):
+            self.results[key].append(result)
+            if isinstance(result, dict) and "error" in result:
+                self.errors[key].append(result.get("error"))
@@ -0,0 +1,155 @@
+"""Checkpoints of bulk imports.
+
+Every row applied to wialon is recorded in an SQLite file in the
+instance folder as a hash of its content together with the route and
+the server. When a file is uploaded again, or a job is restarted after
+the process stopped, rows with identical content applied less than
+CHECKPOINT_TTL seconds ago are skipped.
+
+Example:
+    with Checkpoint("fill_inn", fms) as checkpoint:
+        for unit, result in stream_units(checkpoint.pending(rows, skipped), ...):
+            if ok:
+                checkpoint.done(unit)
+"""
+
+import os
+import sqlite3
+import time
+from typing import Callable, Iterable, Iterator
+
+from config import app, logger
+from constant import CHECKPOINT_TTL, CHUNK_SIZE
+from pipeline import chunked
+from rowstore import QUERY_SIZE, connect, hash_values
+
+# keys written to the row by the pipeline, not part of its content
+PIPELINE_KEYS = ("uid",)
+
+
+def row_digest(row: dict) -> bytes:
+    """Hash of the content of the row.
+
+    Args:
+        row (dict): row of the uploaded file
+
+    Returns:
+        bytes: 16 bytes of blake2b
+    """
+    values = sorted(
+        (key, value) for key, value in row.items() if key not in PIPELINE_KEYS
+    )
+    return hash_values(values)
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the checkpoints, create the table if necessary.
+
+    Returns:
+        sqlite3.Connection: connection to the checkpoints
+    """
+    return connect(
+        os.path.join(app.instance_path, "checkpoints.db"),
+        """CREATE TABLE IF NOT EXISTS rows (
+            kind TEXT,
+            fms INTEGER,
+            hash BLOB,
+            applied REAL,
+            PRIMARY KEY (kind, fms, hash)
+        )""",
+    )
+
+
+class Checkpoint:
+    """Applied rows of a route on a server.
+
+    Args:
+        kind (str): route, the kind of the job
+        fms (int): server number
+        ttl (int): seconds a checkpoint is valid
+    """
+
+    def __init__(self, kind: str, fms: int, ttl: int = CHECKPOINT_TTL):
+        self.kind = kind
+        self.fms = fms
+        self.ttl = ttl
+        self.skipped = 0
+        self._applied = []
+        connection = _connect()
+        with connection:
+            connection.execute(
+                "DELETE FROM rows WHERE applied < ?", (time.time() - ttl,)
+            )
+        connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def _known(self, digests: list[bytes]) -> set[bytes]:
+        connection = _connect()
+        known = {
+            digest
+            for (digest,) in connection.execute(
+                "SELECT hash FROM rows WHERE kind = ? AND fms = ? AND applied >= ? "
+                f"AND hash IN ({', '.join('?' * len(digests))})",
+                [self.kind, self.fms, time.time() - self.ttl, *digests],
+            )
+        }
+        connection.close()
+        return known
+
+    def pending(
+        self, rows: Iterable[dict], skipped: Callable[[dict], None] | None = None
+    ) -> Iterator[dict]:
+        """Rows not applied yet.
+
+        Args:
+            rows (Iterable[dict]): rows of the uploaded file
+            skipped (Callable[[dict], None] | None): called for every
+            row that is skipped
+
+        Yields:
+            dict: rows to process, in order
+        """
+        for chunk in chunked(rows, QUERY_SIZE):
+            digests = [row_digest(row) for row in chunk]
+            known = self._known(digests)
+            for row, digest in zip(chunk, digests):
+                if digest not in known:
+                    yield row
+                    continue
+                self.skipped += 1
+                if skipped is not None:
+                    skipped(row)
+        if self.skipped:
+            logger.info(
+                f"{self.kind}: пропущено строк, загруженных ранее: {self.skipped}"
+            )
+
+    def done(self, row: dict) -> None:
+        """Record the row as applied.
+
+        Args:
+            row (dict): row applied to wialon
+        """
+        self._applied.append(row_digest(row))
+        if len(self._applied) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write recorded rows to the checkpoints."""
+        if not self._applied:
+            return
+        applied, self._applied = self._applied, []
+        now = time.time()
+        connection = _connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO rows (kind, fms, hash, applied) "
+                "VALUES (?, ?, ?, ?)",
+                [(self.kind, self.fms, digest, now) for digest in applied],
+            )
+        connection.close()
@@ -0,0 +1,329 @@
+"""Pooled HTTP client for the Wialon servers.
+
+One requests.Session is kept per server address from the URL dict
+in constant.py, so every call to the same FMS reuses already opened
+keep-alive connections instead of a new TCP and TLS handshake.
+
+Requests to every server are paced by a token bucket. Its rate grows
+while the server answers and is halved when the server reports that
+there are too many requests, so the rate stays near the highest one
+the server accepts. Throttled requests, connection errors and expired
+sessions are retried with exponential backoff, gateway errors only
+for requests that read.
+"""
+
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import logger
+from constant import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEP_ALIVE,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    RATE_LIMIT,
+    RATE_LIMIT_MAX,
+    RATE_LIMIT_MIN,
+    RETRY_BACKOFF,
+    RETRY_COUNT,
+    TOKEN,
+    URL as SERVERS,
+)
+
+# 10 - reached limit of concurrent requests,
+# 1003 - only one request is allowed at the moment
+THROTTLE_ERRORS = {10, 1003}
+# 1 - invalid session, 1011 - session expired or IP changed
+SESSION_ERRORS = {1, 1011}
+THROTTLE_STATUS = {429}
+# the gateway did not get the answer, the server may have executed
+# the request already, so only requests that read are repeated
+GATEWAY_STATUS = {502, 503, 504}
+READ_SVCS = {"core/search_item", "core/search_items", "token/login"}
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+_renew_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Adaptive token bucket.
+
+    Args:
+        rate (float): requests per second at the start
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT):
+        self.rate = rate
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token without waiting.
+
+        Returns:
+            float: seconds to wait before the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self) -> None:
+        """Wait for a free token."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def success(self) -> None:
+        """The server accepted the request, raise the rate a little."""
+        with self._lock:
+            self.rate = min(RATE_LIMIT_MAX, self.rate + 1 / self.rate)
+
+    def throttled(self) -> None:
+        """The server refused the request, halve the rate."""
+        with self._lock:
+            self.rate = max(RATE_LIMIT_MIN, self.rate / 2)
+            logger.warning(f"сервер ограничивает запросы, скорость: {self.rate:.1f}/с")
+
+
+_limiters: dict[str, RateLimiter] = {}
+# expired session id -> new session id
+_renewed_sids: dict[str, str] = {}
+
+
+def get_session(URL: str) -> requests.Session:
+    """Get the connection pool of the server.
+
+    The session is created on the first call and then shared
+    by every function working with this server.
+
+    Args:
+        URL (str): server address
+
+    Returns:
+        requests.Session: session with a connection pool
+    """
+    session = _sessions.get(URL)
+    if session is not None:
+        return session
+    with _lock:
+        if URL not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=HTTP_POOL_SIZE,
+                pool_block=True,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {"Connection": "keep-alive" if HTTP_KEEP_ALIVE else "close"}
+            )
+            _sessions[URL] = session
+            logger.debug(f"создан пул соединений для {URL}")
+        return _sessions[URL]
+
+
+def get_limiter(URL: str) -> RateLimiter:
+    """Get the rate limiter of the server.
+
+    Args:
+        URL (str): server address
+
+    Returns:
+        RateLimiter: token bucket of the server
+    """
+    with _lock:
+        return _limiters.setdefault(URL, RateLimiter())
+
+
+def _error_code(response: requests.Response) -> int | None:
+    """Get wialon error code from the response.
+
+    Only a short answer that starts as {"error": ...} is decoded,
+    big search results are not parsed twice.
+    """
+    if len(response.content) > 200 or not response.content.startswith(b'{"error"'):
+        return None
+    try:
+        return response.json().get("error")
+    except ValueError:
+        return None
+
+
+def current_sid(sid: str) -> str:
+    """Get the session id that replaced an expired one.
+
+    Args:
+        sid (str): session id
+
+    Returns:
+        str: the last session id received by re-login, or sid itself
+    """
+    while sid in _renewed_sids:
+        sid = _renewed_sids[sid]
+    return sid
+
+
+def renew_sid(URL: str, sid: str) -> str | None:
+    """Login again with the token of the server.
+
+    Args:
+        URL (str): server address
+        sid (str): expired session id
+
+    Returns:
+        str | None: new session id
+    """
+    token = next(
+        (TOKEN[fms] for fms, address in SERVERS.items() if address == URL), None
+    )
+    if token is None:
+        return None
+    with _renew_lock:
+        if sid in _renewed_sids:
+            return _renewed_sids[sid]
+        param = {"svc": "token/login", "params": json.dumps({"token": token})}
+        new_sid = get_session(URL).post(
+            URL, data=param, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        ).json().get("eid")
+        if new_sid:
+            _renewed_sids[sid] = new_sid
+            logger.info(f"сессия {URL} истекла, выполнен повторный вход")
+        return new_sid
+
+
+def is_read(data: dict) -> bool:
+    """Check that the request only reads data.
+
+    core/batch is a read if every request inside it is a read.
+
+    Args:
+        data (dict): request parameters
+
+    Returns:
+        bool: True if the request can be repeated without side effects
+    """
+    svc = data.get("svc")
+    if svc != "core/batch":
+        return svc in READ_SVCS
+    try:
+        requests_list = json.loads(data.get("params", "{}")).get("params", [])
+    except (TypeError, ValueError, AttributeError):
+        return False
+    return all(request.get("svc") in READ_SVCS for request in requests_list)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Pause before the next attempt, exponential with jitter."""
+    return min(30, RETRY_BACKOFF * 2**attempt) * (1 + random.random() / 2)
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(backoff_delay(attempt))
+
+
+def post(URL: str, data: dict, headers: dict | None = None) -> requests.Response:
+    """Send POST request through the server connection pool.
+
+    The request waits for the rate limiter of the server. If the server
+    reports too many requests, the request is repeated up to RETRY_COUNT
+    times with exponential backoff. An expired session is renewed and
+    the request is repeated without a pause. A gateway
+    error (502, 503, 504) is repeated only for requests that read, see
+    is_read: a write could already be executed by the server. A read
+    timeout is not repeated for the same reason.
+
+    Args:
+        URL (str): server address
+        data (dict): request parameters
+        headers (dict, optional): additional headers
+
+    Returns:
+        requests.Response: server response
+    """
+    limiter = get_limiter(URL)
+    data = dict(data)
+    for attempt in range(RETRY_COUNT + 1):
+        if data.get("sid") in _renewed_sids:
+            data["sid"] = current_sid(data["sid"])
+        limiter.acquire()
+        try:
+            response = get_session(URL).post(
+                URL,
+                data=data,
+                headers=headers,
+                timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+            )
+        except requests.ConnectionError as e:
+            if attempt == RETRY_COUNT:
+                raise
+            logger.warning(f"нет соединения с {URL}: {e}, повтор")
+            _backoff(attempt)
+            continue
+        code = _error_code(response)
+        if response.status_code in THROTTLE_STATUS or code in THROTTLE_ERRORS:
+            limiter.throttled()
+        elif response.status_code in GATEWAY_STATUS:
+            limiter.throttled()
+            if not is_read(data):
+                logger.error(
+                    f"запрос {data.get('svc')} не повторяется, "
+                    f"ответ {response.status_code}"
+                )
+                return response
+        elif code in SESSION_ERRORS and data.get("sid"):
+            if renew_sid(URL, data["sid"]) is None:
+                return response
+            # the new session is used at once, there is nothing to wait for
+            continue
+        else:
+            limiter.success()
+            return response
+        if attempt == RETRY_COUNT:
+            logger.error(f"запрос {data.get('svc')} не выполнен: {response.text}")
+            return response
+        _backoff(attempt)
+    return response
+
+
+def connection_stats(URL: str | None = None) -> dict:
+    """Count opened and reused connections.
+
+    urllib3 counts new connections and requests sent for every pool,
+    the difference between them is the number of requests that went
+    through an already opened connection.
+
+    Args:
+        URL (str, optional): server address, all servers if not set
+
+    Returns:
+        dict: {URL: {"requests": int, "opened": int, "reused": int}}
+    """
+    stats = {}
+    for address, session in list(_sessions.items()):
+        if URL is not None and address != URL:
+            continue
+        sent = 0
+        opened = 0
+        for adapter in set(session.adapters.values()):
+            for pool in adapter.poolmanager.pools._container.values():
+                sent += pool.num_requests
+                opened += pool.num_connections
+        stats[address] = {
+            "requests": sent,
+            "opened": opened,
+            "reused": sent - opened,
+        }
+    return stats
@@ -1,5 +1,6 @@
 """There are objects with unchanged values here"""
 
+import json
 import os
 
 from dotenv import load_dotenv
@@ -118,6 +119,15 @@ FMS = [
     (4, "FMS 4"),
 ]
 
+# modes of the import jobs, plan only reads wialon and reports the changes
+MODES = [
+    ("apply", "Загрузить все поля"),
+    ("reconcile", "Загрузить только изменения"),
+    ("plan", "Показать план изменений без загрузки"),
+]
+# modes of the routes other than /export
+UPDATE_MODES = [mode for mode in MODES if mode[0] != "reconcile"]
+
 USER_ID = {
     1: os.getenv("UID_1"),
     2: os.getenv("UID_2"),
@@ -166,3 +176,75 @@ GROUPS = {
 }
 
 CUSTOM_FIELDS = ("Vin", "Марка", "Модель")
+ADMIN_FIELDS = (
+    "geozone_imei",
+    "geozone_sim",
+    "Инфо1",
+    "Инфо2",
+    "Инфо3",
+    "Инфо4",
+    "Пин",
+)
+FIELD_IDS = {
+    "geozone_imei": 1,
+    "geozone_sim": 2,
+    "Инфо1": 3,
+    "Инфо2": 4,
+    "Инфо3": 5,
+    "Инфо4": 6,
+    "Пин": 7,
+    "Vin": 1,
+    "Марка": 2,
+    "Модель": 3,
+}
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+HTTP_KEEP_ALIVE = os.getenv("HTTP_KEEP_ALIVE", "1") == "1"
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 120))
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 5000))
+# deleted objects and changed imei are seen only by a full sync
+UNIT_INDEX_FULL_SYNC = int(os.getenv("UNIT_INDEX_FULL_SYNC", 60 * 60))
+FIELD_CACHE_SIZE = int(os.getenv("FIELD_CACHE_SIZE", 50000))
+FIELD_CACHE_TTL = int(os.getenv("FIELD_CACHE_TTL", 24 * 60 * 60))
+GROUP_CATALOG_TTL = int(os.getenv("GROUP_CATALOG_TTL", 5 * 60))
+
+WORKERS = {
+    1: int(os.getenv("WORKERS", 4)),
+    2: int(os.getenv("WORKERS2", 4)),
+    3: int(os.getenv("WORKERS3", 4)),
+    4: int(os.getenv("WORKERS4", 4)),
+}
+CREATE_WORKERS = {
+    1: int(os.getenv("CREATE_WORKERS", 8)),
+    2: int(os.getenv("CREATE_WORKERS2", 8)),
+    3: int(os.getenv("CREATE_WORKERS3", 8)),
+    4: int(os.getenv("CREATE_WORKERS4", 8)),
+}
+
+ASYNC_LIMIT = int(os.getenv("ASYNC_LIMIT", 50))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 100))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500))
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", 2))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL = float(os.getenv("JOB_POLL", 5))
+# a running job is marked every JOB_HEARTBEAT seconds, a job without
+# marks for JOB_STALE seconds is taken as lost and queued again
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", 30))
+JOB_STALE = float(os.getenv("JOB_STALE", 5 * 60))
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", 24 * 60 * 60))
+
+RATE_LIMIT = float(os.getenv("RATE_LIMIT", 20))
+RATE_LIMIT_MIN = float(os.getenv("RATE_LIMIT_MIN", 1))
+RATE_LIMIT_MAX = float(os.getenv("RATE_LIMIT_MAX", 100))
+RETRY_COUNT = int(os.getenv("RETRY_COUNT", 5))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", 0.5))
+SESSION_KEEPALIVE = int(os.getenv("SESSION_KEEPALIVE", 120))
+
+# units on the server used as templates instead of data_tmp,
+# {fms: {hardware id: [unit id for every template of HW_TMP]}}
+TEMPLATE_UNITS = {
+    int(fms): {int(hardware_id): units for hardware_id, units in hardware.items()}
+    for fms, hardware in json.loads(os.getenv("TEMPLATE_UNITS", "{}")).items()
+}
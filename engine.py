@@ -2,12 +2,56 @@
 
 import json
 import random
-
-import requests
-
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Iterable
+
+from async_engine import run_batches
+from batch import BatchCoalescer
+from client import post
 from config import fstart_stop, logger
-from constant import CUSTOM_FIELDS, GROUPS
-from hardware import create_object_with_all_params
+from constant import (
+    ADMIN_FIELDS,
+    CUSTOM_FIELDS,
+    FIELD_IDS,
+    FIELD_CACHE_SIZE,
+    FIELD_CACHE_TTL,
+    GROUPS,
+    SEARCH_PAGE_SIZE,
+)
+from group_catalog import (
+    GROUP_KINDS,
+    find_groups,
+    load_catalog,
+    locked_groups,
+    read_members,
+    set_members,
+)
+from hardware import create_object as create_unit
+from hardware import (
+    clone_object,
+    clone_requests,
+    get_hardware_id,
+    hardware_name,
+    send_plan,
+    setup_requests,
+)
+from hw_templates import template_unit
+
+# fields of a row used by group_update
+GROUP_KEYS = ("uid", "ТИП", "РИСК", "ШАБЛОН КОНФИГУРАЦИИ", "ЛИЗИНГ")
+
+# columns of the Каркаде file -> admin fields filled by fill_info
+INFO_FIELDS = {"РДДБ": "Инфо1", "Специалист": "Инфо5", "ИНН": "Инфо6", "КПП": "Инфо7"}
+
+# flags of core/search_item for the object card: 0x1 name, 0x8 custom
+# fields, 0x80 admin fields, 0x100 phone, 0x2000 counters
+CARD_FLAGS = 0x1 | 0x8 | 0x80 | 0x100 | 0x2000
+
+# (server address, object id) -> (time of loading, fields of the object)
+_field_cache: OrderedDict[tuple[str, int], tuple[float, dict]] = OrderedDict()
+_field_cache_lock = threading.Lock()
 
 
 @fstart_stop
@@ -45,7 +89,7 @@ def check_server_access(URL: str, TOKEN: str):
         int: status code
     """
     param = {"svc": "token/login", "params": json.dumps({"token": TOKEN})}
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     return response
 
 
@@ -66,7 +110,7 @@ def get_ssid(URL: str, TOKEN: str) -> str:
         str: eid - session id on vialon
     """
     param = {"svc": "token/login", "params": json.dumps({"token": TOKEN})}
-    response = requests.post(URL, data=param, headers=get_header())
+    response = post(URL, data=param, headers=get_header())
     logger.debug("получение id сессии")
     logger.debug(f"URL: {response.url}")
     logger.debug(f'результат id сессии: {response.json().get("eid")}')
@@ -104,7 +148,7 @@ def get_object_info_by_imei(ssid: str, imei: str, URL: str) -> dict:
         ),
         "sid": ssid,
     }
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     logger.debug(f'получение данных об объекте по имей: "{imei}"')
     logger.debug(f"URL: {response.url}")
     logger.debug(f"параметры URL: {param}")
@@ -144,7 +188,7 @@ def get_object_info_by_name(ssid: str, object_name: str, URL: str) -> dict:
         "sid": ssid,
     }
 
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     logger.debug(f'получение данных об объекте по его имени: "{object_name}"')
     logger.debug(f"URL: {response.url}")
     logger.debug(f"параметры URL: {param}")
@@ -179,6 +223,176 @@ def get_object_id(ssid: str, imei: str, URL: str) -> int:
     return -1
 
 
+@fstart_stop
+@logger.catch
+def get_units(
+    ssid: str, URL: str, prop_name: str = "sys_unique_id", mask: str = "*"
+) -> list[dict]:
+    """Get objects with the minimal set of data.
+
+    The function downloads avl_unit page by page with
+    base and advanced properties flags (id, name, imei).
+
+    Args:
+        ssid (str): session id
+        URL (str): server address
+        prop_name (str): property to search by
+        mask (str): property value mask
+
+    Returns:
+        list[dict] | None: [{"id": <long>, "nm": <text>, "uid": <text>, ...}],
+        None if the server returned an error
+    """
+    units = []
+    start = 0
+    while True:
+        param = {
+            "svc": "core/search_items",
+            "params": json.dumps(
+                {
+                    "spec": {
+                        "itemsType": "avl_unit",
+                        "propName": prop_name,
+                        "propValueMask": mask,
+                        "sortType": "sys_id",
+                    },
+                    "force": 1,
+                    "flags": 257,
+                    "from": start,
+                    "to": start + SEARCH_PAGE_SIZE - 1,
+                }
+            ),
+            "sid": ssid,
+        }
+        response = post(URL, data=param).json()
+        if "error" in response:
+            logger.error(f"объекты не загружены, ошибка {response.get('error')}")
+            return None
+        items = response.get("items") or []
+        units.extend(items)
+        logger.debug(f"загружено объектов: {len(units)}")
+        start += SEARCH_PAGE_SIZE
+        if len(items) < SEARCH_PAGE_SIZE or start >= response.get(
+            "totalItemsCount", 0
+        ):
+            break
+    return units
+
+
+@fstart_stop
+@logger.catch
+def get_imei_map(ssid: str, URL: str) -> dict[str, int]:
+    """Get id of all objects by imei.
+
+    The function downloads every avl_unit with the minimal set of flags
+    and builds a dictionary to find the object id by imei
+    without a request to the server for each row.
+
+    Args:
+        ssid (str): session id
+        URL (str): server address
+
+    Returns:
+        dict | None: {imei: object id}, None if the objects were not loaded
+    """
+    units = get_units(ssid, URL)
+    if units is None:
+        return None
+    imei_map = {
+        normalize_imei(unit.get("uid")): unit.get("id")
+        for unit in units
+        if unit.get("uid")
+    }
+    logger.debug(f"в словаре imei - id объектов: {len(imei_map)}")
+    return imei_map
+
+
+def normalize_imei(imei: str | int) -> str:
+    """Bring imei of a file row or of wialon to the key of the dictionary.
+
+    Spaces, the ".0" of a number read from a spreadsheet and the leading
+    zeros are removed, so "0123", " 123" and 123.0 are the same imei.
+
+    Args:
+        imei (str | int): unique id your equipment
+
+    Returns:
+        str: normalized imei
+    """
+    imei = str(imei).strip()
+    if imei.endswith(".0"):
+        imei = imei[:-2]
+    return imei.lstrip("0") or imei
+
+
+def get_unit_id(imei_map: dict[str, int], imei: str | int) -> int:
+    """Find object id in the imei dictionary.
+
+    Args:
+        imei_map (dict): dictionary from get_imei_map
+        imei (str | int): unique id your equipment
+
+    Returns:
+        int: unique id avl_unit or -1
+    """
+    return imei_map.get(normalize_imei(imei), -1)
+
+
+def imei_search_request(imei: str) -> dict:
+    """Request to find objects by part of the imei.
+
+    Args:
+        imei (str): unique id your equipment
+
+    Returns:
+        dict: {"svc": "core/search_items", "params": {...}}
+    """
+    return {
+        "svc": "core/search_items",
+        "params": {
+            "spec": {
+                "itemsType": "avl_unit",
+                "propName": "sys_unique_id",
+                "propValueMask": f"*{imei}*",
+                "sortType": "sys_name",
+            },
+            "force": 1,
+            "flags": 1,
+            "from": 0,
+            "to": 0,
+        },
+    }
+
+
+@fstart_stop
+def find_units(sid: str, imeis: Iterable[str], URL: str) -> dict[str, int]:
+    """Find objects missing in the imei dictionary by part of the imei.
+
+    The same search as get_object_id, for all imeis with core/batch.
+    It finds objects whose stored imei has extra characters around
+    the imei of the file.
+
+    Args:
+        sid (str): session id
+        imeis (Iterable[str]): normalized imeis
+        URL (str): server address
+
+    Returns:
+        dict[str, int]: {imei: object id} of the found objects
+    """
+    with BatchCoalescer(sid, URL) as coalescer:
+        for imei in imeis:
+            request = imei_search_request(imei)
+            coalescer.add(imei, request["svc"], request["params"])
+    found = {}
+    for imei, results in coalescer.results.items():
+        items = results[0].get("items") if isinstance(results[0], dict) else None
+        if items:
+            found[imei] = items[0].get("id")
+    logger.debug(f"найдено объектов по части imei: {len(found)}")
+    return found
+
+
 @fstart_stop
 @logger.catch
 def create_custom_fields(ssid: str, unit_id: int, URL: str) -> None:
@@ -194,115 +408,50 @@ def create_custom_fields(ssid: str, unit_id: int, URL: str) -> None:
         URL (str): server address
     """
     logger.debug(f'параметры на входе - ssid: "{ssid}, unit_id: "{unit_id}"')
-    admin_fields = (
-        "geozone_imei",
-        "geozone_sim",
-        "Инфо1",
-        "Инфо2",
-        "Инфо3",
-        "Инфо4",
-        "Пин",
+    logger.debug(f"шаблон админ поля: {ADMIN_FIELDS}")
+    logger.debug(f"шаблон произвольне поля: {CUSTOM_FIELDS}")
+    logger.debug(f"присвоенные id полям: {FIELD_IDS}")
+    fields = cached_fields(ssid, unit_id, URL)
+    admin_names = {field.get("n") for field in fields.get("aflds").values()}
+    custom_names = {field.get("n") for field in fields.get("flds").values()}
+    create_fields(
+        ssid,
+        unit_id,
+        [field for field in ADMIN_FIELDS if field not in admin_names],
+        [field for field in CUSTOM_FIELDS if field not in custom_names],
+        URL,
+        FIELD_IDS,
     )
-    item_fields = CUSTOM_FIELDS
-    id_field = {
-        "geozone_imei": 1,
-        "geozone_sim": 2,
-        "Инфо1": 3,
-        "Инфо2": 4,
-        "Инфо3": 5,
-        "Инфо4": 6,
-        "Пин": 7,
-        "Vin": 1,
-        "Марка": 2,
-        "Модель": 3,
-    }
-    logger.debug(f"шаблон админ поля: {admin_fields}")
-    logger.debug(f"шаблон произвольне поля: {item_fields}")
-    logger.debug(f"присвоенные id полям: {id_field}")
-    for field in admin_fields:
-        param = {
-            "svc": "core/search_item",
-            "params": json.dumps({"id": unit_id, "flags": 128}),
-            "sid": ssid,
-        }
-        response = requests.post(URL, data=param)
-        logger.debug(
-            f"получение админ полей: {response.url}, параметры: {param}"
-        )
-        logger.debug(f"результат: {response.json()}")
-        if field not in response.text:
-            create_field = {
-                "svc": "item/update_admin_field",
-                "params": json.dumps(
-                    {
-                        "itemId": unit_id,
-                        "id": id_field.get(field),
-                        "callMode": "create",
-                        "n": "{0}".format(field),
-                        "v": "",
-                    }
-                ),
-                "sid": ssid,
-            }
-            requests.post(URL, data=create_field)
-            logger.debug(
-                f'поле {field} не существует у объкта c id {unit_id}, создать поле, запрос: "requests.post(URL, data=create_field)", параметры: {create_field}'
-            )
-        else:
-            logger.debug(f"поле {field} существует")
-            continue
-
-    for field in item_fields:
-        param = {
-            "svc": "core/search_item",
-            "params": json.dumps({"id": unit_id, "flags": 8}),
-            "sid": ssid,
-        }
-        response = requests.post(URL, data=param)
-        logger.debug(
-            f"получение произвольных полей: {response.url}, параметры: {param}"
-        )
-        logger.debug(f"результат: {response.json()}")
-        if field not in response.text:
-            create_field = {
-                "svc": "item/update_custom_field",
-                "params": json.dumps(
-                    {
-                        "itemId": unit_id,
-                        "id": id_field.get(field),
-                        "callMode": "create",
-                        "n": "{0}".format(field),
-                        "v": "",
-                    }
-                ),
-                "sid": ssid,
-            }
-            requests.post(URL, data=create_field)
-            logger.debug(
-                f'поле {field} не существует у объкта c id {unit_id}, создать поле, запрос: "requests.post(URL, data=create_field)", параметры: {create_field}'
-            )
-        else:
-            logger.debug(f"поле {field} существует")
-            continue
 
 
 @fstart_stop
 @logger.catch
 def update_param(
-    session_id: str, unit_id: int, new_value: dict, id_field: dict, URL: str
-) -> None:
+    session_id: str,
+    unit_id: int,
+    new_value: dict,
+    id_field: dict,
+    URL: str,
+    card: dict | None = None,
+) -> dict:
     """Fill object fields with new parameters.
 
     The function accepts a session ID, an object ID,
     and a dictionary with data to fill in the required fields of the object.
-    The data is passed using the requests object's post method,
-    the function returns nothing.
+    The data is passed using the requests object's post method.
+    If the current card of the object is given, only requests that
+    change it are sent, see card_diff.
 
     Args:
         session_id (str): session id
         unit_id (int): gurtam object id
         new_value (dict): dictionary with new params
         URL (str): server adderss
+        card (dict | None): current card of the object, see get_cards
+
+    Returns:
+        dict: {"sent": number of sent requests, "errors": [error codes
+        of the requests]}, the cache is updated only if there are no errors
     """
     logger.debug("входящие параметры:")
     logger.debug(f'id сессии: "{session_id}"')
@@ -310,10 +459,40 @@ def update_param(
     logger.debug(f'json с данными для заполнения: "{new_value}"')
     logger.debug(f'id поля Инфо4: "{id_field}"')
     logger.debug(f'адрес сервера: "{URL}"')
+    requests_list = card_requests(unit_id, new_value, id_field)
+    if card is not None:
+        requests_list = card_diff(requests_list, card)
+        if not requests_list:
+            logger.debug(f"карточка объекта {unit_id} не изменилась")
+            return {"sent": 0, "errors": []}
+    logger.debug(
+        f"передача параметров для обновления полей карточки объект: {requests_list}"
+    )
+    with BatchCoalescer(session_id, URL) as coalescer:
+        for request in requests_list:
+            coalescer.add(unit_id, request.get("svc"), request.get("params"))
+    errors = coalescer.errors.get(unit_id, [])
+    if errors:
+        logger.error(f"карточка объекта {unit_id} обновлена с ошибками: {errors}")
+    else:
+        remember_card(URL, unit_id, requests_list)
+    return {"sent": len(requests_list), "errors": errors}
+
+
+def card_requests(unit_id: int, new_value: dict, id_field: dict) -> list[dict]:
+    """Requests to fill the object card with the data of the row.
+
+    Args:
+        unit_id (int): gurtam object id
+        new_value (dict): dictionary with new params
+        id_field (dict): {field name: field id}
+
+    Returns:
+        list[dict]: [{"svc": <text>, "params": {...}}]
+    """
     contract_name = {
         "svc": "item/update_name",
         "params": {"itemId": unit_id, "name": new_value.get("ДЛ").strip()},
-        "sid": session_id,
     }
 
     phone = {
@@ -322,7 +501,6 @@ def update_param(
             "itemId": unit_id,
             "phoneNumber": new_value.get("geozone_sim")
             },
-        "sid": session_id,
     }
 
     imei = {
@@ -334,7 +512,6 @@ def update_param(
             "n": "geozone_imei",
             "v": new_value.get("geozone_imei"),
         },
-        "sid": session_id,
     }
 
     sim = {
@@ -346,7 +523,6 @@ def update_param(
             "n": "geozone_sim",
             "v": new_value.get("geozone_sim"),
         },
-        "sid": session_id,
     }
 
     vin = {
@@ -358,7 +534,6 @@ def update_param(
             "n": "Vin",
             "v": new_value.get("Vin"),
         },
-        "sid": session_id,
     }
 
     info4 = {
@@ -371,7 +546,6 @@ def update_param(
             "v": new_value.get(
                 "Инфо4") if new_value.get("Инфо4") is not None else "",
         },
-        "sid": session_id,
     }
 
     brand = {
@@ -383,7 +557,6 @@ def update_param(
             "n": "Марка",
             "v": new_value.get("Марка"),
         },
-        "sid": session_id,
     }
 
     model = {
@@ -395,7 +568,6 @@ def update_param(
             "n": "Модель",
             "v": new_value.get("Модель"),
         },
-        "sid": session_id,
     }
 
     pin = {
@@ -407,47 +579,97 @@ def update_param(
             "n": "Пин",
             "v": new_value.get("Пин"),
         },
-        "sid": session_id,
     }
 
     distance = {
         "svc": "unit/update_mileage_counter",
         "params": {"itemId": unit_id, "newValue": 0},
-        "sid": session_id,
     }
 
     engin_hours = {
         "svc": "unit/update_eh_counter",
         "params": {"itemId": unit_id, "newValue": 0},
-        "sid": session_id,
     }
 
-    param = {
-        "svc": "core/batch",
-        "params": json.dumps(
+    return [
+        contract_name,
+        phone,
+        imei,
+        sim,
+        vin,
+        info4,
+        brand,
+        model,
+        pin,
+        distance,
+        engin_hours,
+    ]
+
+
+def _card_value(value) -> str:
+    """Value of the card as it is stored on wialon."""
+    return "" if value is None else str(value)
+
+
+def card_diff(requests_list: list[dict], card: dict) -> list[dict]:
+    """Requests of card_requests that change the card of the object.
+
+    Args:
+        requests_list (list[dict]): requests of card_requests
+        card (dict): current card of the object, see get_cards
+
+    Returns:
+        list[dict]: requests whose value differs from the card
+    """
+    changed = []
+    for request in requests_list:
+        svc, params = request["svc"], request["params"]
+        if svc == "item/update_name":
+            current, new = card.get("nm"), params["name"]
+        elif svc == "unit/update_phone":
+            current = _card_value(card.get("ph")).lstrip("+")
+            new = _card_value(params["phoneNumber"]).lstrip("+")
+        elif svc == "unit/update_mileage_counter":
+            current, new = card.get("cnm"), params["newValue"]
+        elif svc == "unit/update_eh_counter":
+            current, new = card.get("cneh"), params["newValue"]
+        elif svc in ("item/update_admin_field", "item/update_custom_field"):
+            kind = "aflds" if svc == "item/update_admin_field" else "flds"
+            field = card.get(kind, {}).get(str(params["id"]))
+            if field is None:
+                changed.append(request)
+                continue
+            current, new = field.get("v"), _card_value(params["v"])
+        else:
+            changed.append(request)
+            continue
+        if current != new:
+            changed.append(request)
+    return changed
+
+
+def remember_card(URL: str, unit_id: int, requests_list: list[dict]) -> None:
+    """Write values of the filled fields into the cache.
+
+    Args:
+        URL (str): server address
+        unit_id (int): unit/object id
+        requests_list (list[dict]): requests of card_requests
+    """
+    for field in requests_list:
+        if field["svc"] not in ("item/update_admin_field", "item/update_custom_field"):
+            continue
+        _remember_fields(
+            URL,
+            unit_id,
+            "aflds" if field["svc"] == "item/update_admin_field" else "flds",
             {
-                "params": [
-                    contract_name,
-                    phone,
-                    imei,
-                    sim,
-                    vin,
-                    info4,
-                    brand,
-                    model,
-                    pin,
-                    distance,
-                    engin_hours,
-                ],
-                "flags": 0,
-            }
-        ),
-        "sid": session_id,
-    }
-    logger.debug(
-        f"передача параметров для обновления полей карточки объект в одном запросе: {param}"
-    )
-    requests.post(URL, data=param)
+                field["params"]["n"]: (
+                    field["params"]["id"],
+                    field["params"]["v"],
+                )
+            },
+        )
 
 
 @fstart_stop
@@ -487,7 +709,7 @@ def search_groups_by_name(ssid: str, group_name: str, URL: str) -> dict:
         ),
         "sid": ssid,
     }
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     logger.debug(f"URL: {response.url}")
     logger.debug(f"параметры запроса: {param}")
     logger.debug(f"результат выполнения запроса: {response.json()}")
@@ -519,7 +741,7 @@ def search_group_by_id(ssid: str, group_id: int, URL: str) -> dict:
         "sid": ssid,
     }
 
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     logger.debug(f"URL: {response.url}")
     logger.debug(f"параметры запроса: {param}")
     logger.debug(f"результат выполнения запроса: {response.json()}")
@@ -552,28 +774,64 @@ def add_groups(
     logger.debug(f"список текущих id объектов в группе: {leasing_unit_list}")
     logger.debug(f"список добавляемых id объектов в группу: {added_unit}")
     logger.debug(f"адрес сервера: {URL}")
+    request = group_units_request(leasing_id, leasing_unit_list, added_unit)
+    if request is None:
+        logger.debug(f"состав группы {leasing_id} не изменился")
+        return {"u": list(leasing_unit_list)}
     param = {
-        "svc": "unit_group/update_units",
-        "params": json.dumps(
-            {"itemId": leasing_id, "units": leasing_unit_list + added_unit}
-        ),
+        "svc": request.get("svc"),
+        "params": json.dumps(request.get("params")),
         "sid": ssid,
     }
     logger.debug(f"параметры запроса: {param}")
-    result = requests.post(URL, data=param)
+    result = post(URL, data=param)
     return result.json()
 
 
+def group_units_request(
+    group_id: int, current: list[int], added: Iterable[int]
+) -> dict | None:
+    """Request to add objects to a group.
+
+    unit_group/update_units replaces the whole list of the group,
+    so the current objects are sent together with the new ones.
+    Objects already in the group and ids of not created objects
+    are skipped.
+
+    Args:
+        group_id (int): group id
+        current (list[int]): current id group objects
+        added (Iterable[int]): id objects to add
+
+    Returns:
+        dict | None: {"svc": "unit_group/update_units", "params": {...}},
+        None if the group does not change
+    """
+    units = list(dict.fromkeys(current))
+    present = set(units)
+    new_units = [
+        unit_id
+        for unit_id in dict.fromkeys(added)
+        if unit_id not in present and unit_id not in (None, -1)
+    ]
+    if not new_units:
+        return None
+    return {
+        "svc": "unit_group/update_units",
+        "params": {"itemId": group_id, "units": units + new_units},
+    }
+
+
 @fstart_stop
 @logger.catch
 def create_object(sid: str, unit: dict, URL: str, fms: int) -> int:
     """Check the presence of an object on the vialon.
 
     Checking dictionary objects by IMEI for presence on the Vialon portal
-    If the object is missing, the object is written to the log file and the
-    object is created on the portal.
-    An object is created based on the type of its equipment.
-    To create a separate function is used.
+    If the object is missing, the object is created on the portal.
+    An object is created based on the type of its equipment
+    and the object card is filled with the data of the row,
+    see provision_object.
 
     Args:
         unit (dict): dictionary of objects
@@ -582,27 +840,229 @@ def create_object(sid: str, unit: dict, URL: str, fms: int) -> int:
         fms (int): server number
 
     Returns:
-        obj_id: integer object id
+        obj_id: integer object id, -1 if the object is not created
     """
     logger.debug(f"id сесиии: {sid}")
     logger.debug(f"json с данными создаваемого объекта: {unit}")
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"номер сервера: {fms}")
-    obj_id = create_object_with_all_params(sid, URL, unit, fms)
-    create_custom_fields(sid, obj_id, URL)
-    with open(f'logging/{unit.get("ЛИЗИНГ")}', "a") as log:
-        data_log = """Пин {0} - Имей {1}\n"""
-        logger.debug(f"объект создан: {data_log}")
-        log.write(data_log.format(unit.get("Пин"), unit.get("geozone_imei")))
+    result = provision_object(sid, unit, URL, fms) or {}
+    obj_id = result.get("uid", -1)
     logger.debug(f"результат id созданного объекта: {obj_id}")
     return obj_id
 
 
+@fstart_stop
+@logger.catch
+def provision_object(sid: str, unit: dict, URL: str, fms: int) -> dict:
+    """Create an object and fill it in three requests.
+
+    After core/create_unit the first core/batch sets up the object
+    by the template (sensors, device type, phone, counters, report
+    settings, message filter, driving quality) and creates the fields.
+    The second core/batch fills the object card using the ids of the
+    created fields. The fields of the new object are put into the cache.
+    If TEMPLATE_UNITS has a template unit for the hardware and the
+    template, the object is copied from it with core/duplicate instead:
+    sensors, report settings, message filter and driving quality come
+    with the copy, only the device type, imei, phone and counters are
+    sent, the fields of the copy are reused and the card is filled as
+    for a new object. If the server does not copy the unit, the object
+    is created the usual way.
+    The created object is added to the index of the server at once, an
+    error after the creation is written to "errors" and the id of the
+    object is returned anyway, so the object is not created twice.
+
+    Args:
+        sid (str): session id
+        unit (dict): row of the uploaded file
+        URL (str): server address
+        fms (int): server number
+
+    Returns:
+        dict: {
+            "uid": object id, -1 if the object is not created,
+            "steps": {step name: [results of the requests]},
+            "errors": {step name: [error codes]},
+            "requests": number of requests sent,
+        }
+    """
+    result = {"uid": -1, "steps": {}, "errors": {}, "requests": 0}
+    hard_id = get_hardware_id(unit, fms)
+    if hard_id == -1:
+        result["errors"]["hardware"] = [-1]
+        return result
+    template_id = template_unit(
+        fms, hard_id, unit.get("ШАБЛОН КОНФИГУРАЦИИ") or "", hardware_name(unit)
+    )
+    new_object = {}
+    if template_id is not None:
+        new_object = clone_object(sid, URL, template_id, unit.get("ДЛ"), fms) or {}
+        result["requests"] += 1
+        if "item" not in new_object:
+            logger.error(f"шаблонный объект {template_id} не скопирован: {new_object}")
+    cloned = "item" in new_object
+    if not cloned:
+        new_object = create_unit(sid, URL, hard_id, unit.get("ДЛ"), fms) or {}
+        result["requests"] += 1
+    obj_id = new_object.get("item", {}).get("id")
+    if obj_id is None:
+        logger.error(f'объект {unit.get("geozone_imei")} не создан: {new_object}')
+        result["errors"]["create_unit"] = [new_object.get("error", -1)]
+        return result
+    result["uid"] = obj_id
+    # unit_index imports engine, the index is imported at the call
+    from unit_index import remember_unit
+
+    remember_unit(fms, obj_id, unit.get("geozone_imei"), unit.get("ДЛ"))
+    try:
+        if cloned:
+            _setup_clone(sid, unit, URL, hard_id, result)
+        else:
+            _setup_object(sid, unit, URL, fms, hard_id, result)
+    except Exception as e:
+        logger.exception(f"объект {obj_id} создан, ошибка настройки: {e!r}")
+        result["errors"]["setup"] = [-1]
+    logger.info(
+        f"объект {obj_id} создан, запросов: {result['requests']}, "
+        f"ошибки: {result['errors']}"
+    )
+    return result
+
+
+def _setup_object(
+    sid: str, unit: dict, URL: str, fms: int, hard_id: int, result: dict
+) -> None:
+    """Set up and fill the created object, see provision_object."""
+    obj_id = result["uid"]
+    plan = setup_requests(sid, URL, obj_id, hard_id, unit, fms)
+    plan += [
+        ("fields", request)
+        for request in field_requests(obj_id, ADMIN_FIELDS, CUSTOM_FIELDS, FIELD_IDS)
+    ]
+    setup = send_plan(sid, URL, plan)
+    field_ids = {}
+    for name, created in zip(ADMIN_FIELDS + CUSTOM_FIELDS, setup.results["fields"]):
+        if isinstance(created, list):
+            field_ids[name] = created[1].get("id")
+    _store_fields(
+        URL,
+        obj_id,
+        {
+            kind: {
+                str(field_id): {"id": field_id, "n": name, "v": ""}
+                for name, field_id in field_ids.items()
+                if (name in CUSTOM_FIELDS) == (kind == "flds")
+            }
+            for kind in ("aflds", "flds")
+        },
+    )
+
+    _fill_card(sid, unit, URL, field_ids, setup, result)
+
+
+def _setup_clone(sid: str, unit: dict, URL: str, hard_id: int, result: dict) -> None:
+    """Patch and fill the copy of the template unit, see provision_object."""
+    obj_id = result["uid"]
+    setup = send_plan(sid, URL, clone_requests(obj_id, hard_id, unit))
+    # the copy has the fields of the template unit, missing ones are created
+    field_ids = id_fields(sid, obj_id, URL) or {}
+    result["requests"] += 1
+    _fill_card(sid, unit, URL, field_ids, setup, result)
+
+
+def _fill_card(
+    sid: str,
+    unit: dict,
+    URL: str,
+    field_ids: dict,
+    setup: BatchCoalescer,
+    result: dict,
+) -> None:
+    """Fill the card of the new object and collect the results."""
+    obj_id = result["uid"]
+    card = [
+        request
+        for request in card_requests(obj_id, unit, field_ids)
+        if request["params"].get("id", 0) is not None
+    ]
+    filling = send_plan(sid, URL, [("card", request) for request in card])
+    remember_card(URL, obj_id, card)
+
+    for coalescer in (setup, filling):
+        result["steps"].update(coalescer.results)
+        result["errors"].update(coalescer.errors)
+        result["requests"] += coalescer.requests_sent
+
+
 @fstart_stop
 @logger.catch
 def group_update(sid: str, data: dict, URL: str, fms: int) -> None:
     """Update list of objects in groups.
 
+    The objects of the groups to change are read from the server right
+    before the update, under the locks of the groups, and the new objects
+    are added to them. The requests are sent with one core/batch and the
+    catalog is updated from the response.
+
+    Args:
+        data (dict): dictionary with data on objects
+        URL (str): server address
+        sid (str): session id
+        fms (int): server number
+    """
+    added = group_additions(sid, data, URL, fms)
+    with locked_groups(fms, added):
+        members = read_members(sid, URL, fms, list(added))
+        with BatchCoalescer(sid, URL) as coalescer:
+            for id_group, units in added.items():
+                if id_group not in members:
+                    logger.error(f"группа {id_group} не обновлена: состав не получен")
+                    continue
+                request = group_units_request(id_group, members[id_group], units)
+                if request is not None:
+                    coalescer.add(id_group, request.get("svc"), request.get("params"))
+        for id_group, results in coalescer.results.items():
+            if isinstance(results[0], dict) and "u" in results[0]:
+                set_members(fms, id_group, results[0]["u"])
+    logger.info(f"изменён состав групп: {len(coalescer.results)} из {len(added)}")
+    for id_group, errors in coalescer.errors.items():
+        logger.error(f"группа {id_group} не обновлена: {errors}")
+    logger.debug("Объекты добавлены")
+
+
+@fstart_stop
+def group_requests(sid: str, data: dict, URL: str, fms: int) -> dict[int, dict]:
+    """Requests to update the lists of objects in groups by the catalog.
+
+    The requests are built from the objects of the groups in the catalog,
+    which may be out of date, so they are not sent: group_update reads
+    the groups again. Used to plan the changes, see plan.py.
+
+    Args:
+        data (dict): dictionary with data on objects
+        URL (str): server address
+        sid (str): session id
+        fms (int): server number
+
+    Returns:
+        dict[int, dict]: {group id: request of group_units_request}
+    """
+    catalog = load_catalog(sid, URL, fms)
+    requests_list = {}
+    for id_group, units in group_additions(sid, data, URL, fms).items():
+        current = sorted(catalog[id_group]["u"])
+        request = group_units_request(id_group, current, units)
+        if request is not None:
+            requests_list[id_group] = request
+    logger.info(f"меняется состав групп: {len(requests_list)}")
+    return requests_list
+
+
+@fstart_stop
+def group_additions(sid: str, data: dict, URL: str, fms: int) -> dict[int, set]:
+    """Objects to add to the groups.
+
     The function loops through the list of objects and sorts them into lists
     to add to a specific group.
     There are several specific groups: cars, trucks, special equipment, risky.
@@ -611,75 +1071,77 @@ def group_update(sid: str, data: dict, URL: str, fms: int) -> None:
     keyword and adds objects from the list with all objects.
     If there is a group, which is a special group, then objects from a special
     list are added to it.
+    Groups are taken from the catalog of the server, see group_catalog.
 
     Args:
         data (dict): dictionary with data on objects
         URL (str): server address
         sid (str): session id
         fms (int): server number
+
+    Returns:
+        dict[int, set]: {group id: object ids to add}
     """
     logger.debug(f"аргумент на входе json: {data}")
     logger.debug(f"id сессии: {sid}")
     logger.debug(f"адрес сервера: {URL}")
-    truck = []
-    auto = []
-    special = []
-    all_unit = []
-    risk_auto = []
-    block_with_photo = []
+    truck = set()
+    auto = set()
+    special = set()
+    all_unit = set()
+    risk_auto = set()
+    block_with_photo = set()
 
     logger.debug("распределение объектов в списки по группам")
     for unit in data:
-        tmp = unit.get("ШАБЛОН КОНФИГУРАЦИИ")
-        all_unit.append(unit.get("uid"))
+        tmp = unit.get("ШАБЛОН КОНФИГУРАЦИИ") or ""
+        all_unit.add(unit.get("uid"))
         if unit.get("ТИП") == str(0):
-            auto.append(unit.get("uid"))
+            auto.add(unit.get("uid"))
         elif unit.get("ТИП") == str(1):
-            truck.append(unit.get("uid"))
+            truck.add(unit.get("uid"))
         elif unit.get("ТИП") == str(2):
-            special.append(unit.get("uid"))
+            special.add(unit.get("uid"))
         if unit.get("РИСК") == str(9):
-            risk_auto.append(unit.get("uid"))
+            risk_auto.add(unit.get("uid"))
         if "фото" in tmp or "Фото" in tmp or "ФОТО" in tmp:
-            block_with_photo.append(unit.get("uid"))
+            block_with_photo.add(unit.get("uid"))
 
     logger.debug(f"колличество грузовых: {len(truck)}")
     logger.debug(f"колличество легковых: {len(auto)}")
     logger.debug(f"колличество спецтехники: {len(special)}")
     logger.debug(f"колличество рисковых: {len(risk_auto)}")
 
-    finded_group = search_groups_by_name(
-        sid, data[0].get("ЛИЗИНГ"), URL).get("items")
-    finded_group_photo = search_groups_by_name(
-        sid, data[0].get("ЛИЗИНГ").replace('1', '2'), URL).get("items")
+    kinds = GROUP_KINDS.get(fms)
+    by_kind = {
+        "AUTO": auto,
+        "TRUCK": truck,
+        "SPEC": special,
+        "RISK": risk_auto,
+    }
+    finded_group = find_groups(sid, URL, fms, data[0].get("ЛИЗИНГ"))
+    finded_group_photo = find_groups(
+        sid, URL, fms, data[0].get("ЛИЗИНГ").replace('1', '2'))
 
     logger.debug(f'Ищем группы по маске: {data[0].get("ЛИЗИНГ")}')
+    catalog = load_catalog(sid, URL, fms)
 
+    # group id -> objects to add
+    added = defaultdict(set)
     for group in finded_group:
-        id_group = group.get("id")
-        leasing_unit_list = group.get("u")
-        if id_group in GROUPS.get(fms).get("AUTO"):
-            add_groups(sid, id_group, leasing_unit_list, auto, URL)
-        elif id_group in GROUPS.get(fms).get("TRUCK"):
-            add_groups(sid, id_group, leasing_unit_list, truck, URL)
-        elif id_group in GROUPS.get(fms).get("SPEC"):
-            add_groups(sid, id_group, leasing_unit_list, special, URL)
-        elif id_group in GROUPS.get(fms).get("RISK"):
-            add_groups(sid, id_group, leasing_unit_list, risk_auto, URL)
-        else:
-            add_groups(sid, id_group, leasing_unit_list, all_unit, URL)
+        added[group["id"]] |= by_kind.get(kinds.get(group["id"]), all_unit)
 
     for photo_group in finded_group_photo:
-        id_group = photo_group.get("id")
-        leasing_unit_list = photo_group.get("u")
-        if id_group in GROUPS.get(fms).get("PHOTO"):
-            add_groups(sid, id_group, leasing_unit_list, block_with_photo, URL)
+        if kinds.get(photo_group["id"]) == "PHOTO":
+            added[photo_group["id"]] |= block_with_photo
 
     for id_group in GROUPS.get(fms).get("REQUIRED_GROUPS"):
-        leasing_unit_list = search_group_by_id(
-            sid, id_group, URL).get("item")["u"]
-        add_groups(sid, id_group, leasing_unit_list, all_unit, URL)
-    logger.debug("Объекты добавлены")
+        if id_group not in catalog:
+            logger.error(f"обязательная группа {id_group} не найдена")
+            continue
+        added[id_group] |= all_unit
+
+    return added
 
 
 @fstart_stop
@@ -705,7 +1167,7 @@ def get_custom_fields(ssid: str, unit_id: int, URL: str) -> dict:
     logger.debug(f"id объекта: {unit_id}")
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"параметры запроса: {param}")
-    response = requests.post(URL, data=param).json().get("item").get("flds")
+    response = post(URL, data=param).json().get("item").get("flds")
     logger.debug(f"результат выполнения запроса: {response}")
     return response
 
@@ -748,7 +1210,8 @@ def create_custom_field(
         ),
         "sid": ssid,
     }
-    response = requests.post(URL, data=info)
+    response = post(URL, data=info)
+    invalidate_fields(URL, unit_id)
     logger.debug("параметры на входе:")
     logger.debug(f"id сессии: {ssid}")
     logger.debug(f"адрес сервера: {URL}")
@@ -782,7 +1245,7 @@ def get_admin_fields(ssid: str, unit_id: int, URL: str) -> dict:
         "sid": ssid,
     }
     logger.debug(f"параметры запроса: {param}")
-    response = requests.post(URL, data=param).json().get("item").get("aflds")
+    response = post(URL, data=param).json().get("item").get("aflds")
     logger.debug(f"результат id поля - {response}")
     return response
 
@@ -825,7 +1288,8 @@ def create_admin_field(
         ),
         "sid": ssid,
     }
-    response = requests.post(URL, data=info)
+    response = post(URL, data=info)
+    invalidate_fields(URL, unit_id)
     logger.debug("параметры на входе:")
     logger.debug(f"id сессии: {ssid}")
     logger.debug(f"адрес сервера: {URL}")
@@ -836,6 +1300,295 @@ def create_admin_field(
     return response.json()
 
 
+@fstart_stop
+@logger.catch
+def get_fields(ssid: str, unit_id: int, URL: str) -> dict:
+    """Get admin and custom fields in one request.
+
+    Flags 136 = 128 (admin fields) + 8 (custom fields).
+
+    Args:
+        ssid (str): session id
+        unit_id (int): unit/object id
+        URL (str): server address
+
+    Returns:
+        dict: {"aflds": admin fields, "flds": custom fields}
+    """
+    logger.debug("параметры на входе:")
+    logger.debug(f"id сессии: {ssid}")
+    logger.debug(f"адрес сервера: {URL}")
+    logger.debug(f"id объекта: {unit_id}")
+    param = {
+        "svc": "core/search_item",
+        "params": json.dumps({"id": unit_id, "flags": 136}),
+        "sid": ssid,
+    }
+    logger.debug(f"параметры запроса: {param}")
+    item = post(URL, data=param).json().get("item")
+    response = {
+        "aflds": item.get("aflds") or {},
+        "flds": item.get("flds") or {},
+    }
+    logger.debug(f"результат выполнения запроса: {response}")
+    return response
+
+
+@fstart_stop
+@logger.catch
+def create_fields(
+    ssid: str,
+    unit_id: int,
+    admin_names: list[str],
+    custom_names: list[str],
+    URL: str,
+    field_ids: dict | None = None,
+) -> dict:
+    """Create missing fields in one request.
+
+    All admin and custom fields are created with one core/batch.
+
+    Args:
+        ssid (str): session id
+        unit_id (int): unit/object id
+        admin_names (list[str]): admin field names to create
+        custom_names (list[str]): custom field names to create
+        URL (str): server address
+        field_ids (dict, optional): field ids to request, 0 by default
+
+    Returns:
+        dict: {field name: (field id, field value)}
+    """
+    names = list(admin_names) + list(custom_names)
+    if not names:
+        return {}
+    requests_list = field_requests(unit_id, admin_names, custom_names, field_ids)
+    param = {
+        "svc": "core/batch",
+        "params": json.dumps({"params": requests_list, "flags": 0}),
+        "sid": ssid,
+    }
+    logger.debug(f"создание полей {names} у объекта {unit_id}: {param}")
+    response = post(URL, data=param).json()
+    created = {}
+    for name, result in zip(names, response):
+        if isinstance(result, list):
+            created[name] = result[1].get("id"), result[1].get("v")
+        else:
+            logger.error(f"поле {name} у объекта {unit_id} не создано: {result}")
+    _remember_fields(
+        URL,
+        unit_id,
+        "aflds",
+        {name: value for name, value in created.items() if name in admin_names},
+    )
+    _remember_fields(
+        URL,
+        unit_id,
+        "flds",
+        {name: value for name, value in created.items() if name in custom_names},
+    )
+    logger.debug(f"поля созданы: {created}")
+    return created
+
+
+def field_requests(
+    unit_id: int,
+    admin_names: list[str],
+    custom_names: list[str],
+    field_ids: dict | None = None,
+) -> list[dict]:
+    """Requests to create admin and custom fields.
+
+    Args:
+        unit_id (int): unit/object id
+        admin_names (list[str]): admin field names to create
+        custom_names (list[str]): custom field names to create
+        field_ids (dict, optional): field ids to request, 0 by default
+
+    Returns:
+        list[dict]: admin fields first, then custom fields
+    """
+    field_ids = field_ids or {}
+    return [
+        {
+            "svc": "item/update_admin_field"
+            if number < len(admin_names)
+            else "item/update_custom_field",
+            "params": {
+                "itemId": unit_id,
+                "id": field_ids.get(name, 0),
+                "callMode": "create",
+                "n": name,
+                "v": "",
+            },
+        }
+        for number, name in enumerate(list(admin_names) + list(custom_names))
+    ]
+
+
+def invalidate_fields(URL: str, unit_id: int) -> None:
+    """Remove the fields of the object from the cache.
+
+    Args:
+        URL (str): server address
+        unit_id (int): unit/object id
+    """
+    with _field_cache_lock:
+        _field_cache.pop((URL, unit_id), None)
+
+
+def _remember_fields(URL: str, unit_id: int, kind: str, fields: dict) -> None:
+    """Write fields into the cached object, if the object is cached.
+
+    The cached dict is not changed, a changed copy replaces it: other
+    threads may iterate the fields they got from cached_fields.
+
+    Args:
+        URL (str): server address
+        unit_id (int): unit/object id
+        kind (str): "aflds" - admin fields, "flds" - custom fields
+        fields (dict): {field name: (field id, field value)}
+    """
+    with _field_cache_lock:
+        cached = _field_cache.get((URL, unit_id))
+        if cached is None:
+            return
+        changed = dict(cached[1][kind])
+        for name, (field_id, value) in fields.items():
+            changed[str(field_id)] = {"id": field_id, "n": name, "v": value}
+        _field_cache[(URL, unit_id)] = cached[0], {**cached[1], kind: changed}
+
+
+@fstart_stop
+@logger.catch
+def cached_fields(ssid: str, unit_id: int, URL: str) -> dict:
+    """Get admin and custom fields from the cache.
+
+    If the object is not in the cache or the record is older than
+    FIELD_CACHE_TTL, the fields are requested with get_fields.
+    When the cache is full, the least recently used object is removed.
+
+    Args:
+        ssid (str): session id
+        unit_id (int): unit/object id
+        URL (str): server address
+
+    Returns:
+        dict: {"aflds": admin fields, "flds": custom fields}
+    """
+    key = (URL, unit_id)
+    with _field_cache_lock:
+        cached = _field_cache.get(key)
+        if cached is not None and time.time() - cached[0] < FIELD_CACHE_TTL:
+            _field_cache.move_to_end(key)
+            logger.debug(f"поля объекта {unit_id} взяты из кэша")
+            return cached[1]
+    fields = get_fields(ssid, unit_id, URL)
+    _store_fields(URL, unit_id, fields)
+    return fields
+
+
+def _store_fields(URL: str, unit_id: int, fields: dict) -> None:
+    """Put fields of the object into the cache.
+
+    Args:
+        URL (str): server address
+        unit_id (int): unit/object id
+        fields (dict): {"aflds": admin fields, "flds": custom fields}
+    """
+    key = (URL, unit_id)
+    with _field_cache_lock:
+        _field_cache[key] = time.time(), fields
+        _field_cache.move_to_end(key)
+        while len(_field_cache) > FIELD_CACHE_SIZE:
+            _field_cache.popitem(last=False)
+
+
+@fstart_stop
+@logger.catch
+def preload_fields(ssid: str, unit_ids: list[int], URL: str) -> None:
+    """Load fields of many objects into the cache.
+
+    Objects missing in the cache are requested with core/search_item
+    (flags 136) packed into core/batch of BATCH_SIZE requests.
+
+    Args:
+        ssid (str): session id
+        unit_ids (list[int]): unit/object ids
+        URL (str): server address
+    """
+    now = time.time()
+    with _field_cache_lock:
+        missing = [
+            unit_id
+            for unit_id in dict.fromkeys(unit_ids)
+            if (URL, unit_id) not in _field_cache
+            or now - _field_cache[(URL, unit_id)][0] >= FIELD_CACHE_TTL
+        ]
+    logger.debug(f"загрузка полей {len(missing)} объектов в кэш")
+    with BatchCoalescer(ssid, URL) as coalescer:
+        for unit_id in missing:
+            coalescer.add(
+                unit_id, "core/search_item", {"id": unit_id, "flags": 136}
+            )
+    for unit_id in missing:
+        result = coalescer.results.get(unit_id) or [{}]
+        item = result[0].get("item")
+        if item is not None:
+            _store_fields(
+                URL,
+                unit_id,
+                {"aflds": item.get("aflds") or {}, "flds": item.get("flds") or {}},
+            )
+
+
+@fstart_stop
+@logger.catch
+def get_cards(ssid: str, unit_ids: list[int], URL: str) -> dict[int, dict]:
+    """Read the cards of many objects.
+
+    Cards are requested with core/search_item (CARD_FLAGS) packed into
+    core/batch of BATCH_SIZE requests, all of them are sent at the same
+    time with async_engine.run_batches. Fields of the objects are put
+    into the cache.
+
+    Args:
+        ssid (str): session id
+        unit_ids (list[int]): unit/object ids
+        URL (str): server address
+
+    Returns:
+        dict[int, dict]: {object id: {"nm", "ph", "cnm", "cneh", "aflds",
+        "flds"}}, objects that were not read are missing
+    """
+    unit_ids = list(dict.fromkeys(unit_ids))
+    logger.debug(f"чтение карточек {len(unit_ids)} объектов")
+    results = run_batches(
+        ssid,
+        URL,
+        [
+            {"svc": "core/search_item", "params": {"id": unit_id, "flags": CARD_FLAGS}}
+            for unit_id in unit_ids
+        ],
+    )
+    cards = {}
+    for unit_id, result in zip(unit_ids, results):
+        item = result.get("item") if isinstance(result, dict) else None
+        if item is None:
+            continue
+        fields = {"aflds": item.get("aflds") or {}, "flds": item.get("flds") or {}}
+        _store_fields(URL, unit_id, fields)
+        cards[unit_id] = {
+            "nm": item.get("nm"),
+            "ph": item.get("ph"),
+            "cnm": item.get("cnm"),
+            "cneh": item.get("cneh"),
+            **fields,
+        }
+    return cards
+
+
 @fstart_stop
 @logger.catch
 def check_admin_fields(
@@ -858,7 +1611,7 @@ def check_admin_fields(
     Returns:
         info data: tuple(field id(int), field value(str))
     """
-    response = get_admin_fields(ssid, unit_id, URL)
+    response = cached_fields(ssid, unit_id, URL).get("aflds")
 
     logger.debug("параметры на входе:")
     logger.debug(f"id сессии: {ssid}")
@@ -883,6 +1636,43 @@ def check_admin_fields(
     return response[1].get("id"), response[1].get("v")
 
 
+@fstart_stop
+@logger.catch
+def check_admin_fields_list(
+    ssid: str, unit_id: int, info_names: list[str], URL: str
+) -> list[tuple]:
+    """Check several admin fields.
+
+    The same as check_admin_fields, but the fields of the object are
+    requested once and all missing fields are created in one request.
+
+    Args:
+        ssid (str): session id
+        unit_id (int): unit/object id
+        info_names (list[str]): field names to check id
+        URL (str): server address
+
+    Returns:
+        info data: list of tuple(field id(int), field value(str))
+        in the order of info_names
+    """
+    logger.debug("параметры на входе:")
+    logger.debug(f"id сессии: {ssid}")
+    logger.debug(f"адрес сервера: {URL}")
+    logger.debug(f"id объекта: {unit_id}")
+    logger.debug(f"имена полей: {info_names}")
+    found = {}
+    for info in cached_fields(ssid, unit_id, URL).get("aflds").values():
+        for name in info_names:
+            if name not in found and name in info.get("n"):
+                found[name] = info.get("id"), info.get("v")
+    missing = [name for name in info_names if name not in found]
+    logger.debug(f"поля не найдены: {missing}")
+    found.update(create_fields(ssid, unit_id, missing, [], URL))
+    logger.debug(f"результат: {found}")
+    return [found.get(name) for name in info_names]
+
+
 @fstart_stop
 @logger.catch
 def fill_info(
@@ -894,6 +1684,8 @@ def fill_info(
         Updates fields Info1, Info4, 5, Info6, info7.
         If fields not to be filled are not found, the script creates a field
         and fills it with data.
+        Fields without data in the row are not sent and keep
+        the current value on wialon.
 
     Args:
         ssid (str): session id
@@ -909,70 +1701,70 @@ def fill_info(
     logger.debug(
         f"кортеж (id поля, значение поля к заполнению): {field_id_value}")
     logger.debug(f"json с текущими значениями полей объекта: {data}")
-    info1 = {
-        "svc": "item/update_admin_field",
-        "params": {
-            "itemId": unit_id,
-            "id": field_id_value[0][0],
-            "callMode": "update",
-            "n": "Инфо1",
-            "v": data.get("РДДБ")
-            if data.get("РДДБ") is not None
-            else field_id_value[0][1],
-        },
+    to_update = info_requests(unit_id, field_id_value, data)
+    if not to_update:
+        return
+    param = {
+        "svc": "core/batch",
+        "params": json.dumps({"params": to_update, "flags": 0}),
         "sid": ssid,
     }
+    logger.debug(f"параметры запроса: {param}")
+    post(URL, data=param)
+    remember_card(URL, unit_id, to_update)
 
-    info5 = {
-        "svc": "item/update_admin_field",
-        "params": {
-            "itemId": unit_id,
-            "id": field_id_value[1][0],
-            "callMode": "update",
-            "n": "Инфо5",
-            "v": data.get("Специалист")
-            if data.get("Специалист") is not None
-            else field_id_value[1][1],
-        },
-        "sid": ssid,
-    }
 
-    info6 = {
-        "svc": "item/update_admin_field",
-        "params": {
-            "itemId": unit_id,
-            "id": field_id_value[2][0],
-            "callMode": "update",
-            "n": "Инфо6",
-            "v": data.get("ИНН")
-            if data.get("ИНН") is not None
-            else field_id_value[2][1],
-        },
-        "sid": ssid,
-    }
+def info_requests(unit_id: int, field_id_value: list[tuple], data: dict) -> list[dict]:
+    """Requests to fill the fields Инфо of the object.
+
+    Fields without data in the row or without id are not sent.
+
+    Args:
+        unit_id (int): unit/object id
+        field_id_value (list[tuple]): (field id, value) of the fields of
+        INFO_FIELDS in the same order, see check_admin_fields_list
+        data (dict): row of the uploaded file
+
+    Returns:
+        list[dict]: [{"svc": <text>, "params": {...}}]
+    """
+    return [
+        {
+            "svc": "item/update_admin_field",
+            "params": {
+                "itemId": unit_id,
+                "id": field[0],
+                "callMode": "update",
+                "n": name,
+                "v": data.get(key),
+            },
+        }
+        for (key, name), field in zip(INFO_FIELDS.items(), field_id_value)
+        if field is not None and data.get(key) is not None
+    ]
+
+
+def inn_field_request(unit_id: int, field_id: int, inn_value: str) -> dict:
+    """Request to update the field ИНН.
+
+    Args:
+        unit_id (int): unut/object id
+        field_id (int): field id
+        inn_value (str): data to fill
 
-    info7 = {
+    Returns:
+        dict: {"svc": "item/update_admin_field", "params": {...}}
+    """
+    return {
         "svc": "item/update_admin_field",
         "params": {
             "itemId": unit_id,
-            "id": field_id_value[3][0],
+            "id": field_id,
             "callMode": "update",
-            "n": "Инфо7",
-            "v": data.get("КПП")
-            if data.get("КПП") is not None
-            else field_id_value[3][1],
+            "n": "ИНН",
+            "v": inn_value,
         },
-        "sid": ssid,
-    }
-
-    param = {
-        "svc": "core/batch",
-        "params": json.dumps(
-            {"params": [info1, info5, info6, info7], "flags": 0}),
-        "sid": ssid,
     }
-    logger.debug(f"параметры запроса: {param}")
-    requests.post(URL, data=param)
 
 
 @fstart_stop
@@ -1000,21 +1792,11 @@ def upd_inn_field(
     logger.debug(f"id объекта: {unit_id}")
     logger.debug(f"id поля ИНН: {field_id}")
     logger.debug(f"ИНН: {inn_value}")
-    inn = {
-        "svc": "item/update_admin_field",
-        "params": json.dumps(
-            {
-                "itemId": unit_id,
-                "id": field_id,
-                "callMode": "update",
-                "n": "ИНН",
-                "v": inn_value,
-            }
-        ),
-        "sid": ssid,
-    }
+    inn = inn_field_request(unit_id, field_id, inn_value)
+    inn.update({"params": json.dumps(inn.get("params")), "sid": ssid})
     logger.debug(f"параметры запроса: {inn}")
-    requests.post(URL, data=inn)
+    post(URL, data=inn)
+    _remember_fields(URL, unit_id, "aflds", {"ИНН": (field_id, inn_value)})
 
 
 @fstart_stop
@@ -1030,7 +1812,7 @@ def get_user_id(URL: str, TOKEN: str) -> int:
         int: user wialon id for spb.csat
     """
     param = {"svc": "token/login", "params": json.dumps({"token": TOKEN})}
-    response = requests.post(URL, data=param).json()
+    response = post(URL, data=param).json()
     cesar_id = response["user"]["id"]
     logger.debug(f"Результат: {cesar_id}")
     return cesar_id
@@ -1063,11 +1845,27 @@ def __get_new_token(sid: str, URL: str, app_name="export") -> str:
         ),
         "sid": sid,
     }
-    new_token = requests.post(URL, data=param).json()
+    new_token = post(URL, data=param).json()
     logger.debug(f'Результат: {new_token.get("h")}')
     return new_token.get("h")
 
 
+def object_name_request(unit_id: int, name: str) -> dict:
+    """Request to update the object name.
+
+    Args:
+        unit_id (int): object id on wialon
+        name (str): new name
+
+    Returns:
+        dict: {"svc": "item/update_name", "params": {...}}
+    """
+    return {
+        "svc": "item/update_name",
+        "params": {"itemId": unit_id, "name": name.strip()},
+    }
+
+
 @fstart_stop
 @logger.catch
 def update_object_name(sid: str, URL: str, unit_id: int, name: str) -> json:
@@ -1089,13 +1887,10 @@ def update_object_name(sid: str, URL: str, unit_id: int, name: str) -> json:
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"id объекта: {unit_id}")
     logger.debug(f"новое имя объекта: {name}")
-    param = {
-        "svc": "item/update_name",
-        "params": json.dumps({"itemId": unit_id, "name": name.strip()}),
-        "sid": sid,
-    }
+    param = object_name_request(unit_id, name)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
 
-    result = requests.post(URL, data=param)
+    result = post(URL, data=param)
     logger.debug(f"Результат {result.json()}")
     return result.json()
 
@@ -1122,8 +1917,9 @@ def id_fields(sid: str, uid: int, url: str) -> dict:
     Returns:
         map_id (dict): dict with current field name and field id
     """
-    admin_fields = get_admin_fields(sid, uid, url)
-    custom_fields = get_custom_fields(sid, uid, url)
+    fields = cached_fields(sid, uid, url)
+    admin_fields = fields.get("aflds")
+    custom_fields = fields.get("flds")
     map_id = {
         "geozone_imei": None,
         "geozone_sim": None,
@@ -1135,36 +1931,28 @@ def id_fields(sid: str, uid: int, url: str) -> dict:
     }
     logger.debug(f"получен список админ полей: {admin_fields}")
     logger.debug(f"получен список произвольных полей: {custom_fields}")
-    logger.debug("старт цикла for для поиска айди админ полей")
-    for field in admin_fields.items():
+    logger.debug("старт цикла for для поиска айди админ и произвольных полей")
+    for field in list(admin_fields.items()) + list(custom_fields.items()):
         name_field = field[1].get("n")
         id_field = field[1].get("id")
         logger.debug(f"имя поля: {name_field}")
         logger.debug(f"айди поля: {id_field}")
         if name_field in map_id.keys():
             map_id.update({name_field: id_field})
-    logger.debug("конец цикла for для поиска айди админ полей")
-    logger.debug("старт цикла for для поиска айди произвольных полей")
-    for field in custom_fields.items():
-        name_field = field[1].get("n")
-        id_field = field[1].get("id")
-        logger.debug(f"имя поля: {name_field}")
-        logger.debug(f"айди поля: {id_field}")
-        if name_field in map_id.keys():
-            map_id.update({name_field: id_field})
-    logger.debug("конец цикла for для поиска айди админ полей")
+    logger.debug("конец цикла for для поиска айди полей")
+    missing = [names for names, values in map_id.items() if values is None]
     logger.debug(
-        "старт цикла for, проверка что все нужные айди собраны. Если значение поля None, тода поле создаётся и присваивается id"
+        f"не найдены поля: {missing}, поля создаются одним запросом и им присваивается id"
+    )
+    created = create_fields(
+        sid,
+        uid,
+        [names for names in missing if names not in CUSTOM_FIELDS],
+        [names for names in missing if names in CUSTOM_FIELDS],
+        url,
     )
-    for names, values in map_id.items():
-        if values is None:
-            if names == "Vin" or names == "Марка" or names == "Модель":
-                field = create_custom_field(sid, uid, names, url)
-                map_id.update({names: field[1].get("id")})
-            else:
-                field = create_admin_field(sid, uid, names, url)
-                map_id.update({names: field[1].get("id")})
-    logger.debug("конец цикла for для проверки id")
+    for names, values in created.items():
+        map_id.update({names: values[0]})
     logger.debug(f"Получен результат: {map_id}")
     return map_id
 
@@ -1193,7 +1981,7 @@ def delete_object(sid: str, URL: str, obj_id: int) -> dict:
         "params": json.dumps({"itemId": obj_id}),
         "sid": sid,
     }
-    result = requests.post(URL, data=param)
+    result = post(URL, data=param)
     logger.debug(f"результат работы функции: {result}")
     return result.json()
 
@@ -1224,7 +2012,7 @@ def __change_calc_flag(sid: str, url: str, obj_id: int, flag: int) -> dict:
         "params": json.dumps({"itemId": obj_id, "newValue": flag}),
         "sid": sid
     }
-    result = requests.post(url, data=param)
+    result = post(url, data=param)
     logger.debug(f"Результат: {result.json()}")
     return result.json()
 
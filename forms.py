@@ -1,6 +1,6 @@
 """Module with forms for the application."""
 
-from constant import FMS
+from constant import FMS, MODES
 from flask_wtf import FlaskForm
 from wtforms import (
     BooleanField,
@@ -22,6 +22,7 @@ class UploadFile(FlaskForm):
     """
 
     fms = SelectField(label="", render_kw={"placeholder": "FMS"}, choices=FMS)
+    mode = SelectField(label="", choices=MODES, default="apply")
     export_file = FileField(validators=[DataRequired()])
     submit = SubmitField("Экспорт")
 
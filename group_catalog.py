@@ -0,0 +1,229 @@
+"""Catalog of object groups of the wialon servers.
+
+For every FMS the id, name and objects of all groups are kept in
+memory. The catalog is loaded with one core/search_items and shared
+by all jobs of the server. A group that is not found by name is
+looked for among the groups created since the last load, the whole
+catalog is loaded again once in GROUP_CATALOG_TTL seconds to pick up
+changes made on the server. Groups updated by the application are
+written to the catalog from the server response.
+
+unit_group/update_units replaces the whole list of objects of a group,
+so the list is never built from the catalog: the objects of the groups
+are read again with read_members right before the update, while the
+locks of the groups are held (locked_groups). Jobs of this process
+updating the same group wait for each other.
+"""
+
+import json
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Iterable
+
+from batch import BatchCoalescer
+from client import post
+from config import fstart_stop, logger
+from constant import GROUP_CATALOG_TTL, GROUPS
+
+# the clocks of the server and the application may differ
+SYNC_MARGIN = 10 * 60
+
+# {fms: {group id: kind from GROUPS}}, the first kind of GROUPS wins
+GROUP_KINDS = {
+    fms: {
+        group_id: kind
+        for kind, ids in reversed(list(kinds.items()))
+        for group_id in ids
+    }
+    for fms, kinds in GROUPS.items()
+}
+
+# fms -> {"groups": {group id: group}, "loaded": <time>, "synced": <time>}
+_catalogs: dict[int, dict] = {}
+_lock = threading.Lock()
+# (fms, group id) -> lock held while the objects of the group are replaced
+_group_locks: dict[tuple[int, int], threading.Lock] = {}
+
+
+def _search_groups(sid: str, URL: str, prop_name: str, mask: str) -> list | None:
+    """Request groups with one core/search_items.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        prop_name (str): property to search by
+        mask (str): mask of the property value
+
+    Returns:
+        list | None: groups {"id", "nm", "u"}, None if the request failed
+    """
+    param = {
+        "svc": "core/search_items",
+        "params": json.dumps(
+            {
+                "spec": {
+                    "itemsType": "avl_unit_group",
+                    "propName": prop_name,
+                    "propValueMask": mask,
+                    "sortType": "sys_name",
+                },
+                "force": 1,
+                "flags": 1,
+                "from": 0,
+                "to": 0,
+            }
+        ),
+        "sid": sid,
+    }
+    response = post(URL, data=param).json()
+    if "items" not in response:
+        logger.error(f"группы не получены: {response}")
+        return None
+    return response.get("items")
+
+
+def _group(item: dict) -> dict:
+    return {"id": item.get("id"), "nm": item.get("nm"), "u": set(item.get("u", []))}
+
+
+@fstart_stop
+@logger.catch
+def load_catalog(sid: str, URL: str, fms: int) -> dict[int, dict]:
+    """Get the catalog of groups of the server.
+
+    The catalog is loaded from the server if it is missing
+    or older than GROUP_CATALOG_TTL.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+
+    Returns:
+        dict: {group id: {"id": <int>, "nm": <text>, "u": {object ids}}}
+    """
+    with _lock:
+        catalog = _catalogs.get(fms)
+        if catalog is not None and time.time() - catalog["loaded"] < GROUP_CATALOG_TTL:
+            return catalog["groups"]
+        now = time.time()
+        items = _search_groups(sid, URL, "sys_name", "*")
+        if items is None:
+            return catalog["groups"] if catalog is not None else {}
+        _catalogs[fms] = {
+            "groups": {item.get("id"): _group(item) for item in items},
+            "loaded": now,
+            "synced": now,
+        }
+        logger.debug(f"каталог групп FMS {fms}: {len(items)}")
+        return _catalogs[fms]["groups"]
+
+
+@fstart_stop
+@logger.catch
+def find_groups(sid: str, URL: str, fms: int, name: str) -> list[dict]:
+    """Find groups by part of the name.
+
+    If no group is found, groups created since the last sync
+    are requested (search by rel_creation_time) and added to the catalog.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+        name (str): the name or part of the name of the group
+
+    Returns:
+        list[dict]: groups whose name contains name, case insensitive
+    """
+    groups = load_catalog(sid, URL, fms)
+    name = name.lower()
+    found = [group for group in groups.values() if name in group["nm"].lower()]
+    if found:
+        return found
+    with _lock:
+        catalog = _catalogs.get(fms)
+        if catalog is None:
+            return []
+        now = time.time()
+        items = _search_groups(
+            sid,
+            URL,
+            "rel_creation_time",
+            f'>={int(catalog["synced"] - SYNC_MARGIN)}',
+        )
+        if items is None:
+            return []
+        catalog["groups"].update({item.get("id"): _group(item) for item in items})
+        catalog["synced"] = now
+        logger.debug(f"в каталог групп FMS {fms} добавлено: {len(items)}")
+        groups = catalog["groups"].values()
+        return [group for group in groups if name in group["nm"].lower()]
+
+
+def set_members(fms: int, group_id: int, units: list[int]) -> None:
+    """Write the objects of a group updated by the application.
+
+    Args:
+        fms (int): server number
+        group_id (int): group id
+        units (list[int]): objects of the group returned by the server
+    """
+    with _lock:
+        catalog = _catalogs.get(fms)
+        if catalog is not None and group_id in catalog["groups"]:
+            catalog["groups"][group_id]["u"] = set(units)
+
+
+@contextmanager
+def locked_groups(fms: int, group_ids: Iterable[int]):
+    """Hold the locks of the groups, taken in the order of the ids.
+
+    Args:
+        fms (int): server number
+        group_ids (Iterable[int]): group ids
+    """
+    with _lock:
+        locks = [
+            _group_locks.setdefault((fms, group_id), threading.Lock())
+            for group_id in sorted(set(group_ids))
+        ]
+    with ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+
+@fstart_stop
+def read_members(
+    sid: str, URL: str, fms: int, group_ids: list[int]
+) -> dict[int, list[int]]:
+    """Read the current objects of groups from the server.
+
+    The groups are requested with core/search_item (flag 1) in one
+    core/batch, the catalog is updated from the response.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+        group_ids (list[int]): group ids
+
+    Returns:
+        dict[int, list[int]]: {group id: object ids}, groups that were
+        not read are missing
+    """
+    with BatchCoalescer(sid, URL) as coalescer:
+        for group_id in group_ids:
+            coalescer.add(group_id, "core/search_item", {"id": group_id, "flags": 1})
+    members = {}
+    for group_id in group_ids:
+        result = (coalescer.results.get(group_id) or [{}])[0]
+        item = result.get("item") if isinstance(result, dict) else None
+        if item is None:
+            logger.error(f"состав группы {group_id} не получен: {result}")
+            continue
+        members[group_id] = item.get("u") or []
+        set_members(fms, group_id, members[group_id])
+    return members
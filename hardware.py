@@ -2,10 +2,339 @@
 
 import json
 
-import requests
-
+from batch import BatchCoalescer
+from client import post
 from config import fstart_stop, logger
-from constant import HW_ID, HW_TMP, USER_ID
+from constant import HW_ID, USER_ID
+from hw_templates import get_sensors, get_template, template_unit
+
+DRIVE_RANK = {
+    "acceleration": [
+        {
+            "flags": 2,
+            "min_value": 0.4,
+            "name": "Ускорение: опасное",
+            "penalties": 2000,
+        },
+        {
+            "flags": 2,
+            "max_value": 0.4,
+            "min_value": 0.31,
+            "name": "Ускорение: резкое",
+            "penalties": 1000,
+        },
+    ],
+    "brake": [
+        {
+            "flags": 2,
+            "min_value": 0.35,
+            "name": "Торможение: опасное",
+            "penalties": 2000,
+        },
+        {
+            "flags": 2,
+            "max_value": 0.35,
+            "min_value": 0.31,
+            "name": "Торможение: резкое",
+            "penalties": 1000,
+        },
+    ],
+    "turn": [
+        {
+            "flags": 2,
+            "min_value": 0.4,
+            "name": "Поворот: опасный",
+            "penalties": 1000,
+        },
+        {
+            "flags": 2,
+            "max_value": 0.4,
+            "min_value": 0.31,
+            "name": "Поворот: резкий",
+            "penalties": 500,
+        },
+    ],
+    "speeding": [
+        {
+            "flags": 2,
+            "max_duration": 30,
+            "min_duration": 10,
+            "min_value": 41,
+            "name": "Превышение: опасное",
+            "penalties": 5000,
+        },
+        {
+            "flags": 2,
+            "max_value": 41,
+            "min_duration": 10,
+            "min_value": 21,
+            "name": "Превышение: сильное",
+            "penalties": 2000,
+        },
+        {
+            "flags": 2,
+            "max_value": 21,
+            "min_duration": 10,
+            "min_value": 10,
+            "name": "Превышение: среднее",
+            "penalties": 100,
+        },
+    ],
+    "harsh": [
+        {
+            "flags": 2,
+            "min_value": 0.3,
+            "name": "Резкое вождение",
+            "penalties": 300,
+        }
+    ],
+    "global": {"accel_mode": 0},
+}
+
+
+def hardware_name(object_param: dict) -> str:
+    """Hardware name of the row as it is written in HW_ID.
+
+    Args:
+        object_param (dict): dict with object data
+
+    Returns:
+        str: hardware name
+    """
+    return object_param.get("Оборудование").replace("Teltonika ", "")
+
+
+def get_hardware_id(object_param: dict, fms: int) -> int:
+    """Find hardware id of the row.
+
+    Args:
+        object_param (dict): dict with object data
+        fms (int): server number
+
+    Returns:
+        int: hardware id, -1 if the hardware is not found
+    """
+    hware = hardware_name(object_param)
+    try:
+        return HW_ID[fms][hware]
+    except KeyError as e:
+        logger.error(f"Шаблон {hware} не найден, объект не создан, ошибка {e}")
+        with open("logging/import_report.log", "a") as log:
+            log.write(f"""Шаблон оборудования {hware} для автоматического
+              создания объекта на виалон не найден.\nОбъект не создан.\n""")
+        return -1
+
+
+def sensor_requests(obj_id: int, sensors: list[dict]) -> list[dict]:
+    """Requests to create sensors.
+
+    Args:
+        obj_id (int): unit/object id
+        sensors (list[dict]): sensors of the template, see get_sensors
+
+    Returns:
+        list[dict]: [{"svc": "unit/update_sensor", "params": {...}}]
+    """
+    return [
+        {"svc": "unit/update_sensor", "params": {"itemId": obj_id, **sensor}}
+        for sensor in sensors
+    ]
+
+
+def device_type_request(obj_id: int, hardware_id: int, uid: str) -> dict:
+    """Request to update the device type and unique id.
+
+    Args:
+        obj_id (int): unit/object id
+        hardware_id (int): hardware id
+        uid (str): new unique id
+
+    Returns:
+        dict: {"svc": "unit/update_device_type", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_device_type",
+        "params": {"itemId": obj_id, "deviceTypeId": hardware_id, "uniqueId": uid},
+    }
+
+
+def phone_request(obj_id: int, phone: str) -> dict:
+    """Request to update the phone number.
+
+    Args:
+        obj_id (int): unit/object id
+        phone (str): new phone number
+
+    Returns:
+        dict: {"svc": "unit/update_phone", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_phone",
+        "params": {"itemId": obj_id, "phoneNumber": phone},
+    }
+
+
+def calc_flags_request(obj_id: int) -> dict:
+    """Request to reset the odometer and engine hours counters.
+
+    Args:
+        obj_id (int): unit/object id
+
+    Returns:
+        dict: {"svc": "unit/update_calc_flags", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_calc_flags",
+        "params": {"itemId": obj_id, "newValue": "0x310"},
+    }
+
+
+def report_settings_request(
+    obj_id: int, hardware_id: int, tmp_name: str, hware_name: str, fms: int
+) -> dict:
+    """Request to update the settings used in reports.
+
+    Args:
+        obj_id (int): unit/object id
+        hardware_id (int): hardware id
+        tmp_name (str): configuration template
+        hware_name (str): hardware name
+        fms (int): server number
+
+    Returns:
+        dict: {"svc": "unit/update_report_settings", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_report_settings",
+        "params": {
+            "itemId": obj_id,
+            "params": get_template(fms, hardware_id, tmp_name, hware_name).get(
+                "report"
+            ),
+        },
+    }
+
+
+def messages_filter_request(
+    obj_id: int, hardware_id: int, tmp_name: str, hware_name: str, fms: int
+) -> dict:
+    """Request to update the message validity filter.
+
+    Args:
+        obj_id (int): unit/object id
+        hardware_id (int): hardware id
+        tmp_name (str): configuration template
+        hware_name (str): hardware name
+        fms (int): server number
+
+    Returns:
+        dict: {"svc": "unit/update_messages_filter", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_messages_filter",
+        "params": {
+            "itemId": obj_id,
+            **get_template(fms, hardware_id, tmp_name, hware_name).get("msg_filter"),
+        },
+    }
+
+
+def drive_rank_request(obj_id: int) -> dict:
+    """Request to update the driving quality settings.
+
+    Args:
+        obj_id (int): unit/object id
+
+    Returns:
+        dict: {"svc": "unit/update_drive_rank_settings", "params": {...}}
+    """
+    return {
+        "svc": "unit/update_drive_rank_settings",
+        "params": {"itemId": obj_id, "driveRank": DRIVE_RANK},
+    }
+
+
+def setup_requests(
+    sid: str, URL: str, obj_id: int, hardware_id: int, object_param: dict, fms: int
+) -> list[tuple[str, dict]]:
+    """Plan of the object setup after creation.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        obj_id (int): unit/object id
+        hardware_id (int): hardware id
+        object_param (dict): dict with object data
+        fms (int): server number
+
+    Returns:
+        list[tuple[str, dict]]: [(step name, request)]
+    """
+    hware = hardware_name(object_param)
+    tmp_name = object_param.get("ШАБЛОН КОНФИГУРАЦИИ")
+    template = (obj_id, hardware_id, tmp_name, hware, fms)
+    sensors = get_sensors(sid, URL, fms, hardware_id, tmp_name, hware)
+    return [
+        *(("sensors", request) for request in sensor_requests(obj_id, sensors)),
+        (
+            "device_type",
+            device_type_request(
+                obj_id, hardware_id, object_param.get("geozone_imei")
+            ),
+        ),
+        ("phone", phone_request(obj_id, object_param.get("geozone_sim"))),
+        ("calc_flags", calc_flags_request(obj_id)),
+        ("report_settings", report_settings_request(*template)),
+        ("messages_filter", messages_filter_request(*template)),
+        ("drive_rank", drive_rank_request(obj_id)),
+    ]
+
+
+def clone_requests(
+    obj_id: int, hardware_id: int, object_param: dict
+) -> list[tuple[str, dict]]:
+    """Plan of the setup of an object copied from the template unit.
+
+    Sensors, report settings, message filter and driving quality are
+    copied with the unit, only the values of the object are sent.
+
+    Args:
+        obj_id (int): unit/object id
+        hardware_id (int): hardware id
+        object_param (dict): dict with object data
+
+    Returns:
+        list[tuple[str, dict]]: [(step name, request)]
+    """
+    return [
+        (
+            "device_type",
+            device_type_request(
+                obj_id, hardware_id, object_param.get("geozone_imei")
+            ),
+        ),
+        ("phone", phone_request(obj_id, object_param.get("geozone_sim"))),
+        ("calc_flags", calc_flags_request(obj_id)),
+    ]
+
+
+def send_plan(sid: str, URL: str, plan: list[tuple[str, dict]]) -> BatchCoalescer:
+    """Send the requests of the plan with core/batch.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        plan (list[tuple[str, dict]]): [(step name, request)]
+
+    Returns:
+        BatchCoalescer: results and errors of the requests by step name
+    """
+    with BatchCoalescer(sid, URL) as coalescer:
+        for step, request in plan:
+            coalescer.add(step, request.get("svc"), request.get("params"))
+    for step, errors in coalescer.errors.items():
+        logger.error(f"шаг {step} выполнен с ошибками: {errors}")
+    return coalescer
 
 
 @fstart_stop
@@ -48,11 +377,50 @@ def create_object(
         "sid": sid,
     }
     logger.debug(f"параметры запроса: {params}")
-    response = requests.post(URL, data=params)
+    response = post(URL, data=params)
     logger.info(f"Объект создан, результат запроса: {response.json()}")
     return response.json()
 
 
+@fstart_stop
+@logger.catch
+def clone_object(
+    sid: str,
+    URL: str,
+    template_id: int,
+    object_name: str,
+    fms: int,
+) -> dict:
+    """Create new object as a copy of the template unit.
+
+    Args:
+        sid (str): Session id
+        URL (str): server address
+        template_id (int): id of the template unit
+        object_name (str): this is contract name
+        fms (int): server number
+    Returns:
+        dict: {'item': {'nm': 'object name', 'cls': 2, 'id': 26370, ...}},
+        {'error': code} if the server can not copy the unit
+    """
+    params = {
+        "svc": "core/duplicate",
+        "params": json.dumps(
+            {
+                "itemId": template_id,
+                "creatorId": USER_ID[fms],
+                "name": object_name,
+                "dataFlags": 1,
+            }
+        ),
+        "sid": sid,
+    }
+    logger.debug(f"параметры запроса: {params}")
+    response = post(URL, data=params)
+    logger.info(f"Объект скопирован, результат запроса: {response.json()}")
+    return response.json()
+
+
 @fstart_stop
 @logger.catch
 def create_sensors(
@@ -67,8 +435,10 @@ def create_sensors(
     """Creation of sensors.
 
     The function reads the equipment field from the input,
-    reads the template with sensors and fills in the required fields
-    to send a request to create sensors to a specific object.
+    takes the sensors of the template (or of the template unit, see
+    hw_templates.get_sensors) and creates all sensors of
+    the object with one core/batch. Sensors that failed in the batch
+    are created again one by one.
 
     Args:
         sid (str): session id
@@ -79,7 +449,7 @@ def create_sensors(
         fms (int): server number
 
     Returns:
-        data: integer 0
+        int: number of sensors that were not created, 0 if all created
     """
     logger.debug("параметры на входе")
     logger.debug(f"id сессии: {sid}")
@@ -88,47 +458,34 @@ def create_sensors(
     logger.debug(f"id объекта: {object_id}")
     logger.debug(f"Шаблон конфигурации: {tmp_name}")
     logger.debug(f"номер сервера: {fms}")
-    if hware_name == "Cesar 25":
-        sensor_template = HW_TMP[fms].get(hardware_id)[-1]
-    else:
-        sensor_template = HW_TMP[fms].get(hardware_id)[
-            0
-            if "отрыв" in tmp_name
-            else 1
-            if "фото" in tmp_name
-            else 2
-            if "1wire" in tmp_name
-            else 0
-        ]
-    with open(f"data_tmp/{sensor_template}.json", "r") as f:
-        tmp = json.loads(f.read())
-        for sensor in tmp.get("sensors"):
+    requests_list = sensor_requests(
+        object_id, get_sensors(sid, URL, fms, hardware_id, tmp_name, hware_name)
+    )
+    with BatchCoalescer(sid, URL) as coalescer:
+        for number, request in enumerate(requests_list):
+            coalescer.add(number, request.get("svc"), request.get("params"))
+    failed = 0
+    for number, request in enumerate(requests_list):
+        name = request.get("params").get("n")
+        if number in coalescer.errors:
+            logger.debug(f"датчик {name}: ошибка {coalescer.errors[number]}, повтор")
             param = {
-                "svc": "unit/update_sensor",
-                "params": json.dumps(
-                    {
-                        "itemId": object_id,
-                        "id": sensor.get("id"),
-                        "callMode": "create",
-                        "unlink": 0,
-                        "n": sensor.get("n"),
-                        "t": sensor.get("t"),
-                        "d": sensor.get("d"),
-                        "m": sensor.get("m"),
-                        "p": sensor.get("p"),
-                        "f": sensor.get("f"),
-                        "c": sensor.get("c"),
-                        "vt": sensor.get("vt"),
-                        "vs": sensor.get("vs"),
-                        "tbl": sensor.get("tbl"),
-                    }
-                ),
+                "svc": request.get("svc"),
+                "params": json.dumps(request.get("params")),
                 "sid": sid,
             }
-            requests.post(URL, data=param)
-            logger.debug(f"параметры запроса: {param}")
-        logger.info("датчики созданы")
-    return 0
+            result = post(URL, data=param).json()
+        else:
+            result = coalescer.results[number][0]
+        if isinstance(result, dict) and "error" in result:
+            failed += 1
+            logger.error(f"датчик {name} объекта {object_id} не создан: {result}")
+        else:
+            logger.debug(f"датчик {name} создан: {result}")
+    logger.info(
+        f"датчики созданы: {len(requests_list) - failed} из {len(requests_list)}"
+    )
+    return failed
 
 
 @fstart_stop
@@ -153,13 +510,10 @@ def add_phone(sid: str, URL: str, obj_id: int, phone: str) -> str:
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"id объекта: {obj_id}")
     logger.debug(f"телефон: {phone}")
-    param = {
-        "svc": "unit/update_phone",
-        "params": json.dumps({"itemId": obj_id, "phoneNumber": phone}),
-        "sid": sid,
-    }
+    param = phone_request(obj_id, phone)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
     logger.debug(f"параметры запроса: {param}")
-    response = requests.post(URL, data=param)
+    response = post(URL, data=param)
     logger.info(f"телефон внесён, результат запроса: {response.text}")
     return response.text
 
@@ -190,14 +544,9 @@ def add_obj_uid(sid: str, URL: str, obj_id: int, hardware_id: int, uid: str):
     logger.debug(f"id объекта: {obj_id}")
     logger.debug(f"id оборудования: {hardware_id}")
     logger.debug(f"новый id: {uid}")
-    param = {
-        "svc": "unit/update_device_type",
-        "params": json.dumps(
-            {"itemId": obj_id, "deviceTypeId": hardware_id, "uniqueId": uid}
-        ),
-        "sid": sid,
-    }
-    a = requests.post(URL, data=param)
+    param = device_type_request(obj_id, hardware_id, uid)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
+    a = post(URL, data=param)
     logger.debug(f"параметры запроса: {param}")
     logger.info(f"имей добавлен, результат запроса: {a.text}")
     return a.json()
@@ -222,12 +571,9 @@ def add_param_engin_axel(sid: str, URL: str, obj_id: int) -> int:
     logger.debug(f"id сессии: {sid}")
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"id объекта: {obj_id}")
-    param = {
-        "svc": "unit/update_calc_flags",
-        "params": json.dumps({"itemId": obj_id, "newValue": "0x310"}),
-        "sid": sid,
-    }
-    requests.post(URL, data=param)
+    param = calc_flags_request(obj_id)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
+    post(URL, data=param)
     logger.debug(f"параметры запроса: {param}")
     logger.info("Одометр и моточасы сброшены до нуля")
     return 0
@@ -267,43 +613,11 @@ def update_advance_setting(
     logger.debug(f"id железки (тип устройства): {hardware_id}")
     logger.debug(f"Шеблон конфигурации: {tmp_name}")
     logger.debug(f"номер сервера: {fms}")
-    if hware_name == "Cesar 25":
-        sensor_template = HW_TMP[fms].get(hardware_id)[-1]
-    else:
-        sensor_template = HW_TMP[fms].get(hardware_id)[
-            0
-            if "отрыв" in tmp_name
-            else 1
-            if "фото" in tmp_name
-            else 2
-            if "1wire" in tmp_name
-            else 0
-        ]
-    with open(f"data_tmp/{sensor_template}.json", "r") as f:
-        tmp = json.loads(f.read()).get("reportProps")
-        param = {
-            "svc": "unit/update_report_settings",
-            "params": json.dumps(
-                {
-                    "itemId": obj_id,
-                    "params": {
-                        "speedLimit": tmp.get("speedLimit"),
-                        "maxMessagesInterval": tmp.get("maxMessagesInterval"),
-                        "dailyEngineHoursRate": tmp.get("dailyEngineHoursRate"),
-                        "urbanMaxSpeed": tmp.get("urbanMaxSpeed"),
-                        "mileageCoefficient": tmp.get("mileageCoefficient"),
-                        "speedingTolerance": tmp.get("speedingTolerance"),
-                        "speedingMinDuration": tmp.get("speedingMinDuration"),
-                        "speedingMode": tmp.get("speedingMode"),
-                        "fuelRateCoefficient": tmp.get("fuelRateCoefficient"),
-                    },
-                }
-            ),
-            "sid": sid,
-        }
-        logger.debug(f"параметры запроса: {param}")
-        logger.info("Параметры, используемые в отчётах - обновлены")
-    response = requests.post(URL, data=param)
+    param = report_settings_request(obj_id, hardware_id, tmp_name, hware_name, fms)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
+    logger.debug(f"параметры запроса: {param}")
+    logger.info("Параметры, используемые в отчётах - обновлены")
+    response = post(URL, data=param)
     return response.json()
 
 
@@ -341,39 +655,12 @@ def update_advance_validity_filter(
     logger.debug(f"id железки (тип устройства): {hardware_id}")
     logger.debug(f"Шеблон конфигурации: {tmp_name}")
     logger.debug(f"номер сервера: {fms}")
-    if hware_name == "Cesar 25":
-        sensor_template = HW_TMP[fms].get(hardware_id)[-1]
-    else:
-        sensor_template = HW_TMP[fms].get(hardware_id)[
-            0
-            if "отрыв" in tmp_name
-            else 1
-            if "фото" in tmp_name
-            else 2
-            if "1wire" in tmp_name
-            else 0
-        ]
-    with open(f"data_tmp/{sensor_template}.json", "r") as f:
-        tmp = json.loads(f.read()).get("advProps").get("msgFilter")
-        param = {
-            "svc": "unit/update_messages_filter",
-            "params": json.dumps(
-                {
-                    "itemId": obj_id,
-                    "enabled": tmp.get("enabled"),
-                    "skipInvalid": tmp.get("skipInvalid"),
-                    "minSats": tmp.get("minSats"),
-                    "maxHdop": tmp.get("maxHdop"),
-                    "maxSpeed": tmp.get("maxSpeed"),
-                    "lbsCorrection": tmp.get("lbsCorrection"),
-                }
-            ),
-            "sid": sid,
-        }
-        response = requests.post(URL, data=param)
-        logger.debug(f"параметры запроса: {param}")
-        logger.debug(f"Результат запроса: {response.json()}")
-        logger.info("Фильтрация валидности сообщений - обновлены")
+    param = messages_filter_request(obj_id, hardware_id, tmp_name, hware_name, fms)
+    param.update({"params": json.dumps(param.get("params")), "sid": sid})
+    response = post(URL, data=param)
+    logger.debug(f"параметры запроса: {param}")
+    logger.debug(f"Результат запроса: {response.json()}")
+    logger.info("Фильтрация валидности сообщений - обновлены")
     return response.json()
 
 
@@ -397,98 +684,9 @@ def create_driving_param(ssid: str, URL: str, obj_id: int) -> int:
     logger.debug(f"id сессии: {ssid}")
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"id объекта: {obj_id}")
-    param = {
-        "svc": "unit/update_drive_rank_settings",
-        "params": json.dumps(
-            {
-                "itemId": obj_id,
-                "driveRank": {
-                    "acceleration": [
-                        {
-                            "flags": 2,
-                            "min_value": 0.4,
-                            "name": "Ускорение: опасное",
-                            "penalties": 2000,
-                        },
-                        {
-                            "flags": 2,
-                            "max_value": 0.4,
-                            "min_value": 0.31,
-                            "name": "Ускорение: резкое",
-                            "penalties": 1000,
-                        },
-                    ],
-                    "brake": [
-                        {
-                            "flags": 2,
-                            "min_value": 0.35,
-                            "name": "Торможение: опасное",
-                            "penalties": 2000,
-                        },
-                        {
-                            "flags": 2,
-                            "max_value": 0.35,
-                            "min_value": 0.31,
-                            "name": "Торможение: резкое",
-                            "penalties": 1000,
-                        },
-                    ],
-                    "turn": [
-                        {
-                            "flags": 2,
-                            "min_value": 0.4,
-                            "name": "Поворот: опасный",
-                            "penalties": 1000,
-                        },
-                        {
-                            "flags": 2,
-                            "max_value": 0.4,
-                            "min_value": 0.31,
-                            "name": "Поворот: резкий",
-                            "penalties": 500,
-                        },
-                    ],
-                    "speeding": [
-                        {
-                            "flags": 2,
-                            "max_duration": 30,
-                            "min_duration": 10,
-                            "min_value": 41,
-                            "name": "Превышение: опасное",
-                            "penalties": 5000,
-                        },
-                        {
-                            "flags": 2,
-                            "max_value": 41,
-                            "min_duration": 10,
-                            "min_value": 21,
-                            "name": "Превышение: сильное",
-                            "penalties": 2000,
-                        },
-                        {
-                            "flags": 2,
-                            "max_value": 21,
-                            "min_duration": 10,
-                            "min_value": 10,
-                            "name": "Превышение: среднее",
-                            "penalties": 100,
-                        },
-                    ],
-                    "harsh": [
-                        {
-                            "flags": 2,
-                            "min_value": 0.3,
-                            "name": "Резкое вождение",
-                            "penalties": 300,
-                        }
-                    ],
-                    "global": {"accel_mode": 0},
-                },
-            }
-        ),
-        "sid": ssid,
-    }
-    response = requests.post(URL, data=param)
+    param = drive_rank_request(obj_id)
+    param.update({"params": json.dumps(param.get("params")), "sid": ssid})
+    response = post(URL, data=param)
     logger.debug(f"параметры запроса: {param}")
     logger.info("Качество вождения - данные обновлены")
     return 0 if len(response.json()) == 0 else -1
@@ -501,18 +699,25 @@ def create_object_with_all_params(
     URL: str,
     object_param: dict,
     fms: int,
+    from_template: bool = False,
 ) -> int:
     """Create an object with sensors.
 
     The function creates an object on wialon,
-    fills it with data based on the template,
+    fills it with data based on the template with one core/batch
     and returns the id of the new object.
 
+    With from_template the object is copied from the template unit of
+    TEMPLATE_UNITS on the server and only the device type, phone and
+    counters are sent. Without a template unit, or if the server does
+    not copy it, the object is created the usual way.
+
     Args:
         sid (str): session id
         URL (str): server address
         object_param (dict): dict with object data
         fms (int): server number
+        from_template (bool): copy the object from the template unit
 
     Returns:
         object_id (int): object id
@@ -522,36 +727,31 @@ def create_object_with_all_params(
     logger.debug(f"адрес сервера: {URL}")
     logger.debug(f"json с параметрами объекта: {object_param}")
     logger.debug(f"номер сервера: {fms}")
-    hware = object_param.get("Оборудование").replace("Teltonika ", "")
-    try:
-        hard_id = HW_ID[fms][hware]
-    except KeyError as e:
-        logger.error(f"Шаблон {hware} не найден, объект не создан, ошибка {e}")
-        with open("logging/import_report.log", "a") as log:
-            log.write(f"""Шаблон оборудования {hware} для автоматического
-              создания объекта на виалон не найден.\nОбъект не создан.\n""")
+    hard_id = get_hardware_id(object_param, fms)
+    if hard_id == -1:
         return -1
 
-    new_object = create_object(sid, URL, hard_id, object_param.get("ДЛ"), fms)
+    name = object_param.get("ДЛ")
+    template_id = None
+    if from_template:
+        template_id = template_unit(
+            fms,
+            hard_id,
+            object_param.get("ШАБЛОН КОНФИГУРАЦИИ"),
+            hardware_name(object_param),
+        )
+    if template_id is not None:
+        new_object = clone_object(sid, URL, template_id, name, fms) or {}
+        obj_id = new_object.get("item", {}).get("id")
+        if obj_id is not None:
+            send_plan(sid, URL, clone_requests(obj_id, hard_id, object_param))
+            logger.debug("Объект скопирован из шаблонного объекта")
+            return obj_id
+        logger.error(f"шаблонный объект {template_id} не скопирован: {new_object}")
+
+    new_object = create_object(sid, URL, hard_id, name, fms)
     obj_id = new_object.get("item").get("id")
 
-    tmp_name = object_param.get("ШАБЛОН КОНФИГУРАЦИИ")
-    create_sensors(sid, URL, hard_id, obj_id, tmp_name, hware, fms)
-
-    add_obj_uid(sid, URL, obj_id, hard_id, object_param.get("geozone_imei"))
-    add_phone(sid, URL, obj_id, object_param.get("geozone_sim"))
-    add_param_engin_axel(sid, URL, obj_id)
-
-    update_advance_setting(sid, URL, obj_id, hard_id, tmp_name, hware, fms)
-    update_advance_validity_filter(
-        sid,
-        URL,
-        obj_id,
-        hard_id,
-        tmp_name,
-        hware,
-        fms,
-    )
-    create_driving_param(sid, URL, obj_id)
+    send_plan(sid, URL, setup_requests(sid, URL, obj_id, hard_id, object_param, fms))
     logger.debug("Объект со всеми параметрами, создан")
     return obj_id
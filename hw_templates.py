@@ -0,0 +1,233 @@
+"""Registry of configuration templates.
+
+Templates from data_tmp/ are read and checked once at import.
+For every server, hardware and template variant from HW_TMP the
+parameters of unit/update_sensor, unit/update_report_settings and
+unit/update_messages_filter are prepared in advance, so creating
+an object does not read or parse any file.
+
+If a template unit is set in TEMPLATE_UNITS, sensors are taken from
+that unit on the server instead of data_tmp. The unit is read once,
+its sensors are kept for the lifetime of the process. The template
+unit is also the source of hardware.create_object_with_all_params
+with from_template, the new object is copied from it on the server.
+"""
+
+import json
+import os
+import threading
+
+from client import post
+from config import logger
+from constant import HW_TMP, TEMPLATE_UNITS
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_tmp")
+
+SENSOR_KEYS = ("n", "t", "d", "m", "p", "f", "c", "vt", "vs", "tbl")
+REPORT_KEYS = (
+    "speedLimit",
+    "maxMessagesInterval",
+    "dailyEngineHoursRate",
+    "urbanMaxSpeed",
+    "mileageCoefficient",
+    "speedingTolerance",
+    "speedingMinDuration",
+    "speedingMode",
+    "fuelRateCoefficient",
+)
+FILTER_KEYS = (
+    "enabled",
+    "skipInvalid",
+    "minSats",
+    "maxHdop",
+    "maxSpeed",
+    "lbsCorrection",
+)
+
+# template name -> prepared parameters
+_templates: dict[str, dict] = {}
+# (fms, hardware id, variant) -> prepared parameters
+_registry: dict[tuple[int, int, int], dict] = {}
+# (server address, template unit id) -> prepared sensors
+_unit_sensors: dict[tuple[str, int], list[dict]] = {}
+_unit_sensors_lock = threading.Lock()
+
+
+def _prepare_sensor(sensor: dict) -> dict:
+    """Prepare parameters of unit/update_sensor from a sensor.
+
+    Args:
+        sensor (dict): sensor of a template or of a unit
+
+    Returns:
+        dict: parameters of unit/update_sensor without itemId
+    """
+    return {
+        "id": sensor["id"],
+        "callMode": "create",
+        "unlink": 0,
+        **{key: sensor.get(key) for key in SENSOR_KEYS},
+    }
+
+
+def _prepare(tmp: dict) -> dict:
+    """Prepare request parameters from a template.
+
+    Args:
+        tmp (dict): template exported from wialon
+
+    Returns:
+        dict: {"sensors": [...], "report": {...}, "msg_filter": {...}}
+    """
+    report = tmp["reportProps"]
+    msg_filter = tmp["advProps"]["msgFilter"]
+    return {
+        "sensors": [_prepare_sensor(sensor) for sensor in tmp["sensors"]],
+        "report": {key: report.get(key) for key in REPORT_KEYS},
+        "msg_filter": {key: msg_filter.get(key) for key in FILTER_KEYS},
+    }
+
+
+def load_templates() -> None:
+    """Read and check all templates, build the registry."""
+    _templates.clear()
+    _registry.clear()
+    for file_name in sorted(os.listdir(TEMPLATE_DIR)):
+        if not file_name.endswith(".json"):
+            continue
+        name = file_name[: -len(".json")]
+        try:
+            with open(os.path.join(TEMPLATE_DIR, file_name), "r") as f:
+                _templates[name] = _prepare(json.loads(f.read()))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"шаблон {file_name} не загружен: {e!r}")
+    for fms, hardware in HW_TMP.items():
+        for hardware_id, names in hardware.items():
+            for variant, name in enumerate(names):
+                if name not in _templates:
+                    logger.error(f"шаблон {name} для FMS {fms} не найден")
+                    continue
+                _registry[(fms, hardware_id, variant)] = _templates[name]
+    logger.debug(f"загружено шаблонов: {len(_templates)}")
+
+
+def template_variant(tmp_name: str, hware_name: str, count: int) -> int:
+    """Number of the template in the HW_TMP list.
+
+    Args:
+        tmp_name (str): configuration template from the uploaded file
+        hware_name (str): hardware name
+        count (int): number of templates of the hardware
+
+    Returns:
+        int: index of the template
+    """
+    if hware_name == "Cesar 25":
+        return count - 1
+    if "отрыв" in tmp_name:
+        return 0
+    if "фото" in tmp_name:
+        return 1
+    if "1wire" in tmp_name:
+        return 2
+    return 0
+
+
+def get_template(fms: int, hardware_id: int, tmp_name: str, hware_name: str) -> dict:
+    """Get prepared parameters of the template.
+
+    Args:
+        fms (int): server number
+        hardware_id (int): hardware id
+        tmp_name (str): configuration template
+        hware_name (str): hardware name
+
+    Returns:
+        dict: {"sensors": [...], "report": {...}, "msg_filter": {...}}
+
+    Raises:
+        KeyError: template for the hardware is not found
+    """
+    variant = template_variant(tmp_name, hware_name, len(HW_TMP[fms][hardware_id]))
+    return _registry[(fms, hardware_id, variant)]
+
+
+def template_unit(
+    fms: int, hardware_id: int, tmp_name: str, hware_name: str
+) -> int | None:
+    """Find the template unit of the hardware.
+
+    Args:
+        fms (int): server number
+        hardware_id (int): hardware id
+        tmp_name (str): configuration template
+        hware_name (str): hardware name
+
+    Returns:
+        int | None: id of the template unit, None if it is not set
+    """
+    units = TEMPLATE_UNITS.get(fms, {}).get(hardware_id)
+    if not units:
+        return None
+    variant = template_variant(tmp_name, hware_name, len(HW_TMP[fms][hardware_id]))
+    return units[variant] if variant < len(units) else None
+
+
+def get_sensors(
+    sid: str,
+    URL: str,
+    fms: int,
+    hardware_id: int,
+    tmp_name: str,
+    hware_name: str,
+) -> list[dict]:
+    """Get sensors for a new object.
+
+    Sensors of the template unit are requested with core/search_item
+    on the first call and cached. Without a template unit the sensors
+    of the data_tmp template are returned.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+        hardware_id (int): hardware id
+        tmp_name (str): configuration template
+        hware_name (str): hardware name
+
+    Returns:
+        list[dict]: parameters of unit/update_sensor without itemId
+
+    Raises:
+        KeyError: template for the hardware is not found
+    """
+    unit_id = template_unit(fms, hardware_id, tmp_name, hware_name)
+    if unit_id is None:
+        return get_template(fms, hardware_id, tmp_name, hware_name).get("sensors")
+    key = (URL, unit_id)
+    with _unit_sensors_lock:
+        if key in _unit_sensors:
+            return _unit_sensors[key]
+    # the unit is read without the lock, lookups of other templates do
+    # not wait for the server, a concurrent first read stores the same
+    param = {
+        "svc": "core/search_item",
+        "params": json.dumps({"id": unit_id, "flags": 0x1000}),
+        "sid": sid,
+    }
+    response = post(URL, data=param).json()
+    if "item" not in response:
+        logger.error(f"шаблонный объект {unit_id} не получен: {response}")
+        return get_template(fms, hardware_id, tmp_name, hware_name).get("sensors")
+    sensors = [
+        _prepare_sensor(sensor)
+        for sensor in sorted(
+            response["item"].get("sens", {}).values(), key=lambda x: x["id"]
+        )
+    ]
+    with _unit_sensors_lock:
+        sensors = _unit_sensors.setdefault(key, sensors)
+    logger.debug(f"датчики шаблонного объекта {unit_id}: {len(sensors)}")
+    return sensors
+
+load_templates()
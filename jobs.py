@@ -0,0 +1,373 @@
+"""Queue of background jobs.
+
+An upload is saved to the instance folder and written as a job to an
+SQLite queue, the page gets the job id at once. JOB_WORKERS threads
+take queued jobs one by one and run the handler registered for the
+kind of the job, so several uploads run side by side and the request
+threads of the web server stay free. A claimed job keeps the host and
+pid of its process and a heartbeat renewed while the process lives.
+A running job is queued again only when its process is gone or its
+heartbeat is older than JOB_STALE, so jobs of another live process
+sharing the queue are not run twice.
+
+While a job runs its progress is kept in memory, when the job ends
+the last snapshot of the progress is saved with the job.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable
+
+from config import app, fstart_stop, logger
+from constant import JOB_HEARTBEAT, JOB_POLL, JOB_STALE, JOB_WORKERS
+from progress import JobProgress
+from tools import count_rows
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+HOST = socket.gethostname()
+
+# kind of the job -> handler, the handler returns the report
+_handlers: dict[str, Callable[[dict], str]] = {}
+_workers: list[threading.Thread] = []
+# job id -> progress of the running job
+_progress: dict[int, JobProgress] = {}
+_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def jobs_path() -> str:
+    """Path of the queue file in the instance folder."""
+    return os.path.join(app.instance_path, "jobs.db")
+
+
+def upload_path(filename: str) -> str:
+    """Unique path for the uploaded file of a job.
+
+    Args:
+        filename (str): secure name of the uploaded file
+
+    Returns:
+        str: path in the upload folder of the instance
+    """
+    folder = os.path.join(app.instance_path, "upload")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{uuid.uuid4().hex}_{filename}")
+
+
+def _connect() -> sqlite3.Connection:
+    """Open the queue, create the table if necessary.
+
+    Returns:
+        sqlite3.Connection: connection to the queue
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    connection = sqlite3.connect(jobs_path(), timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            fms INTEGER,
+            path TEXT,
+            filename TEXT,
+            email TEXT,
+            status TEXT,
+            created REAL,
+            started REAL,
+            finished REAL,
+            report TEXT,
+            progress TEXT,
+            mode TEXT,
+            owner TEXT,
+            heartbeat REAL
+        )"""
+    )
+    columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+    for column, kind in (
+        ("progress", "TEXT"),
+        ("mode", "TEXT"),
+        ("owner", "TEXT"),
+        ("heartbeat", "REAL"),
+    ):
+        if column not in columns:
+            connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+    return connection
+
+
+def job_owner() -> str:
+    """Owner of the jobs claimed by this process, 'host:pid'."""
+    return f"{HOST}:{os.getpid()}"
+
+
+def _owner_alive(owner: str | None) -> bool:
+    """Check the process of the owner, only on this host.
+
+    Args:
+        owner (str | None): owner of the job, see job_owner
+
+    Returns:
+        bool: False if the process is gone, True if it lives or
+        runs on another host
+    """
+    host, _, pid = (owner or "").rpartition(":")
+    if host != HOST or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def job_message(job: dict, message: str) -> str:
+    """Template log message of a job.
+
+    Args:
+        job (dict): job
+        message (str): log message
+
+    Returns:
+        str: log message in format 'job id - email - kind - message'
+    """
+    return f'задача {job["id"]} - {job["email"]} - {job["kind"]} - {message}'
+
+
+def register(kind: str, handler: Callable[[dict], str]) -> None:
+    """Register the handler of a kind of jobs.
+
+    Args:
+        kind (str): kind of the job
+        handler (Callable[[dict], str]): function of the job, returns the report
+    """
+    _handlers[kind] = handler
+
+
+@fstart_stop
+@logger.catch
+def submit_job(
+    kind: str, fms: int, path: str, filename: str, email: str, mode: str = "apply"
+) -> int:
+    """Put a job to the queue.
+
+    Args:
+        kind (str): kind of the job
+        fms (int): server number
+        path (str): path of the uploaded file
+        filename (str): name of the uploaded file
+        email (str): address for the report
+        mode (str): mode of the job, see MODES
+
+    Returns:
+        int: job id
+    """
+    connection = _connect()
+    with connection:
+        job_id = connection.execute(
+            """INSERT INTO jobs
+            (kind, fms, path, filename, email, status, created, mode)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (kind, fms, path, filename, email, QUEUED, time.time(), mode),
+        ).lastrowid
+    connection.close()
+    logger.info(f"задача {job_id} ({kind}, FMS {fms}, {filename}) поставлена в очередь")
+    start_workers()
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id: int) -> dict | None:
+    """Get a job.
+
+    Args:
+        job_id (int): job id
+
+    Returns:
+        dict | None: job, None if there is no such job
+    """
+    connection = _connect()
+    row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    connection.close()
+    return dict(row) if row is not None else None
+
+
+def _claim() -> dict | None:
+    """Take the oldest queued job and mark it as running."""
+    with _lock:
+        connection = _connect()
+        row = connection.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is None:
+            connection.close()
+            return None
+        started = time.time()
+        owner = job_owner()
+        with connection:
+            # another process may take the same job between the queries
+            claimed = connection.execute(
+                """UPDATE jobs SET status = ?, started = ?, owner = ?, heartbeat = ?
+                WHERE id = ? AND status = ?""",
+                (RUNNING, started, owner, started, row["id"], QUEUED),
+            ).rowcount
+        connection.close()
+    if not claimed:
+        return None
+    return dict(
+        row, status=RUNNING, started=started, owner=owner, heartbeat=started
+    )
+
+
+def job_progress(job: dict) -> dict | None:
+    """Progress of the job.
+
+    Args:
+        job (dict): job, see get_job
+
+    Returns:
+        dict | None: snapshot of JobProgress, None if the job has not started
+    """
+    progress = _progress.get(job["id"])
+    if progress is not None:
+        return progress.snapshot()
+    return json.loads(job["progress"]) if job.get("progress") else None
+
+
+def _finish(job: dict, status: str, report: str) -> None:
+    progress = _progress.get(job["id"])
+    connection = _connect()
+    with connection:
+        connection.execute(
+            """UPDATE jobs SET status = ?, finished = ?, report = ?, progress = ?
+            WHERE id = ?""",
+            (
+                status,
+                time.time(),
+                report,
+                json.dumps(progress.snapshot() if progress else None),
+                job["id"],
+            ),
+        )
+    connection.close()
+    _progress.pop(job["id"], None)
+
+
+def run_job(job: dict) -> None:
+    """Run the handler of the job and save the result.
+
+    The handler gets the progress of the job in job["progress"].
+
+    Args:
+        job (dict): running job
+    """
+    logger.info(job_message(job, "старт задачи"))
+    job["progress"] = _progress[job["id"]] = JobProgress()
+    try:
+        job["progress"].total = count_rows(job["path"])
+        report = _handlers[job["kind"]](job)
+        _finish(job, DONE, report)
+        logger.info(job_message(job, "задача выполнена"))
+    except Exception as e:
+        logger.exception(job_message(job, f"задача завершилась с ошибкой: {e!r}"))
+        _finish(job, FAILED, f"Ошибка обработки файла: {e!r}")
+    if os.path.exists(job["path"]):
+        os.remove(job["path"])
+
+
+def requeue_lost(own: bool = False) -> int:
+    """Queue again running jobs whose process is gone.
+
+    A job is lost if its owner is a dead process of this host or its
+    heartbeat is older than JOB_STALE.
+
+    Args:
+        own (bool): jobs with the owner of this process are lost too,
+        at the start they belong to a previous process with the same pid
+
+    Returns:
+        int: number of queued jobs
+    """
+    connection = _connect()
+    rows = connection.execute(
+        "SELECT id, owner, heartbeat FROM jobs WHERE status = ?", (RUNNING,)
+    ).fetchall()
+    stale = time.time() - JOB_STALE
+    lost = [
+        row["id"]
+        for row in rows
+        if (row["heartbeat"] or 0) < stale
+        or not _owner_alive(row["owner"])
+        or (own and row["owner"] == job_owner())
+    ]
+    with connection:
+        for job_id in lost:
+            connection.execute(
+                """UPDATE jobs SET status = ?, started = NULL, owner = NULL
+                WHERE id = ? AND status = ?""",
+                (QUEUED, job_id, RUNNING),
+            )
+    connection.close()
+    if lost:
+        logger.info(f"возвращено в очередь прерванных задач: {len(lost)}")
+    return len(lost)
+
+
+def _heartbeat_loop() -> None:
+    while True:
+        try:
+            connection = _connect()
+            with connection:
+                connection.execute(
+                    "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?",
+                    (time.time(), job_owner(), RUNNING),
+                )
+            connection.close()
+            requeue_lost()
+        except sqlite3.Error as e:
+            logger.error(f"отметка выполняемых задач не сохранена: {e}")
+        time.sleep(JOB_HEARTBEAT)
+
+
+def _worker_loop() -> None:
+    while True:
+        _wakeup.clear()
+        job = _claim()
+        if job is None:
+            _wakeup.wait(JOB_POLL)
+            continue
+        run_job(job)
+
+
+def start_workers() -> None:
+    """Start the workers once, queue again jobs interrupted by a restart.
+
+    The heartbeat thread marks the jobs of this process and queues
+    again lost jobs of other processes, see requeue_lost.
+    """
+    with _lock:
+        if _workers:
+            return
+        requeue_lost(own=True)
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop, name="job-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        _workers.append(heartbeat)
+        for number in range(JOB_WORKERS):
+            worker = threading.Thread(
+                target=_worker_loop, name=f"job-worker-{number}", daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
@@ -7,37 +7,19 @@ Run browser and run all project for export data object to Gurtam.
 import os
 from datetime import datetime
 from functools import wraps
-from time import gmtime, strftime
 
 from flask import flash, jsonify, redirect, render_template, url_for
 from flask_login import current_user, login_required, login_user, logout_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 
+import tasks  # noqa: F401 registers the handlers of the jobs
 from config import app, db, log_message, logger, login_manager
-from constant import TOKEN, URL, lgroup
-from engine import (
-    check_admin_fields,
-    create_object,
-    fill_info,
-    get_object_id,
-    get_ssid,
-    group_update,
-    id_fields,
-    upd_inn_field,
-    update_object_name,
-    update_param,
-)
+from constant import UPDATE_MODES, lgroup
 from forms import SigninForm, UploadFile, UserForm
+from jobs import get_job, job_progress, start_workers, submit_job, upload_path
 from models import User
-from tools import (
-    get_diff_in_upload_file,
-    is_xlsx,
-    read_json,
-    send_mail,
-    update_bd,
-    xls_to_json,
-)
+from tools import is_xlsx, read_xlsx
 
 
 @login_manager.user_loader
@@ -382,16 +364,15 @@ def export_fms4():
     buttons for sending the file for processing.
     Right there, just below the form, there is a description field
     with a hint about which file can and should be uploaded here.
-    The function will convert the excel file into json then into a dictionary.
     The function checks if the file is suitable for processing by the main
     script, if not, then it reports an error to the user.
-    Next, the data from the dictionary is uploaded to the wialon server.
-    When the download is completed, the user will be redirected to a page with
-    a report on the data upload to the server.
-    At the same time, the user will receive an email with the same report.
+    Next, the file is put to the queue of background jobs and the user
+    is redirected to the page of the job. When the job is done, the page
+    shows the report, at the same time the user receives an email with
+    the same report.
 
     Returns:
-        display page export_fms4.html
+        display page export_fms4.html or redirect to the job page
     """
     form = UploadFile()
     logger.info(log_message(f"экспорт на Виалон FMS {form.fms.data}"))
@@ -406,23 +387,23 @@ def export_fms4():
             return render_template(
                 "export_fms4.html", form=form, logged_in=current_user.is_authenticated
             )
-        logger.info(filename)
-        form.export_file.data.save("upload/{0}".format(filename))
-        file_path = xls_to_json("upload/{0}".format(filename))
-        import_list = read_json(file_path)
+        path = upload_path(filename)
+        form.export_file.data.save(path)
+        rows = read_xlsx(path)
+        first = next(rows, None)
+        rows.close()
         headers = {"Инфо4", "ДЛ", "Пин"}
 
-        if len(import_list) < 1:
+        if first is None:
             flash(message="Файл пуст")
             logger.info(log_message("Файл пустой"))
-            os.remove(f"upload/{filename}")
-            os.remove(f"{file_path}.json")
+            os.remove(path)
             return render_template(
                 "export_fms4.html", form=form, logged_in=current_user.is_authenticated
             )
 
         for header in headers:
-            if header not in import_list[0]:
+            if header not in first:
                 flash(
                     message="""Ошибка иморта. Необходимые данные не находятся на
              первом листе или не соответвуют шаблону"""
@@ -432,67 +413,23 @@ def export_fms4():
                         "данные в загружаемом файле на соответсвуют необходимому формату. Загружаемый файл удалён."
                     )
                 )
-                os.remove(f"upload/{filename}")
-                os.remove(f"{file_path}.json")
+                os.remove(path)
                 return render_template(
                     "export_fms4.html",
                     form=form,
                     logged_in=current_user.is_authenticated,
                 )
 
-        fms = int(form.fms.data)
-
-        url = URL[fms]
-        sid = get_ssid(url, TOKEN[fms])
-        start = datetime.now()
-        counter = 0
-        with open(f'logging/{import_list[0].get("ЛИЗИНГ")}', "w") as log:
-            log.write(f"Время начала: {start.ctime()}\n")
-            log.write(f'экспорт по компании: {import_list[0].get("ЛИЗИНГ")}\n')
-            log.write("Не был найден на виалон, возможно мастер не звонил:\n")
-        logger.info(
-            log_message(f'начало загрузки на виалон {import_list[0].get("ЛИЗИНГ")}')
+        job_id = submit_job(
+            "export",
+            int(form.fms.data),
+            path,
+            filename,
+            current_user.email,
+            form.mode.data,
         )
-        for unit in import_list:
-            unit_id = get_object_id(sid, unit.get("geozone_imei"), url)
-            unit.update({"uid": unit_id})
-            logger.info(
-                log_message(f'Обновление полей объекта по ПИН {unit.get("Пин")}:{unit}')
-            )
-            if unit_id == -1:
-                try:
-                    new_id = create_object(sid, unit, url, fms)
-                    unit.update({"uid": new_id})
-                    update_param(sid, new_id, unit, id_fields(sid, new_id, url), url)
-                    counter += 1
-                except AttributeError:
-                    counter += 1
-            else:
-                update_param(
-                    sid, unit_id, unit, id_fields(sid, unit_id, url), url)
-                counter += 1
-        logger.info(log_message("загрузка завершена"))
-        logger.info(log_message("распределение объектов по группам"))
-        group_update(sid, import_list, url, fms)
-        logger.info(log_message("объекты распределены"))
-        logger.info(log_message("загрузка завершена"))
-        endtime = datetime.now()
-        delta_time = endtime - start
-        delta_time = strftime("%H:%M:%S", gmtime(delta_time.total_seconds()))
-        with open(f'logging/{import_list[0].get("ЛИЗИНГ")}', "a") as log:
-            log.write(f"Время окончания: {endtime.ctime()}\n")
-            log.write(f"Ушло времени на залив данных: {delta_time}\n")
-            log.write(f"Обработано строк: {counter}\n")
-            logger.info(log_message(f"обработано строк {counter}"))
-        os.remove(f"upload/{filename}")
-        os.remove(f"{file_path}.json")
-        with open(f'logging/{import_list[0].get("ЛИЗИНГ")}', "r") as report:
-            order = report.read()
-            user = User.query.filter_by(id=current_user.get_id()).first()
-            send_mail(user.email, "экспорт на виалон", order)
-            logger.info(log_message(f'отчёт отправлен на почту "{user.email}"'))
-            print(fms)
-        return render_template("order.html", order=order.split("\n"))
+        logger.info(log_message(f"загрузка {first.get('ЛИЗИНГ')}, задача {job_id}"))
+        return redirect(url_for("job_status", job_id=job_id))
     return render_template("export_fms4.html", form=form)
 
 
@@ -505,18 +442,19 @@ def update_info():
     Page update info display field for upload current xlsx file.
     If file is not correct, popup error text.
     First, the uploaded file is compared with the current state of the
-    database, the snapshot of the database is stored on the server in json
-    format.
+    database, the snapshot of the database is stored on the server as
+    hashes of the rows in an SQLite file, only changed rows are written.
     The data is updated in such fields as Info1, Info5, Info6, Info7.
     Where Инфо1 - РДДБ, Инфо5 - Специалист, Инфо6 - ИНН, Инфо7 - КПП.
-    When the download is complete, the user will be redirected to the page
-    with the report and the script will be sent. In parallel with this, the
-    script will send a letter to the user with the same report.
+    The file is processed by a background job, the user is redirected
+    to the page of the job with the report, and the same report is
+    sent to the user by email.
 
     Returns:
-        display update_info.html then the report page order.html
+        display update_info.html or redirect to the job page
     """
     form = UploadFile()
+    form.mode.choices = UPDATE_MODES
     logger.info(log_message("обновление полей инфо Каркаде"))
     if form.validate_on_submit():
         filename = secure_filename(form.export_file.data.filename)
@@ -528,75 +466,35 @@ def update_info():
             return render_template(
                 "update_info.html", form=form, logged_in=current_user.is_authenticated
             )
-        form.export_file.data.save("upload/{0}".format(filename))
-        file_path = xls_to_json("upload/{0}".format(filename))
-        new_file = read_json(file_path)
-        file_with_data = get_diff_in_upload_file(new_file)
-        if (
-            "РДДБ" not in file_with_data[0]
-            and "ИНН" not in file_with_data[0]
-            and "Специалист" not in file_with_data[0]
+        path = upload_path(filename)
+        form.export_file.data.save(path)
+        rows = read_xlsx(path)
+        first = next(rows, None)
+        rows.close()
+        if first is None or (
+            "РДДБ" not in first
+            and "ИНН" not in first
+            and "Специалист" not in first
         ):
             flash(
                 message="""Ошибка иморта. Необходимые данные не находятся на
              первом листе, не соответвуют шаблону или не в формате .XLSX"""
             )
-            os.remove(f"upload/{filename}")
-            os.remove(f"{file_path}.json")
+            os.remove(path)
             logger.info(log_message("данные в файле не соответсвуют формату"))
             return render_template(
                 "update_info.html", form=form, logged_in=current_user.is_authenticated
             )
-
-        fms = int(form.fms.data)
-
-        url = URL[fms]
-        sid = get_ssid(url, TOKEN[fms])
-        counter = 0
-        length = len(file_with_data)
-        start = datetime.now()
-        logger.info(log_message("старт обработки списка"))
-        with open("logging/update_info.log", "w") as log:
-            log.write(f"Начало загрузки: {start.ctime()}\n")
-        for unit in file_with_data:
-            try:
-                unit_id = get_object_id(sid, unit.get("IMEI"), url)
-            except TypeError:
-                with open("logging/update_info.log", "a") as log:
-                    log.write(f'{unit.get("IMEI")} не верный формат или не найден')
-                continue
-            if unit_id == -1:
-                with open("logging/update_info.log", "a") as log:
-                    log.write("{0} - не найден\n".format(unit.get("IMEI")))
-                    counter += 1
-            else:
-                id_info1 = check_admin_fields(sid, unit_id, "Инфо1", url)
-                id_info5 = check_admin_fields(sid, unit_id, "Инфо5", url)
-                id_info6 = check_admin_fields(sid, unit_id, "Инфо6", url)
-                id_info7 = check_admin_fields(sid, unit_id, "Инфо7", url)
-                id_value_list = [id_info1, id_info5, id_info6, id_info7]
-                fill_info(sid, unit_id, id_value_list, unit, url)
-                logger.info(log_message(f'{unit.get("IMEI")} - {id_value_list}'))
-                logger.debug(f"Готово {round(counter / length*100, 2)} %")
-                counter += 1
-        endtime = datetime.now()
-        delta_time = endtime - start
-        delta_time = strftime("%H:%M:%S", gmtime(delta_time.total_seconds()))
-        logger.info(log_message("обновление полей инфо завершено"))
-        with open("logging/update_info.log", "a") as log:
-            log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
-            log.write(f"Ушло времени на залив данных: {delta_time}\n")
-            log.write(f"Всего строк обработано: {counter} из {length}\n")
-            logger.info(log_message(f"обработано строк {counter} из {length}"))
-        update_bd(new_file)
-        os.remove(f"upload/{filename}")
-        os.remove(f"{file_path}.json")
-        with open("logging/update_info.log", "r") as report:
-            order = report.read()
-            user = User.query.filter_by(id=current_user.get_id()).first()
-            send_mail(user.email, "РДДБ обновление полей ИНФО", order)
-            logger.info(log_message(f'отчёт отправлен на почту "{user.email}"'))
-        return render_template("order.html", order=order.split("\n"))
+        job_id = submit_job(
+            "update_info",
+            int(form.fms.data),
+            path,
+            filename,
+            current_user.email,
+            form.mode.data,
+        )
+        logger.info(log_message(f"обновление полей инфо, задача {job_id}"))
+        return redirect(url_for("job_status", job_id=job_id))
     return render_template("update_info.html", form=form)
 
 
@@ -609,15 +507,16 @@ def fill_inn():
     Page update info display field for upload current xlsx file.
     If file is not correct, pop up error text.
     The data is create and updated field ИНН.
-    When the download is complete, the user will be redirected to the page
-    with the report and the script will be sent. In parallel with this, the
-    script will send a letter to the user with the same report.
+    The file is processed by a background job, the user is redirected
+    to the page of the job with the report, and the same report is
+    sent to the user by email.
 
     Returns:
-        display fill_inn.html then the report page order.html
+        display fill_inn.html or redirect to the job page
     """
     logger.info(log_message("обновить поле ИНН ГПБАЛ"))
     form = UploadFile()
+    form.mode.choices = UPDATE_MODES
     if form.validate_on_submit():
         filename = secure_filename(form.export_file.data.filename)
         if not is_xlsx(filename):
@@ -628,64 +527,31 @@ def fill_inn():
             return render_template(
                 "fill_inn.html", form=form, logged_in=current_user.is_authenticated
             )
-        form.export_file.data.save("upload/{0}".format(filename))
-        file_path = xls_to_json("upload/{0}".format(filename))
-        new_file = read_json(file_path)
-        if "ИНН" not in new_file[0] and "IMEI" not in new_file[0]:
+        path = upload_path(filename)
+        form.export_file.data.save(path)
+        rows = read_xlsx(path)
+        first = next(rows, None)
+        rows.close()
+        if first is None or ("ИНН" not in first and "IMEI" not in first):
             flash(
                 message="""Ошибка иморта. Необходимые данные не находятся на
              первом листе, не соответвуют шаблону или не в формате .XLSX"""
             )
-            os.remove(f"upload/{filename}")
-            os.remove(f"{file_path}.json")
+            os.remove(path)
             logger.info(log_message("данные в файле не соответвуют формату"))
             return render_template(
                 "fill_inn.html", form=form, logged_in=current_user.is_authenticated
             )
-        fms = int(form.fms.data)
-
-        url = URL[fms]
-        sid = get_ssid(url, TOKEN[fms])
-        counter = 0
-        length = len(new_file)
-        start = datetime.now()
-        logger.info(log_message("старт обновления полей ИНН"))
-        with open("logging/update_inn.log", "w") as log:
-            log.write(f"Начало загрузки: {start.ctime()}\n")
-        for unit in new_file:
-            try:
-                unit_id = get_object_id(sid, int(unit.get("IMEI")), url)
-            except TypeError:
-                with open("logging/update_inn.log", "a") as log:
-                    print("except but have ifelse bloco..")
-                    log.write(f'{unit.get("IMEI")} не верный формат или не найден')
-                continue
-            if unit_id == -1:
-                with open("logging/update_inn.log", "a") as log:
-                    log.write("{0} - не найден\n".format(unit.get("ИМЕЙ")))
-                    counter += 1
-            else:
-                id_inn_field = check_admin_fields(sid, unit_id, "ИНН", url)
-                upd_inn_field(sid, unit_id, id_inn_field[0], unit.get("ИНН"), url)
-                counter += 1
-                logger.info(log_message(f'{unit.get("IMEI")} - {unit.get("ИНН")}'))
-        endtime = datetime.now()
-        logger.info(log_message("обновление ИНН завершено"))
-        delta_time = endtime - start
-        delta_time = strftime("%H:%M:%S", gmtime(delta_time.total_seconds()))
-        with open("logging/update_inn.log", "a") as log:
-            log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
-            log.write(f"Ушло времени на залив данных: {delta_time}\n")
-            log.write(f"Всего строк обработано: {counter} из {length}\n")
-            logger.info(log_message(f"обработано строк {counter} из {length}"))
-        os.remove(f"upload/{filename}")
-        os.remove(f"{file_path}.json")
-        with open("logging/update_inn.log", "r") as report:
-            order = report.read()
-            user = User.query.filter_by(id=current_user.get_id()).first()
-            send_mail(user.email, "ГПБАЛ обновление полей ИНН", order)
-            logger.info(log_message(f'отчёт отправлен на почту "{user.email}"'))
-        return render_template("order.html", order=order.split("\n"))
+        job_id = submit_job(
+            "fill_inn",
+            int(form.fms.data),
+            path,
+            filename,
+            current_user.email,
+            form.mode.data,
+        )
+        logger.info(log_message(f"обновление полей ИНН, задача {job_id}"))
+        return redirect(url_for("job_status", job_id=job_id))
     return render_template("fill_inn.html", form=form)
 
 
@@ -697,16 +563,17 @@ def update_name():
     The page displays information explaining what extension is required for
     the file, what headers and data the file should contain.
     Contains a form for uploading a file and an 'Export' button.
-    The server receives the file and processes it, as a result of which the
-    object name on the vialon is changed to the corresponding one from the
-    file.
+    The server receives the file and puts it to the queue of background
+    jobs, the object name on the vialon is changed to the corresponding
+    one from the file.
     After processing, a report on the number of rows processed will be
-    displayed on the page.
+    displayed on the page of the job.
     If there are errors, objects not found, for example,
     then the report will contain a list of not found objects.
     """
     logger.info(log_message("Массовое переименовывание объектов"))
     form = UploadFile()
+    form.mode.choices = UPDATE_MODES
     if form.validate_on_submit():
         filename = secure_filename(form.export_file.data.filename)
         if not is_xlsx(filename):
@@ -717,68 +584,102 @@ def update_name():
             return render_template(
                 "rename_objects.html", form=form, logged_in=current_user.is_authenticated
             )
-        form.export_file.data.save("upload/{0}".format(filename))
-        file_path = xls_to_json("upload/{0}".format(filename))
-        new_file = read_json(file_path)
-        if "ДЛ" not in new_file[0] and "IMEI" not in new_file[0]:
+        path = upload_path(filename)
+        form.export_file.data.save(path)
+        rows = read_xlsx(path)
+        first = next(rows, None)
+        rows.close()
+        if first is None or ("ДЛ" not in first and "IMEI" not in first):
             flash(
                 message="""Ошибка иморта. Необходимые данные не находятся на
              первом листе, не соответвуют шаблону или не в формате .XLSX"""
             )
-            os.remove(f"upload/{filename}")
-            os.remove(f"{file_path}.json")
+            os.remove(path)
             logger.info(log_message("данные в файле не соответвуют формату"))
             return render_template(
                 "rename_objects.html", form=form, logged_in=current_user.is_authenticated
             )
-        fms = int(form.fms.data)
-
-        url = URL[fms]
-        sid = get_ssid(url, TOKEN[fms])
-        counter = 0
-        length = len(new_file)
-        start = datetime.now()
-        logger.info(log_message("старт обновления полей ДЛ"))
-        with open("logging/rename_objects.log", "w") as log:
-            log.write(f"Начало загрузки: {start.ctime()}\n")
-        for unit in new_file:
-            try:
-                unit_id = get_object_id(sid, int(unit.get("IMEI")), url)
-            except TypeError:
-                with open("logging/rename_objects.log", "a") as log:
-                    log.write(f'{unit.get("IMEI")} не верный формат или не найден')
-                continue
-            if unit_id == -1:
-                with open("logging/rename_objects.log", "a") as log:
-                    log.write("{0} - не найден\n".format(unit.get("IMEI")))
-                    counter += 1
-            else:
-                update_object_name(sid, url, unit_id, unit.get("ДЛ"))
-                counter += 1
-                logger.info(
-                    log_message(
-                        f'Новое имя для {unit.get("IMEI")} - {unit.get("ДЛ")}'))
-        endtime = datetime.now()
-        logger.info(log_message("обновление ДЛ завершено"))
-        delta_time = endtime - start
-        delta_time = strftime("%H:%M:%S", gmtime(delta_time.total_seconds()))
-        with open("logging/rename_objects.log", "a") as log:
-            log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
-            log.write(f"Ушло времени на залив данных: {delta_time}\n")
-            log.write(f"Всего строк обработано: {counter} из {length}\n")
-            logger.info(log_message(f"обработано строк {counter} из {length}"))
-        os.remove(f"upload/{filename}")
-        os.remove(f"{file_path}.json")
-        with open("logging/rename_objects.log", "r") as report:
-            order = report.read()
-            user = User.query.filter_by(id=current_user.get_id()).first()
-            send_mail(user.email, "Массовое переименование объектов", order)
-            logger.info(
-                log_message(f'отчёт отправлен на почту "{user.email}"'))
-        return render_template("order.html", order=order.split("\n"))
+        job_id = submit_job(
+            "rename_object",
+            int(form.fms.data),
+            path,
+            filename,
+            current_user.email,
+            form.mode.data,
+        )
+        logger.info(log_message(f"обновление полей ДЛ, задача {job_id}"))
+        return redirect(url_for("job_status", job_id=job_id))
     return render_template("rename_objects.html", form=form)
 
 
+def user_job(job_id: int) -> dict | None:
+    """Get a job of the current user.
+
+    The admin sees jobs of all users.
+
+    Args:
+        job_id(int): job id
+
+    Returns:
+        dict | None: job, None if there is no such job of the user
+    """
+    job = get_job(job_id)
+    if job is None or (
+        job["email"] != current_user.email and current_user.get_id() != str(1)
+    ):
+        logger.info(log_message(f"задача {job_id} не найдена"))
+        return None
+    return job
+
+
+@app.route("/job/<int:job_id>")
+@login_required
+@logger.catch
+def job_status(job_id: int):
+    """Job page.
+
+    Shows the state of a background job. While the job is queued or
+    running the page polls /job/<job_id>/progress and shows rows done,
+    speed, time left and time of every stage. When the job is done
+    the page shows the report.
+
+    Args:
+        job_id(int): job id
+
+    Returns:
+        display job.html
+    """
+    job = user_job(job_id)
+    if job is None:
+        return render_template("404.html"), 404
+    logger.debug(log_message(f"задача {job_id}: {job['status']}"))
+    order = (job["report"] or "").split("\n")
+    return render_template(
+        "job.html", job=job, order=order, progress=job_progress(job)
+    )
+
+
+@app.route("/job/<int:job_id>/progress")
+@login_required
+@logger.catch
+def job_status_progress(job_id: int):
+    """Progress of a job.
+
+    Args:
+        job_id(int): job id
+
+    Returns:
+        json: {"id", "status", "progress": {"done", "total", "errors",
+        "rate", "elapsed", "eta", "stages"}}
+    """
+    job = user_job(job_id)
+    if job is None:
+        return jsonify({"error": "задача не найдена"}), 404
+    return jsonify(
+        {"id": job["id"], "status": job["status"], "progress": job_progress(job)}
+    )
+
+
 @app.route("/logout")
 @login_required
 def logout():
@@ -874,5 +775,6 @@ with app.app_context():
 
 if __name__ == "__main__":
     logger.info(f"запуск сервера {app}")
+    start_workers()
     app.run(host="0.0.0.0", port=5000)
     logger.info("сервер остановлен")
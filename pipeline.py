@@ -0,0 +1,668 @@
+"""Bulk processing of uploaded rows.
+
+The work with wialon is I/O bound, so rows of a job are processed
+by a pool of threads. The number of simultaneous rows for every
+server is limited by WORKERS, the limit is shared by all jobs
+running against the same FMS.
+
+Export runs in two stages: objects missing on wialon are created first
+by a separate pool of CREATE_WORKERS threads, then the cards of the
+objects that already existed are updated.
+
+Large files are processed in chunks of CHUNK_SIZE rows: reading,
+resolving and updating run at the same time on different chunks,
+so work on wialon starts before the file is read to the end.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from batch import BatchCoalescer
+from config import fstart_stop, logger
+from constant import CHUNK_SIZE, CREATE_WORKERS, QUEUE_DEPTH, WORKERS
+from engine import (
+    INFO_FIELDS,
+    card_diff,
+    card_requests,
+    check_admin_fields,
+    check_admin_fields_list,
+    find_units,
+    get_cards,
+    get_unit_id,
+    id_fields,
+    info_requests,
+    inn_field_request,
+    normalize_imei,
+    object_name_request,
+    preload_fields,
+    provision_object,
+    remember_card,
+)
+from hardware import get_hardware_id, hardware_name
+from progress import JobProgress, stage
+from sessions import get_sids
+
+_fms_slots = {
+    fms: threading.BoundedSemaphore(workers) for fms, workers in WORKERS.items()
+}
+# objects created at the same time on the server by all jobs
+_create_slots = {
+    fms: threading.BoundedSemaphore(workers)
+    for fms, workers in CREATE_WORKERS.items()
+}
+
+
+def run_units(func: Callable, units: Iterable, fms: int) -> list:
+    """Process rows concurrently.
+
+    Args:
+        func (Callable): function processing one row
+        units (Iterable): rows of the uploaded file
+        fms (int): server number
+
+    Returns:
+        list: results of func in the order of the rows
+    """
+    slots = _fms_slots[fms]
+
+    def limited(unit):
+        with slots:
+            return func(unit)
+
+    with ThreadPoolExecutor(max_workers=WORKERS[fms]) as executor:
+        return list(executor.map(limited, units))
+
+
+@logger.catch
+def create_unit(sid: str, unit: dict, url: str, fms: int) -> dict:
+    """Create one object together with its card.
+
+    Args:
+        sid (str): session id
+        unit (dict): row of the uploaded file
+        url (str): server address
+        fms (int): server number
+
+    Returns:
+        dict: {"uid": object id, -1 if the object is not created,
+        "errors": [error codes of the creation and the setup]}
+    """
+    logger.info(f'Создание объекта по ПИН {unit.get("Пин")}:{unit}')
+    result = provision_object(sid, unit, url, fms) or {}
+    new_id = result.get("uid", -1)
+    if new_id == -1:
+        logger.error(f'объект {unit.get("geozone_imei")} не создан')
+    errors = [code for codes in result.get("errors", {}).values() for code in codes]
+    return {"uid": new_id, "errors": errors or ([-1] if new_id == -1 else [])}
+
+
+@fstart_stop
+def create_units(
+    units: list[dict], url: str, fms: int, imei_map: dict[str, int]
+) -> dict[int, dict]:
+    """Create all objects of the file that are missing on wialon.
+
+    Missing rows are collected first, only the first row of an imei
+    creates the object, the other rows of the imei are updated later.
+    The rows are grouped by hardware and configuration template, a group
+    with unknown hardware is skipped as a whole. Objects are created by
+    CREATE_WORKERS threads, every thread gets its own session from the
+    pool. Objects created by all jobs on one server at the same time are
+    limited by CREATE_WORKERS too. Imeis missing in the dictionary are
+    searched on wialon by part of the imei first, found objects are
+    added to imei_map and not created. Without a session every missing
+    row gets the error -1.
+
+    Args:
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        fms (int): server number
+        imei_map (dict): {imei: object id}, new objects are added to it
+
+    Returns:
+        dict[int, dict]: {row number: result of create_unit}
+    """
+    missing = {}
+    for number, unit in enumerate(units):
+        if get_unit_id(imei_map, unit.get("geozone_imei")) == -1:
+            missing.setdefault(normalize_imei(unit.get("geozone_imei")), number)
+    if not missing:
+        return {}
+    sids = get_sids(fms, min(CREATE_WORKERS[fms], len(missing)))
+    if not sids:
+        logger.error(f"FMS {fms}: нет сессии, объекты не созданы: {len(missing)}")
+        return {number: {"uid": -1, "errors": [-1]} for number in missing.values()}
+    searched = [imei for imei in missing if imei.isdigit()]
+    if searched:
+        # the stored imei may have extra characters, such objects are
+        # found by part of the imei as before the imei dictionary
+        found = find_units(sids[0], searched, url) or {}
+        for imei, uid in found.items():
+            imei_map[imei] = uid
+            del missing[imei]
+    groups = defaultdict(list)
+    for number in missing.values():
+        unit = units[number]
+        groups[(hardware_name(unit), unit.get("ШАБЛОН КОНФИГУРАЦИИ"))].append(number)
+    pending = []
+    created = {}
+    for (hware, tmp_name), group in groups.items():
+        logger.info(f"{hware}, шаблон {tmp_name}: создаётся объектов {len(group)}")
+        if get_hardware_id(units[group[0]], fms) == -1:
+            created.update({number: {"uid": -1, "errors": [-1]} for number in group})
+            continue
+        pending.extend(group)
+    if not pending:
+        return created
+
+    slots = _create_slots[fms]
+
+    def create(row):
+        with slots:
+            return create_unit(sids[row[0] % len(sids)], units[row[1]], url, fms)
+
+    with ThreadPoolExecutor(max_workers=min(len(sids), len(pending))) as executor:
+        results = executor.map(create, enumerate(pending))
+        for number, result in zip(pending, results):
+            created[number] = result or {"uid": -1, "errors": [-1]}
+            if created[number]["uid"] != -1:
+                imei = normalize_imei(units[number].get("geozone_imei"))
+                imei_map[imei] = result["uid"]
+    logger.info(
+        f"создано объектов: "
+        f"{sum(result['uid'] != -1 for result in created.values())} из {len(created)}"
+    )
+    return created
+
+
+@fstart_stop
+def resolve_units(
+    units: list[dict],
+    url: str,
+    fms: int,
+    imei_map: dict[str, int],
+    progress: JobProgress | None = None,
+) -> list[tuple[dict, dict | None]]:
+    """Find or create the objects of the rows.
+
+    Missing objects are created with create_units. The id of the object
+    is written to "uid" of every row for the update and group stages.
+
+    Args:
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        fms (int): server number
+        imei_map (dict): {imei: object id}
+        progress (JobProgress | None): progress of the job for stage timings
+
+    Returns:
+        list[tuple]: (row, result) in the order of the rows, result is
+        None for the rows whose card is to be updated
+    """
+    with stage(progress, "create"):
+        created = create_units(units, url, fms, imei_map)
+    resolved = []
+    with stage(progress, "resolve"):
+        for number, unit in enumerate(units):
+            if number in created:
+                unit.update({"uid": created[number]["uid"]})
+                resolved.append((unit, dict(created[number], created=True)))
+                continue
+            unit.update({"uid": get_unit_id(imei_map, unit.get("geozone_imei"))})
+            if unit.get("uid") == -1:
+                resolved.append((unit, {"uid": -1, "created": False}))
+            else:
+                resolved.append((unit, None))
+    return resolved
+
+
+@fstart_stop
+def update_units(
+    resolved: list[tuple[dict, dict | None]],
+    url: str,
+    fms: int,
+    progress: JobProgress | None = None,
+    reconcile: bool = False,
+) -> list[tuple[dict, dict]]:
+    """Update the cards of the objects found by resolve_units.
+
+    Fields of the objects are loaded into the cache with core/batch
+    first, missing fields are created by the workers. In the reconcile
+    mode the whole cards are read instead and only values that differ
+    from the row are sent. The requests of all cards are spread over the
+    sessions of the pool, every session sends its part with core/batch
+    of BATCH_SIZE requests at the same time as the others. Without a
+    session every row gets the error -1.
+
+    Args:
+        resolved (list[tuple]): result of resolve_units
+        url (str): server address
+        fms (int): server number
+        progress (JobProgress | None): progress of the job for stage timings
+        reconcile (bool): send only changed values
+
+    Returns:
+        list[tuple]: (row, {"uid": object id, "created": True if the
+        object was created, "sent": number of sent requests, "errors":
+        [error codes]}) in the order of the rows
+    """
+    existing = [
+        number for number, (_, result) in enumerate(resolved) if result is None
+    ]
+    results = [result for _, result in resolved]
+    sids = get_sids(fms, WORKERS[fms]) if existing else []
+    if existing and not sids:
+        logger.error(f"FMS {fms}: нет сессии, карточки не обновлены: {len(existing)}")
+        for number in existing:
+            unit_id = resolved[number][0].get("uid")
+            results[number] = {"uid": unit_id, "created": False, "errors": [-1]}
+        return [(unit, result) for (unit, _), result in zip(resolved, results)]
+    unit_ids = [resolved[number][0].get("uid") for number in existing]
+    cards = {}
+    with stage(progress, "fields"):
+        if reconcile:
+            cards = get_cards(sids[0], unit_ids, url) or {}
+        else:
+            preload_fields(sids[0], unit_ids, url)
+        field_ids = run_units(
+            lambda row: id_fields(sids[row[0] % len(sids)], row[1], url),
+            enumerate(unit_ids),
+            fms,
+        )
+    cards_sent = {}
+    for number, unit_id, ids in zip(existing, unit_ids, field_ids):
+        unit = resolved[number][0]
+        if ids is None:
+            results[number] = {"uid": unit_id, "created": False, "errors": [-1]}
+            continue
+        logger.info(f'Обновление полей объекта по ПИН {unit.get("Пин")}:{unit}')
+        requests_list = card_requests(unit_id, unit, ids)
+        if cards.get(unit_id) is not None:
+            requests_list = card_diff(requests_list, cards[unit_id])
+        cards_sent[number] = requests_list
+    # the cards are spread over the sessions, every session sends its
+    # part with core/batch in its own worker
+    parts = [[] for _ in sids]
+    for position, number in enumerate(cards_sent):
+        parts[position % len(sids)].append(number)
+
+    def send(part):
+        sid, numbers = part
+        with BatchCoalescer(sid, url) as coalescer:
+            for number in numbers:
+                for request in cards_sent[number]:
+                    coalescer.add(number, request.get("svc"), request.get("params"))
+        return coalescer
+
+    with stage(progress, "update"):
+        coalescers = run_units(send, zip(sids, parts), fms)
+    for part, coalescer in zip(parts, coalescers):
+        for number in part:
+            unit_id = resolved[number][0].get("uid")
+            errors = coalescer.errors.get(number, [])
+            if not errors:
+                remember_card(url, unit_id, cards_sent[number])
+            results[number] = {
+                "uid": unit_id,
+                "created": False,
+                "sent": len(cards_sent[number]),
+                "errors": errors,
+            }
+    logger.info(
+        "карточки обновлены, запросов core/batch: "
+        f"{sum(coalescer.requests_sent for coalescer in coalescers)}"
+    )
+    return [(unit, result) for (unit, _), result in zip(resolved, results)]
+
+
+@fstart_stop
+def export_units(
+    units: list[dict], url: str, fms: int, imei_map: dict[str, int]
+) -> list[dict]:
+    """Export all rows of the file to wialon.
+
+    Args:
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        fms (int): server number
+        imei_map (dict): {imei: object id}
+
+    Returns:
+        list[dict]: {"uid": object id, "created": True if the object
+        was created} in the order of the rows
+    """
+    resolved = resolve_units(units, url, fms, imei_map)
+    return [result for _, result in update_units(resolved, url, fms)]
+
+
+def chunked(rows: Iterable, size: int = CHUNK_SIZE) -> Iterator[list]:
+    """Split rows into lists of size rows.
+
+    Args:
+        rows (Iterable): rows of the uploaded file
+        size (int): number of rows in a chunk
+
+    Yields:
+        list: next chunk of rows
+    """
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class _Failure:
+    """Exception raised in a stage, passed on to the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+def _put(target: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(source: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_stages(
+    chunks: Iterable[list], *stages: Callable[[list], list], depth: int = QUEUE_DEPTH
+) -> Iterator[list]:
+    """Run chunks through the stages concurrently.
+
+    Reading of the chunks and every stage run in their own thread and
+    are connected by queues of depth chunks. While a stage processes
+    a chunk, the previous stage prepares the next one, and a fast stage
+    waits when the queue after it is full, so memory does not grow
+    with the size of the file. An exception of a stage stops
+    the pipeline and is raised to the consumer.
+
+    Args:
+        chunks (Iterable[list]): chunks of rows, see chunked
+        *stages (Callable[[list], list]): functions processing a chunk
+        depth (int): maximum number of chunks waiting between stages
+
+    Yields:
+        list: chunks processed by the last stage, in order
+    """
+    queues = [queue.Queue(maxsize=depth) for _ in range(len(stages) + 1)]
+    stop = threading.Event()
+
+    def feed():
+        try:
+            for chunk in chunks:
+                if not _put(queues[0], chunk, stop):
+                    return
+        except BaseException as e:
+            _put(queues[0], _Failure(e), stop)
+            return
+        _put(queues[0], _DONE, stop)
+
+    def work(stage, source, target):
+        while True:
+            item = _get(source, stop)
+            if item is _DONE or isinstance(item, _Failure):
+                _put(target, item, stop)
+                return
+            try:
+                item = stage(item)
+            except BaseException as e:
+                item = _Failure(e)
+            if not _put(target, item, stop) or isinstance(item, _Failure):
+                return
+
+    threads = [threading.Thread(target=feed, daemon=True)] + [
+        threading.Thread(target=work, args=(stage, source, target), daemon=True)
+        for stage, source, target in zip(stages, queues, queues[1:])
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def stream_export(
+    rows: Iterable[dict],
+    url: str,
+    fms: int,
+    imei_map: dict[str, int],
+    progress: JobProgress | None = None,
+    reconcile: bool = False,
+) -> Iterator[tuple[dict, dict]]:
+    """Export rows to wialon while the file is being read.
+
+    Rows go through read -> resolve_units -> update_units in chunks
+    of CHUNK_SIZE, see run_stages.
+
+    Args:
+        rows (Iterable[dict]): rows of the uploaded file
+        url (str): server address
+        fms (int): server number
+        imei_map (dict): {imei: object id}
+        progress (JobProgress | None): progress of the job for stage timings
+        reconcile (bool): send only values that differ from wialon
+
+    Yields:
+        tuple: (row, {"uid": object id, "created": True if the object
+        was created}) in the order of the rows
+    """
+    for chunk in run_stages(
+        chunked(rows),
+        lambda chunk: resolve_units(chunk, url, fms, imei_map, progress),
+        lambda chunk: update_units(chunk, url, fms, progress, reconcile),
+    ):
+        yield from chunk
+
+
+def stream_units(
+    rows: Iterable[dict], func: Callable[[list[dict]], list]
+) -> Iterator[tuple]:
+    """Process rows with func while the file is being read.
+
+    Args:
+        rows (Iterable[dict]): rows of the uploaded file
+        func (Callable): function processing a chunk of rows,
+        for example fill_inn_units or rename_units
+
+    Yields:
+        tuple: (row, result of func for the row) in the order of the rows
+    """
+    for chunk in run_stages(chunked(rows), lambda chunk: list(zip(chunk, func(chunk)))):
+        yield from chunk
+
+
+def resolve_imei(imei_map: dict[str, int], imei) -> int | None:
+    """Find object id by imei of the row.
+
+    Args:
+        imei_map (dict): {imei: object id}
+        imei: imei from the uploaded file
+
+    Returns:
+        int | None: object id, -1 if not found, None if imei is not a number
+    """
+    try:
+        return get_unit_id(imei_map, int(imei))
+    except (TypeError, ValueError):
+        return None
+
+
+def _batch_results(unit_ids: list, coalescer: BatchCoalescer) -> list[dict]:
+    return [
+        {"uid": unit_id, "errors": coalescer.errors.get(number, [])}
+        for number, unit_id in enumerate(unit_ids)
+    ]
+
+
+@fstart_stop
+def fill_inn_units(
+    sid: str,
+    units: list[dict],
+    url: str,
+    imei_map: dict[str, int],
+    progress: JobProgress | None = None,
+) -> list[dict]:
+    """Fill the field ИНН of all rows.
+
+    Fields of the found objects are loaded into the cache with core/batch,
+    then updates of many objects are sent in one core/batch. An object
+    whose field ИНН was not found or created gets the error -1.
+
+    Args:
+        sid (str): session id
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+        progress (JobProgress | None): progress of the job for stage timings
+
+    Returns:
+        list[dict]: {"uid": object id, -1 or None, "errors": [error codes]}
+        in the order of the rows
+    """
+    with stage(progress, "resolve"):
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in units]
+    with stage(progress, "fields"):
+        preload_fields(sid, [uid for uid in unit_ids if uid not in (None, -1)], url)
+        fields = {
+            number: check_admin_fields(sid, unit_id, "ИНН", url)
+            for number, unit_id in enumerate(unit_ids)
+            if unit_id not in (None, -1)
+        }
+    with stage(progress, "update"), BatchCoalescer(sid, url) as coalescer:
+        for number, field in fields.items():
+            if field is None:
+                continue
+            request = inn_field_request(
+                unit_ids[number], field[0], units[number].get("ИНН")
+            )
+            coalescer.add(number, request.get("svc"), request.get("params"))
+    logger.info(f"ИНН обновлены, запросов core/batch: {coalescer.requests_sent}")
+    results = _batch_results(unit_ids, coalescer)
+    for number, field in fields.items():
+        if field is None:
+            logger.error(f"поле ИНН объекта {unit_ids[number]} не получено")
+            results[number]["errors"] = [-1]
+    return results
+
+
+@fstart_stop
+def rename_units(
+    sid: str,
+    units: list[dict],
+    url: str,
+    imei_map: dict[str, int],
+    progress: JobProgress | None = None,
+) -> list[dict]:
+    """Rename objects of all rows.
+
+    Renames of many objects are sent in one core/batch.
+
+    Args:
+        sid (str): session id
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+        progress (JobProgress | None): progress of the job for stage timings
+
+    Returns:
+        list[dict]: {"uid": object id, -1 or None, "errors": [error codes]}
+        in the order of the rows
+    """
+    with stage(progress, "resolve"):
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in units]
+    with stage(progress, "update"), BatchCoalescer(sid, url) as coalescer:
+        for number, (unit, unit_id) in enumerate(zip(units, unit_ids)):
+            if unit_id in (None, -1):
+                continue
+            request = object_name_request(unit_id, unit.get("ДЛ"))
+            coalescer.add(number, request.get("svc"), request.get("params"))
+    logger.info(f"объекты переименованы, запросов core/batch: {coalescer.requests_sent}")
+    return _batch_results(unit_ids, coalescer)
+
+
+@fstart_stop
+def fill_info_units(
+    sid: str,
+    units: list[dict],
+    url: str,
+    imei_map: dict[str, int],
+    progress: JobProgress | None = None,
+) -> list[dict]:
+    """Fill the fields Инфо of all rows.
+
+    Fields of the found objects are loaded into the cache with core/batch
+    before the rows are processed, then updates of many objects are sent
+    in one core/batch.
+
+    Args:
+        sid (str): session id
+        units (list[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+        progress (JobProgress | None): progress of the job for stage timings
+
+    Returns:
+        list[dict]: {"uid": object id, -1 or None, "fields": [(field id,
+        value)], "errors": [error codes]} in the order of the rows
+    """
+    with stage(progress, "resolve"):
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in units]
+    with stage(progress, "fields"):
+        preload_fields(sid, [uid for uid in unit_ids if uid not in (None, -1)], url)
+        fields = {
+            number: check_admin_fields_list(
+                sid, unit_id, list(INFO_FIELDS.values()), url
+            )
+            for number, unit_id in enumerate(unit_ids)
+            if unit_id not in (None, -1)
+        }
+    requests_sent = {}
+    with stage(progress, "update"), BatchCoalescer(sid, url) as coalescer:
+        for number, unit_fields in fields.items():
+            if unit_fields is None:
+                continue
+            requests_sent[number] = info_requests(
+                unit_ids[number], unit_fields, units[number]
+            )
+            for request in requests_sent[number]:
+                coalescer.add(number, request.get("svc"), request.get("params"))
+    logger.info(f"поля Инфо обновлены, запросов core/batch: {coalescer.requests_sent}")
+    results = []
+    for number, unit_id in enumerate(unit_ids):
+        if number not in requests_sent:
+            errors = [] if unit_id in (None, -1) else [-1]
+            results.append({"uid": unit_id, "fields": [], "errors": errors})
+            continue
+        errors = coalescer.errors.get(number, [])
+        if not errors:
+            remember_card(url, unit_id, requests_sent[number])
+        results.append({"uid": unit_id, "fields": fields[number], "errors": errors})
+    return results
@@ -0,0 +1,360 @@
+"""Plan of a bulk job without writes to wialon.
+
+The current cards of the objects of the file are read with a few
+core/batch requests (see get_cards) and compared with the rows.
+For every row the plan says what the job would do: create, update,
+rename or add the object to groups, and counts the requests the job
+would send. Nothing is written to wialon, the field cache is filled
+from the cards as a side effect.
+"""
+
+from collections import Counter, defaultdict
+from math import ceil
+from typing import Iterable
+
+from constant import ADMIN_FIELDS, BATCH_SIZE, CUSTOM_FIELDS, FIELD_IDS, HW_ID
+from engine import (
+    GROUP_KEYS,
+    INFO_FIELDS,
+    card_diff,
+    card_requests,
+    field_requests,
+    get_cards,
+    get_unit_id,
+    group_requests,
+)
+from group_catalog import load_catalog
+from hardware import clone_requests, hardware_name, setup_requests
+from hw_templates import template_unit
+from pipeline import chunked, resolve_imei
+from snapshot import changed_rows
+
+CREATE = "создание"
+UPDATE = "обновление"
+RENAME = "переименование"
+REGROUP = "добавление в группы"
+UNCHANGED = "без изменений"
+NOT_FOUND = "не найден"
+NOT_CREATED = "не будет создан"
+INVALID = "ошибка в строке"
+
+# errors of the request builders on a row with missing or wrong values
+ROW_ERRORS = (AttributeError, KeyError, TypeError, ValueError)
+
+# names of the card requests without the field name
+REQUEST_NAMES = {
+    "item/update_name": "имя",
+    "unit/update_phone": "телефон",
+    "unit/update_mileage_counter": "пробег",
+    "unit/update_eh_counter": "моточасы",
+}
+
+
+class Plan:
+    """Changes a job would make on wialon.
+
+    Attributes:
+        actions (list[tuple[str, str, str]]): (imei, action, details)
+        of every row with changes, in the order of the rows
+        counts (Counter): number of rows by action
+        requests (int): requests to the services of wialon, including
+        the requests inside core/batch
+        calls (int): http requests to the server
+        unchanged (int): requests of them that send the current values,
+        the reconcile mode of /export does not send them
+    """
+
+    def __init__(self):
+        self.actions = []
+        self.counts = Counter()
+        self.requests = 0
+        self.calls = 0
+        self.unchanged = 0
+
+    def add(self, imei, action: str, details: str = "") -> None:
+        """Add the action of a row.
+
+        Args:
+            imei: imei of the row
+            action (str): action, for example CREATE
+            details (str): what exactly changes
+        """
+        self.counts[action] += 1
+        if action != UNCHANGED:
+            self.actions.append((str(imei), action, details))
+
+    def budget(self, requests: int, calls: int = 1) -> None:
+        """Add requests the job would send.
+
+        Args:
+            requests (int): requests to the services of wialon
+            calls (int): http requests
+        """
+        if requests:
+            self.requests += requests
+            self.calls += calls
+
+
+def _field_ids(card: dict) -> dict[str, int]:
+    """{field name: field id} of the admin and custom fields of the card."""
+    return {
+        field.get("n"): field.get("id")
+        for kind in ("aflds", "flds")
+        for field in card.get(kind, {}).values()
+    }
+
+
+def _admin_field(card: dict, name: str) -> dict | None:
+    """Admin field of the card found the same way as check_admin_fields."""
+    for field in card.get("aflds", {}).values():
+        if name in field.get("n"):
+            return field
+    return None
+
+
+def _request_name(request: dict) -> str:
+    return request["params"].get("n") or REQUEST_NAMES.get(request["svc"], "")
+
+
+def plan_export(
+    sid: str,
+    rows: Iterable[dict],
+    url: str,
+    fms: int,
+    imei_map: dict[str, int],
+    group_only: list[dict] | None = None,
+) -> Plan:
+    """Plan of the /export job.
+
+    Args:
+        sid (str): session id
+        rows (Iterable[dict]): rows of the uploaded file
+        url (str): server address
+        fms (int): server number
+        imei_map (dict): {imei: object id}
+        group_only (list[dict] | None): rows skipped by the checkpoint,
+        they are only distributed to groups
+
+    Returns:
+        Plan: plan of the job
+    """
+    plan = Plan()
+    group_rows = []
+    imeis = {}
+    new = set()
+    for chunk in chunked(rows):
+        existing = {}
+        for number, unit in enumerate(chunk):
+            imei = str(unit.get("geozone_imei"))
+            uid = get_unit_id(imei_map, unit.get("geozone_imei"))
+            group_rows.append(dict(unit, uid=uid))
+            if uid != -1:
+                existing[number] = uid
+                imeis[uid] = imei
+                continue
+            try:
+                filling = card_requests(0, unit, {})
+            except ROW_ERRORS as e:
+                plan.add(imei, NOT_CREATED, repr(e))
+                continue
+            if imei in new:
+                plan.add(imei, UPDATE, "объект создаётся строкой выше")
+                plan.budget(len(filling))
+                continue
+            if not unit.get("Оборудование"):
+                plan.add(imei, NOT_CREATED, "оборудование не указано")
+                continue
+            hware = hardware_name(unit)
+            hardware_id = HW_ID.get(fms, {}).get(hware)
+            if hardware_id is None:
+                plan.add(imei, NOT_CREATED, f"оборудование {hware} не найдено")
+                continue
+            template = unit.get("ШАБЛОН КОНФИГУРАЦИИ")
+            try:
+                if template_unit(fms, hardware_id, template or "", hware) is None:
+                    setup = setup_requests(sid, url, 0, hardware_id, unit, fms)
+                else:
+                    # the object is copied from the template unit
+                    setup = clone_requests(0, hardware_id, unit)
+            except ROW_ERRORS as e:
+                plan.add(imei, NOT_CREATED, f"шаблон {template}, {hware}: {e!r}")
+                continue
+            new.add(imei)
+            plan.add(imei, CREATE, f"{unit.get('ДЛ')}, {hware}")
+            fields = field_requests(0, ADMIN_FIELDS, CUSTOM_FIELDS, FIELD_IDS)
+            plan.budget(1 + len(setup) + len(fields) + len(filling), 3)
+        cards = get_cards(sid, list(existing.values()), url) or {}
+        updates = 0
+        for number, uid in existing.items():
+            unit, imei = chunk[number], imeis[uid]
+            card = cards.get(uid)
+            try:
+                requests_list = card_requests(uid, unit, _field_ids(card or {}))
+            except ROW_ERRORS as e:
+                plan.add(imei, INVALID, repr(e))
+                continue
+            if card is None:
+                plan.add(imei, UPDATE, "карточка не прочитана")
+                updates += len(requests_list)
+                continue
+            changed = card_diff(requests_list, card)
+            missing = [
+                request
+                for request in requests_list
+                if "n" in request["params"] and request["params"]["id"] is None
+            ]
+            plan.budget(len(missing))
+            updates += len(requests_list)
+            plan.unchanged += len(requests_list) - len(changed)
+            if not changed:
+                plan.add(imei, UNCHANGED)
+                continue
+            if any(request["svc"] == "item/update_name" for request in changed):
+                plan.counts[RENAME] += 1
+            plan.add(
+                imei, UPDATE, ", ".join(_request_name(request) for request in changed)
+            )
+        plan.budget(updates, ceil(updates / BATCH_SIZE))
+    for unit in group_only or []:
+        uid = get_unit_id(imei_map, unit.get("geozone_imei"))
+        imeis.setdefault(uid, str(unit.get("geozone_imei")))
+        group_rows.append(dict(unit, uid=uid))
+    if not group_rows:
+        return plan
+    group_rows = [{key: unit.get(key) for key in GROUP_KEYS} for unit in group_rows]
+    groups = group_requests(sid, group_rows, url, fms)
+    catalog = load_catalog(sid, url, fms)
+    regrouped = defaultdict(list)
+    for group_id, request in groups.items():
+        # new objects get their ids only when they are created
+        for uid in set(request["params"]["units"]) - catalog[group_id]["u"] - {-1}:
+            regrouped[uid].append(catalog[group_id]["nm"])
+    for uid, names in regrouped.items():
+        plan.add(imeis.get(uid, uid), REGROUP, ", ".join(sorted(names)))
+    plan.budget(len(groups), ceil(len(groups) / BATCH_SIZE))
+    return plan
+
+
+def plan_fill_inn(
+    sid: str, rows: Iterable[dict], url: str, imei_map: dict[str, int]
+) -> Plan:
+    """Plan of the /fill_inn job.
+
+    The job sends the field ИНН of every found object,
+    rows with the same value are shown as unchanged.
+
+    Args:
+        sid (str): session id
+        rows (Iterable[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+
+    Returns:
+        Plan: plan of the job
+    """
+    plan = Plan()
+    for chunk in chunked(rows):
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in chunk]
+        found = [uid for uid in unit_ids if uid not in (None, -1)]
+        cards = get_cards(sid, found, url) or {}
+        plan.budget(len(found), ceil(len(found) / BATCH_SIZE))
+        for unit, uid in zip(chunk, unit_ids):
+            imei = unit.get("IMEI")
+            if uid in (None, -1):
+                plan.add(imei, NOT_FOUND)
+                continue
+            field = _admin_field(cards.get(uid, {}), "ИНН")
+            if field is None:
+                plan.add(imei, UPDATE, f"поле ИНН создаётся: {unit.get('ИНН')}")
+                plan.budget(1)
+            elif field.get("v") == unit.get("ИНН"):
+                plan.add(imei, UNCHANGED)
+            else:
+                plan.add(imei, UPDATE, f"ИНН: {field.get('v')} -> {unit.get('ИНН')}")
+    return plan
+
+
+def plan_rename(
+    sid: str, rows: Iterable[dict], url: str, imei_map: dict[str, int]
+) -> Plan:
+    """Plan of the /rename_object job.
+
+    Args:
+        sid (str): session id
+        rows (Iterable[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+
+    Returns:
+        Plan: plan of the job
+    """
+    plan = Plan()
+    for chunk in chunked(rows):
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in chunk]
+        found = [uid for uid in unit_ids if uid not in (None, -1)]
+        cards = get_cards(sid, found, url) or {}
+        plan.budget(len(found), ceil(len(found) / BATCH_SIZE))
+        for unit, uid in zip(chunk, unit_ids):
+            imei = unit.get("IMEI")
+            if uid in (None, -1):
+                plan.add(imei, NOT_FOUND)
+                continue
+            name = (unit.get("ДЛ") or "").strip()
+            current = cards.get(uid, {}).get("nm")
+            if current == name:
+                plan.add(imei, UNCHANGED)
+            else:
+                plan.add(imei, RENAME, f"{current} -> {name}")
+    return plan
+
+
+def plan_update_info(
+    sid: str, rows: Iterable[dict], url: str, imei_map: dict[str, int]
+) -> Plan:
+    """Plan of the /update_info job.
+
+    Rows that did not change since the last upload are not sent by
+    the job and are shown as unchanged.
+
+    Args:
+        sid (str): session id
+        rows (Iterable[dict]): rows of the uploaded file
+        url (str): server address
+        imei_map (dict): {imei: object id}
+
+    Returns:
+        Plan: plan of the job
+    """
+    plan = Plan()
+    for chunk in chunked(rows):
+        changed = changed_rows(chunk) or []
+        plan.counts[UNCHANGED] += len(chunk) - len(changed)
+        unit_ids = [resolve_imei(imei_map, unit.get("IMEI")) for unit in changed]
+        cards = get_cards(
+            sid, [uid for uid in unit_ids if uid not in (None, -1)], url
+        ) or {}
+        updates = 0
+        for unit, uid in zip(changed, unit_ids):
+            imei = unit.get("IMEI")
+            if uid in (None, -1):
+                plan.add(imei, NOT_FOUND)
+                continue
+            values = {
+                name: unit.get(key)
+                for key, name in INFO_FIELDS.items()
+                if unit.get(key) is not None
+            }
+            fields = {name: _admin_field(cards.get(uid, {}), name) for name in values}
+            plan.budget(sum(field is None for field in fields.values()))
+            updates += len(values)
+            differs = [
+                name
+                for name, value in values.items()
+                if fields[name] is None or fields[name].get("v") != value
+            ]
+            if differs:
+                plan.add(imei, UPDATE, ", ".join(differs))
+            else:
+                plan.add(imei, UNCHANGED)
+        plan.budget(updates, ceil(updates / BATCH_SIZE))
+    return plan
@@ -0,0 +1,95 @@
+"""Progress of a running job.
+
+The job counts processed rows and errors, the stages of the pipeline
+add the time they spend on every chunk. The page of the job polls
+the snapshot of the progress: rows done, rows per second, ETA and
+the time of every stage, so a stall against a server is seen at once.
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# stages of the pipeline in the order they are shown
+STAGES = ("resolve", "plan", "create", "fields", "update", "groups")
+
+
+class JobProgress:
+    """Counters of a job, safe to update from the threads of the pipeline.
+
+    Args:
+        total (int | None): number of rows in the file, None if not known
+    """
+
+    def __init__(self, total: int | None = None):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.started = time.time()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, rows: int = 1, errors: int = 0) -> None:
+        """Count processed rows.
+
+        Args:
+            rows (int): number of rows processed
+            errors (int): how many of them failed
+        """
+        with self._lock:
+            self.done += rows
+            self.errors += errors
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time of the block to the stage.
+
+        Args:
+            name (str): stage, see STAGES
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0) + time.time() - start
+
+    def snapshot(self) -> dict:
+        """Current state of the job.
+
+        Returns:
+            dict: rows done and total, errors, rows per second, seconds
+            elapsed and left, seconds spent in every stage
+        """
+        with self._lock:
+            elapsed = time.time() - self.started
+            rate = self.done / elapsed if elapsed > 0 else 0
+            eta = None
+            if self.total and rate:
+                eta = round(max(self.total - self.done, 0) / rate)
+            return {
+                "done": self.done,
+                "total": self.total,
+                "errors": self.errors,
+                "rate": round(rate, 2),
+                "elapsed": round(elapsed),
+                "eta": eta,
+                "stages": {
+                    name: round(self.stages[name], 1)
+                    for name in STAGES
+                    if name in self.stages
+                },
+            }
+
+
+def stage(progress: JobProgress | None, name: str):
+    """Time the block if the progress of a job is given.
+
+    Args:
+        progress (JobProgress | None): progress of the job
+        name (str): stage, see STAGES
+
+    Returns:
+        context manager
+    """
+    return nullcontext() if progress is None else progress.stage(name)
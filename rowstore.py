@@ -0,0 +1,43 @@
+"""Helpers of the SQLite files that keep hashes of uploaded rows.
+
+The snapshot of the Каркаде data (snapshot.py) and the checkpoints of
+bulk imports (checkpoint.py) store rows as short hashes of their
+values and look them up in parts of QUERY_SIZE.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+# maximum number of parameters of one sqlite query
+QUERY_SIZE = 500
+
+
+def hash_values(values) -> bytes:
+    """Hash of the values of a row.
+
+    Args:
+        values: json serializable values, other types are written as str
+
+    Returns:
+        bytes: 16 bytes of blake2b
+    """
+    data = json.dumps(values, ensure_ascii=False, default=str).encode("UTF-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def connect(path: str, schema: str) -> sqlite3.Connection:
+    """Open the file, create the folder and the table if necessary.
+
+    Args:
+        path (str): path of the sqlite file
+        schema (str): CREATE TABLE IF NOT EXISTS query of the table
+
+    Returns:
+        sqlite3.Connection: connection to the file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute(schema)
+    return connection
@@ -0,0 +1,102 @@
+"""Pool of wialon sessions.
+
+Session ids are cached for every FMS, so a job does not login with
+the token on each upload. A background thread calls avl_evts for every
+cached session once in SESSION_KEEPALIVE seconds, so the session does
+not expire between and during jobs. If the session is lost anyway,
+client.post logs in again and the pool follows the new session id.
+"""
+
+import threading
+import time
+
+from client import current_sid, get_session, renew_sid
+from config import logger
+from constant import SESSION_KEEPALIVE, TOKEN, URL
+from engine import get_ssid
+
+_pool: dict[int, list[str]] = {}
+_lock = threading.Lock()
+_keepalive = None
+
+
+def _events_url(url: str) -> str:
+    """Address of avl_evts on the server of url.
+
+    Args:
+        url (str): address of the wialon ajax.html
+    """
+    return url.replace("wialon/ajax.html", "avl_evts")
+
+
+def get_sids(fms: int, count: int = 1) -> list[str]:
+    """Get several sessions of the server for parallel workers.
+
+    Missing sessions are created with the token of the server.
+
+    Args:
+        fms (int): server number
+        count (int): number of sessions
+
+    Returns:
+        list[str]: session ids
+    """
+    _start_keepalive()
+    with _lock:
+        sids = _pool.setdefault(fms, [])
+        while len(sids) < count:
+            sid = get_ssid(URL[fms], TOKEN[fms])
+            if sid is None:
+                break
+            sids.append(sid)
+            logger.debug(f"FMS {fms}: новая сессия, всего {len(sids)}")
+        _pool[fms] = [current_sid(sid) for sid in sids]
+        return _pool[fms][:count]
+
+
+def get_sid(fms: int) -> str:
+    """Get a session of the server.
+
+    Args:
+        fms (int): server number
+
+    Returns:
+        str: session id
+    """
+    sids = get_sids(fms)
+    return sids[0] if sids else None
+
+
+def _ping() -> None:
+    """Keep all sessions of the pool alive."""
+    with _lock:
+        pool = {fms: list(sids) for fms, sids in _pool.items()}
+    for fms, sids in pool.items():
+        url = URL[fms]
+        for sid in sids:
+            sid = current_sid(sid)
+            try:
+                response = get_session(url).post(
+                    _events_url(url), data={"sid": sid}, timeout=30
+                )
+                if response.json().get("error"):
+                    logger.info(f"FMS {fms}: сессия истекла")
+                    renew_sid(url, sid)
+            except Exception as e:
+                logger.warning(f"FMS {fms}: сессия не продлена: {e}")
+
+
+def _keepalive_loop() -> None:
+    while True:
+        time.sleep(SESSION_KEEPALIVE)
+        _ping()
+
+
+def _start_keepalive() -> None:
+    global _keepalive
+    with _lock:
+        if _keepalive is None:
+            _keepalive = threading.Thread(
+                target=_keepalive_loop, name="wialon-keepalive", daemon=True
+            )
+            _keepalive.start()
@@ -0,0 +1,138 @@
+"""Snapshot of the Каркаде data loaded to wialon.
+
+For every IMEI a hash of the tracked fields (SNAPSHOT_FIELDS) is kept
+in an SQLite file. The diff of an uploaded file compares hashes of its
+rows with the snapshot, and only the changed rows are written back,
+so neither the diff nor the save depend on the size of the fleet.
+On the first use the snapshot is filled from the old
+data_carcade/last_db.json, if it exists.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Iterable
+
+from config import fstart_stop, logger
+from rowstore import QUERY_SIZE, connect, hash_values
+
+SNAPSHOT_PATH = "data_carcade/last_db.db"
+LEGACY_PATH = "data_carcade/last_db.json"
+
+# fields of the Каркаде file kept in the snapshot
+SNAPSHOT_FIELDS = ("РДДБ", "Специалист", "IMEI", "ИНН", "КПП")
+
+
+def _number(value):
+    """Integer instead of float, as written by the old snapshot."""
+    return int(value) if type(value) is float else value
+
+
+def row_key(row: dict) -> str:
+    """IMEI of the row as the key of the snapshot.
+
+    Args:
+        row (dict): row of the uploaded file
+
+    Returns:
+        str: imei
+    """
+    return str(_number(row.get("IMEI")))
+
+
+def row_hash(row: dict) -> bytes:
+    """Hash of the tracked fields of the row.
+
+    Args:
+        row (dict): row of the uploaded file
+
+    Returns:
+        bytes: 16 bytes of blake2b
+    """
+    values = [
+        row.get("РДДБ"),
+        row.get("Специалист"),
+        _number(row.get("ИНН")),
+        row.get("КПП"),
+    ]
+    return hash_values(values)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Open the snapshot, create it if necessary.
+
+    Args:
+        path (str): path of the snapshot file
+
+    Returns:
+        sqlite3.Connection: connection to the snapshot
+    """
+    connection = connect(
+        path, "CREATE TABLE IF NOT EXISTS snapshot (imei TEXT PRIMARY KEY, hash BLOB)"
+    )
+    if (
+        os.path.exists(LEGACY_PATH)
+        and connection.execute("SELECT 1 FROM snapshot LIMIT 1").fetchone() is None
+    ):
+        with open(LEGACY_PATH, "r", encoding="UTF-8") as f:
+            legacy = json.loads(f.read())
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO snapshot (imei, hash) VALUES (?, ?)",
+                [(str(imei), row_hash(row)) for imei, row in legacy.items()],
+            )
+        logger.info(f"снимок перенесён из {LEGACY_PATH}: {len(legacy)}")
+    return connection
+
+
+@fstart_stop
+@logger.catch
+def changed_rows(rows: list[dict], path: str = SNAPSHOT_PATH) -> list[dict]:
+    """Rows that are missing in the snapshot or differ from it.
+
+    Args:
+        rows (list[dict]): rows of the uploaded file
+        path (str): path of the snapshot file
+
+    Returns:
+        list[dict]: changed rows in the order of the rows
+    """
+    connection = _connect(path)
+    known = {}
+    keys = list({row_key(row) for row in rows})
+    for start in range(0, len(keys), QUERY_SIZE):
+        part = keys[start : start + QUERY_SIZE]
+        known.update(
+            connection.execute(
+                "SELECT imei, hash FROM snapshot WHERE imei IN "
+                f"({', '.join('?' * len(part))})",
+                part,
+            ).fetchall()
+        )
+    connection.close()
+    changed = [row for row in rows if known.get(row_key(row)) != row_hash(row)]
+    logger.debug(f"изменилось строк: {len(changed)} из {len(rows)}")
+    return changed
+
+
+@fstart_stop
+@logger.catch
+def save_rows(rows: Iterable[dict], path: str = SNAPSHOT_PATH) -> int:
+    """Write the rows to the snapshot.
+
+    Args:
+        rows (Iterable[dict]): rows loaded to wialon
+        path (str): path of the snapshot file
+
+    Returns:
+        int: number of rows written
+    """
+    records = [(row_key(row), row_hash(row)) for row in rows]
+    connection = _connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO snapshot (imei, hash) VALUES (?, ?)", records
+        )
+    connection.close()
+    logger.debug(f"в снимок записано строк: {len(records)}")
+    return len(records)
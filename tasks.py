@@ -0,0 +1,408 @@
+"""Jobs of the import routes.
+
+Every function takes a job of the queue (see jobs.py), processes the
+uploaded file, writes the report to logging/<kind>_<job id>.log, sends
+it to the email of the job and returns it. The functions run in the
+workers of the queue, outside of the request context. Processed rows,
+errors and stage timings are counted in job["progress"].
+
+Rows whose writes were all confirmed by wialon are recorded in
+checkpoints, so a file uploaded again or a job restarted after a crash
+skips them. The route /update_info saves such rows to its snapshot
+after every chunk for the same reason.
+
+A job in the plan mode writes nothing to wialon, see plan_job.
+"""
+
+from datetime import datetime
+from itertools import chain
+from time import gmtime, strftime
+
+from checkpoint import Checkpoint
+from client import connection_stats
+from config import logger
+from constant import URL
+from engine import GROUP_KEYS, get_unit_id, group_update
+from jobs import job_message, register
+from pipeline import (
+    chunked,
+    fill_info_units,
+    fill_inn_units,
+    rename_units,
+    run_stages,
+    stream_export,
+    stream_units,
+)
+from plan import plan_export, plan_fill_inn, plan_rename, plan_update_info
+from sessions import get_sid
+from snapshot import SNAPSHOT_FIELDS
+from tools import get_diff_in_upload_file, read_xlsx, send_mail, update_bd
+from unit_index import load_imei_map
+
+
+def report_path(job: dict) -> str:
+    """Path of the report of the job.
+
+    Args:
+        job (dict): job
+
+    Returns:
+        str: path in the logging folder
+    """
+    return f'logging/{job["kind"]}_{job["id"]}.log'
+
+
+def _spent(start: datetime, endtime: datetime) -> str:
+    return strftime("%H:%M:%S", gmtime((endtime - start).total_seconds()))
+
+
+def _send_report(job: dict, subject: str) -> str:
+    with open(report_path(job), "r") as report:
+        order = report.read()
+    send_mail(job["email"], subject, order)
+    logger.info(job_message(job, f'отчёт отправлен на почту "{job["email"]}"'))
+    return order
+
+
+def plan_job(job: dict) -> str:
+    """Plan of the changes of a job without writes to wialon.
+
+    The report lists every row the job would change: created, updated,
+    renamed or added to groups objects, the number of rows by action
+    and the number of requests the job would send.
+
+    Args:
+        job (dict): job of any import route in the plan mode
+
+    Returns:
+        str: report
+    """
+    fms = job["fms"]
+    kind = job["kind"]
+    progress = job["progress"]
+    url = URL[fms]
+    sid = get_sid(fms)
+    with progress.stage("resolve"):
+        imei_map = load_imei_map(sid, url, fms)
+    start = datetime.now()
+    logger.info(job_message(job, "расчёт плана изменений"))
+
+    def counted(rows):
+        for row in rows:
+            progress.add()
+            yield row
+
+    rows = counted(read_xlsx(job["path"]))
+    checkpoint = Checkpoint(kind, fms)
+    skipped = []
+    if kind != "update_info":
+        rows = checkpoint.pending(rows, skipped.append)
+    with progress.stage("plan"):
+        if kind == "export":
+            plan = plan_export(sid, rows, url, fms, imei_map, skipped)
+        elif kind == "fill_inn":
+            plan = plan_fill_inn(sid, rows, url, imei_map)
+        elif kind == "rename_object":
+            plan = plan_rename(sid, rows, url, imei_map)
+        else:
+            plan = plan_update_info(sid, rows, url, imei_map)
+    endtime = datetime.now()
+    with open(report_path(job), "w") as log:
+        log.write("План изменений, на виалон ничего не загружено\n")
+        log.write(f"Время расчёта: {start.ctime()}, {_spent(start, endtime)}\n")
+        for imei, action, details in plan.actions:
+            log.write(f"{imei} - {action}{f': {details}' if details else ''}\n")
+        log.write("Итого:\n")
+        for action, count in plan.counts.items():
+            log.write(f"{action}: {count}\n")
+        log.write(f"Пропущено строк, загруженных ранее: {checkpoint.skipped}\n")
+        log.write(
+            f"Запросов к виалон: {plan.requests}, http запросов: {plan.calls}\n"
+        )
+        if kind == "export":
+            log.write(f"Из них не отправляются в режиме изменений: {plan.unchanged}\n")
+    logger.info(job_message(job, f"план рассчитан: {dict(plan.counts)}"))
+    return _send_report(job, "план изменений")
+
+
+def export_job(job: dict) -> str:
+    """Import object data to Wialon.
+
+    Objects are created or updated, then distributed to groups.
+    In the reconcile mode only values that differ from wialon are sent.
+
+    Args:
+        job (dict): job of the /export route
+
+    Returns:
+        str: report
+    """
+    if job.get("mode") == "plan":
+        return plan_job(job)
+    fms = job["fms"]
+    progress = job["progress"]
+    url = URL[fms]
+    sid = get_sid(fms)
+    with progress.stage("resolve"):
+        imei_map = load_imei_map(sid, url, fms)
+    rows = read_xlsx(job["path"])
+    first = next(rows)
+    leasing = first.get("ЛИЗИНГ")
+    start = datetime.now()
+    with open(report_path(job), "w") as log:
+        log.write(f"Время начала: {start.ctime()}\n")
+        log.write(f"экспорт по компании: {leasing}\n")
+        log.write("Не был найден на виалон, возможно мастер не звонил:\n")
+    logger.info(job_message(job, f"начало загрузки на виалон {leasing}"))
+    reconcile = job.get("mode") == "reconcile"
+    group_rows = []
+    failed_rows = []
+    counter = 0
+    unchanged = 0
+
+    def skipped(unit: dict) -> None:
+        progress.add()
+        unit.update({"uid": get_unit_id(imei_map, unit.get("geozone_imei"))})
+        group_rows.append({key: unit.get(key) for key in GROUP_KEYS})
+
+    with Checkpoint(job["kind"], fms) as checkpoint, open(report_path(job), "a") as log:
+        for unit, result in stream_export(
+            checkpoint.pending(chain([first], rows), skipped),
+            url,
+            fms,
+            imei_map,
+            progress,
+            reconcile,
+        ):
+            counter += 1
+            if result is not None and result.get("sent") == 0:
+                unchanged += 1
+            errors = [-1] if result is None else result.get("errors", [])
+            failed = bool(errors) or result.get("uid") == -1
+            progress.add(errors=int(failed))
+            group_rows.append({key: unit.get(key) for key in GROUP_KEYS})
+            if not failed:
+                checkpoint.done(unit)
+            elif errors:
+                failed_rows.append(
+                    f'Пин {unit.get("Пин")} - Имей {unit.get("geozone_imei")}'
+                    f" - ошибки {errors}\n"
+                )
+            if result is not None and result.get("created"):
+                log.write(f'Пин {unit.get("Пин")} - Имей {unit.get("geozone_imei")}\n')
+    logger.info(job_message(job, "распределение объектов по группам"))
+    with progress.stage("groups"):
+        group_update(sid, group_rows, url, fms)
+    logger.info(job_message(job, "объекты распределены"))
+    endtime = datetime.now()
+    with open(report_path(job), "a") as log:
+        log.write(f"Время окончания: {endtime.ctime()}\n")
+        log.write(f"Ушло времени на залив данных: {_spent(start, endtime)}\n")
+        log.write(f"Обработано строк: {counter}\n")
+        log.write(f"Пропущено строк, загруженных ранее: {checkpoint.skipped}\n")
+        if reconcile:
+            log.write(f"Объектов без изменений: {unchanged}\n")
+        if failed_rows:
+            log.write(f"Строк с ошибками записи: {len(failed_rows)}\n")
+            log.writelines(failed_rows)
+    logger.info(job_message(job, f"обработано строк {counter}"))
+    logger.info(job_message(job, f"соединения с сервером: {connection_stats(url)}"))
+    return _send_report(job, "экспорт на виалон")
+
+
+def update_info_job(job: dict) -> str:
+    """Carcade, update info fields.
+
+    Only rows changed since the last upload are written to wialon,
+    every processed chunk is saved to the snapshot at once.
+
+    Args:
+        job (dict): job of the /update_info route
+
+    Returns:
+        str: report
+    """
+    if job.get("mode") == "plan":
+        return plan_job(job)
+    fms = job["fms"]
+    progress = job["progress"]
+    url = URL[fms]
+    sid = get_sid(fms)
+    with progress.stage("resolve"):
+        imei_map = load_imei_map(sid, url, fms)
+    counter = 0
+    length = 0
+    start = datetime.now()
+    logger.info(job_message(job, "старт обработки списка"))
+    with open(report_path(job), "w") as log:
+        log.write(f"Начало загрузки: {start.ctime()}\n")
+
+    def get_diff(chunk: list[dict]) -> list[dict]:
+        rows = get_diff_in_upload_file(chunk)
+        progress.add(len(chunk) - len(rows))
+        return rows
+
+    with open(report_path(job), "a") as log:
+        for chunk in run_stages(
+            chunked(read_xlsx(job["path"])),
+            get_diff,
+            lambda chunk: list(
+                zip(chunk, fill_info_units(sid, chunk, url, imei_map, progress))
+            ),
+        ):
+            for unit, result in chunk:
+                length += 1
+                failed = result.get("uid") in (None, -1) or bool(result.get("errors"))
+                progress.add(errors=int(failed))
+                if result.get("uid") is None:
+                    log.write(f'{unit.get("IMEI")} не верный формат или не найден')
+                    continue
+                counter += 1
+                if result.get("uid") == -1:
+                    log.write("{0} - не найден\n".format(unit.get("IMEI")))
+                elif result.get("errors"):
+                    log.write(
+                        f'{unit.get("IMEI")} - ошибка обновления {result.get("errors")}\n'
+                    )
+                else:
+                    logger.info(
+                        job_message(job, f'{unit.get("IMEI")} - {result.get("fields")}')
+                    )
+            update_bd(
+                [
+                    {key: unit.get(key) for key in SNAPSHOT_FIELDS}
+                    for unit, result in chunk
+                    if result.get("uid") not in (None, -1) and not result.get("errors")
+                ]
+            )
+            logger.debug(f"Обработано строк: {length}")
+    endtime = datetime.now()
+    logger.info(job_message(job, "обновление полей инфо завершено"))
+    with open(report_path(job), "a") as log:
+        log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
+        log.write(f"Ушло времени на залив данных: {_spent(start, endtime)}\n")
+        log.write(f"Всего строк обработано: {counter} из {length}\n")
+    logger.info(job_message(job, f"обработано строк {counter} из {length}"))
+    return _send_report(job, "РДДБ обновление полей ИНФО")
+
+
+def fill_inn_job(job: dict) -> str:
+    """GPBL, fill field INN.
+
+    Args:
+        job (dict): job of the /fill_inn route
+
+    Returns:
+        str: report
+    """
+    if job.get("mode") == "plan":
+        return plan_job(job)
+    fms = job["fms"]
+    progress = job["progress"]
+    url = URL[fms]
+    sid = get_sid(fms)
+    with progress.stage("resolve"):
+        imei_map = load_imei_map(sid, url, fms)
+    counter = 0
+    length = 0
+    start = datetime.now()
+    logger.info(job_message(job, "старт обновления полей ИНН"))
+    with open(report_path(job), "w") as log:
+        log.write(f"Начало загрузки: {start.ctime()}\n")
+    with Checkpoint(job["kind"], fms) as checkpoint, open(report_path(job), "a") as log:
+        for unit, result in stream_units(
+            checkpoint.pending(read_xlsx(job["path"]), lambda unit: progress.add()),
+            lambda chunk: fill_inn_units(sid, chunk, url, imei_map, progress),
+        ):
+            length += 1
+            failed = result.get("uid") in (None, -1) or bool(result.get("errors"))
+            progress.add(errors=int(failed))
+            if not failed:
+                checkpoint.done(unit)
+            if result.get("uid") is None:
+                log.write(f'{unit.get("IMEI")} не верный формат или не найден')
+                continue
+            counter += 1
+            if result.get("uid") == -1:
+                log.write("{0} - не найден\n".format(unit.get("IMEI")))
+            elif result.get("errors"):
+                log.write(
+                    f'{unit.get("IMEI")} - ошибка обновления {result.get("errors")}\n'
+                )
+            else:
+                logger.info(job_message(job, f'{unit.get("IMEI")} - {unit.get("ИНН")}'))
+    endtime = datetime.now()
+    logger.info(job_message(job, "обновление ИНН завершено"))
+    with open(report_path(job), "a") as log:
+        log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
+        log.write(f"Ушло времени на залив данных: {_spent(start, endtime)}\n")
+        log.write(f"Всего строк обработано: {counter} из {length}\n")
+        log.write(f"Пропущено строк, загруженных ранее: {checkpoint.skipped}\n")
+    logger.info(job_message(job, f"обработано строк {counter} из {length}"))
+    return _send_report(job, "ГПБАЛ обновление полей ИНН")
+
+
+def rename_job(job: dict) -> str:
+    """Rename a list of objects.
+
+    Args:
+        job (dict): job of the /rename_object route
+
+    Returns:
+        str: report
+    """
+    if job.get("mode") == "plan":
+        return plan_job(job)
+    fms = job["fms"]
+    progress = job["progress"]
+    url = URL[fms]
+    sid = get_sid(fms)
+    with progress.stage("resolve"):
+        imei_map = load_imei_map(sid, url, fms)
+    counter = 0
+    length = 0
+    start = datetime.now()
+    logger.info(job_message(job, "старт обновления полей ДЛ"))
+    with open(report_path(job), "w") as log:
+        log.write(f"Начало загрузки: {start.ctime()}\n")
+    with Checkpoint(job["kind"], fms) as checkpoint, open(report_path(job), "a") as log:
+        for unit, result in stream_units(
+            checkpoint.pending(read_xlsx(job["path"]), lambda unit: progress.add()),
+            lambda chunk: rename_units(sid, chunk, url, imei_map, progress),
+        ):
+            length += 1
+            failed = result.get("uid") in (None, -1) or bool(result.get("errors"))
+            progress.add(errors=int(failed))
+            if not failed:
+                checkpoint.done(unit)
+            if result.get("uid") is None:
+                log.write(f'{unit.get("IMEI")} не верный формат или не найден')
+                continue
+            counter += 1
+            if result.get("uid") == -1:
+                log.write("{0} - не найден\n".format(unit.get("IMEI")))
+            elif result.get("errors"):
+                log.write(
+                    f'{unit.get("IMEI")} - ошибка переименования {result.get("errors")}\n'
+                )
+            else:
+                logger.info(
+                    job_message(
+                        job, f'Новое имя для {unit.get("IMEI")} - {unit.get("ДЛ")}'
+                    )
+                )
+    endtime = datetime.now()
+    logger.info(job_message(job, "обновление ДЛ завершено"))
+    with open(report_path(job), "a") as log:
+        log.write(f"Окончание экспорта данных: {endtime.ctime()}\n")
+        log.write(f"Ушло времени на залив данных: {_spent(start, endtime)}\n")
+        log.write(f"Всего строк обработано: {counter} из {length}\n")
+        log.write(f"Пропущено строк, загруженных ранее: {checkpoint.skipped}\n")
+    logger.info(job_message(job, f"обработано строк {counter} из {length}"))
+    return _send_report(job, "Массовое переименование объектов")
+
+
+register("export", export_job)
+register("update_info", update_info_job)
+register("fill_inn", fill_inn_job)
+register("rename_object", rename_job)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+from aiohttp import web
+
+import client
+import engine
+
+
+class Response:
+    status_code = 504
+    content = b""
+    text = ""
+
+
+class Session:
+    def __init__(self):
+        self.sent = []
+
+    def post(self, url, data, headers, timeout):
+        self.sent.append(data["svc"])
+        return Response()
+
+
+def test_gateway_error_retried_for_reads(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(client, "_limiters", {})
+    monkeypatch.setattr(client, "get_session", lambda url: session)
+    monkeypatch.setattr(client, "_backoff", lambda attempt: None)
+    monkeypatch.setattr(client, "RETRY_COUNT", 2)
+    client.post("url", {"svc": "core/create_unit", "params": "{}"})
+    assert session.sent == ["core/create_unit"]
+    reads = {"params": [{"svc": "core/search_item", "params": {}}]}
+    client.post("url", {"svc": "core/batch", "params": json.dumps(reads)})
+    assert session.sent[1:] == ["core/batch"] * 3
+
+
+
+class Expired(Response):
+    status_code = 200
+    content = b'{"error": 1}'
+
+    def json(self):
+        return {"error": 1}
+
+
+def test_session_renewed_without_backoff(monkeypatch):
+    answers = [Expired(), Response()]
+    answers[1].status_code = 200
+    session = Session()
+    session.post = lambda url, data, headers, timeout: answers.pop(0)
+    monkeypatch.setattr(client, "get_session", lambda url: session)
+    monkeypatch.setattr(client, "renew_sid", lambda url, sid: "new")
+
+    def backoff(attempt):
+        raise AssertionError("backoff after a renewed session")
+
+    monkeypatch.setattr(client, "_backoff", backoff)
+    assert client.post("url", {"svc": "core/search_item", "sid": "old"}) is not None
+    assert not answers
+
+
+def test_get_cards_async(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        data = await request.post()
+        calls.append(data["sid"])
+        if data["sid"] == "old":
+            return web.json_response({"error": 1})
+        params = json.loads(data["params"])["params"]
+        return web.json_response(
+            [{"item": {"nm": str(request["params"]["id"])}} for request in params]
+        )
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/", handler)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    renewed = {}
+    monkeypatch.setattr(client, "_renewed_sids", renewed)
+
+    def renew_sid(url, sid):
+        renewed[sid] = "new"
+        return "new"
+
+    monkeypatch.setattr("async_engine.renew_sid", renew_sid)
+    monkeypatch.setattr("async_engine.BATCH_SIZE", 2)
+    try:
+        cards = engine.get_cards("old", [1, 2, 3], f"http://127.0.0.1:{port}/")
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    assert {uid: card["nm"] for uid, card in cards.items()} == {
+        1: "1",
+        2: "2",
+        3: "3",
+    }
+    assert calls.count("new") == 2
@@ -7,6 +7,8 @@ from constant import GROUPS, TOKEN, URL, USER_ID
 from engine import (
     __get_new_token,
     add_groups,
+    card_diff,
+    card_requests,
     check_admin_fields,
     create_admin_field,
     create_custom_field,
@@ -17,11 +19,14 @@ from engine import (
     get_admin_fields,
     get_custom_fields,
     get_header,
+    get_imei_map,
     get_object_id,
     get_object_info_by_imei,
     get_object_info_by_name,
     get_ssid,
+    get_unit_id,
     get_user_id,
+    group_units_request,
     group_update,
     id_fields,
     search_group_by_id,
@@ -94,6 +99,18 @@ def test_get_object_id():
         assert get_object_id(sid, error_imei, URL[test_fms]) == -1
 
 
+def test_get_imei_map():
+    export_object = read_json("tests/fixtures/create_object")
+    for test_fms in range(*iteration[fms]):
+        sid = get_ssid(URL[test_fms], TOKEN[test_fms])
+        imei_map = get_imei_map(sid, URL[test_fms])
+        for list_id, dict_value in enumerate(export_object):
+            imei = dict_value.get("geozone_imei")
+            object_id = get_object_id(sid, imei, URL[test_fms])
+            assert get_unit_id(imei_map, imei) == object_id
+        assert get_unit_id(imei_map, "122334455668877") == -1
+
+
 def test_create_custom_fields():
     export_object = read_json("tests/fixtures/one_object")
     for test_fms in range(*iteration[fms]):
@@ -181,6 +198,56 @@ def test_add_groups():
         assert obj_id in new_group_list.get("u")
 
 
+def test_group_units_request():
+    request = group_units_request(5, [1, 2, 2], [2, 3, -1, None, 3])
+    assert request.get("params") == {"itemId": 5, "units": [1, 2, 3]}
+    assert group_units_request(5, [1, 2], [2, 1, -1]) is None
+
+
+def test_card_diff():
+    row = {
+        "ДЛ": "АА-1 ",
+        "geozone_sim": "79001234567",
+        "geozone_imei": "150317175645805",
+        "Vin": "VIN1",
+        "Инфо4": None,
+        "Марка": "Лада",
+        "Модель": "Веста",
+        "Пин": "1",
+    }
+    ids = {
+        "geozone_imei": 1,
+        "geozone_sim": 2,
+        "Инфо4": 3,
+        "Пин": 4,
+        "Vin": 1,
+        "Марка": 2,
+        "Модель": 3,
+    }
+    card = {
+        "nm": "АА-1",
+        "ph": "+79001234567",
+        "cnm": 0,
+        "cneh": 0,
+        "aflds": {
+            "1": {"id": 1, "n": "geozone_imei", "v": "150317175645805"},
+            "2": {"id": 2, "n": "geozone_sim", "v": "79001234567"},
+            "3": {"id": 3, "n": "Инфо4", "v": ""},
+            "4": {"id": 4, "n": "Пин", "v": "1"},
+        },
+        "flds": {
+            "1": {"id": 1, "n": "Vin", "v": "VIN1"},
+            "2": {"id": 2, "n": "Марка", "v": "Лада"},
+            "3": {"id": 3, "n": "Модель", "v": "Гранта"},
+        },
+    }
+    changed = card_diff(card_requests(10, row, ids), card)
+    assert [request["params"].get("n") for request in changed] == ["Модель"]
+    card.update({"cnm": 15})
+    changed = card_diff(card_requests(10, row, ids), card)
+    assert changed[-1]["svc"] == "unit/update_mileage_counter"
+
+
 def test_group_update():
     export_object = read_json("tests/fixtures/create_object")
     for test_fms in range(3, 5):
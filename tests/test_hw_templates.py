@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+import batch
+import hardware
+import hw_templates
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def test_get_sensors_fetch_without_lock(monkeypatch):
+    def post(url, data):
+        # other lookups are not blocked while the template unit is read
+        assert not hw_templates._unit_sensors_lock.locked()
+        return Response({"item": {"sens": {"1": {"id": 1, "n": "Зажигание"}}}})
+
+    monkeypatch.setattr(hw_templates, "post", post)
+    monkeypatch.setattr(hw_templates, "template_unit", lambda *args: 5)
+    monkeypatch.setattr(hw_templates, "_unit_sensors", {})
+    monkeypatch.setattr(hw_templates, "_unit_sensors_lock", threading.Lock())
+    sensors = hw_templates.get_sensors("sid", "url", 1, 2, "", "MT-5")
+    assert [sensor["n"] for sensor in sensors] == ["Зажигание"]
+    assert hw_templates._unit_sensors[("url", 5)] is sensors
+
+
+def test_create_object_from_template(monkeypatch):
+    sent = []
+
+    def post(url, data):
+        sent.append(data["svc"])
+        if data["svc"] == "core/duplicate":
+            assert json.loads(data["params"])["itemId"] == 5
+            return Response({"item": {"id": 10}})
+        return Response([[] for request in json.loads(data["params"])["params"]])
+
+    monkeypatch.setattr(hardware, "post", post)
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(hardware, "get_hardware_id", lambda unit, fms: 2)
+    monkeypatch.setattr(hardware, "template_unit", lambda *args: 5)
+    monkeypatch.setattr(hardware, "USER_ID", {1: 3})
+    unit = {"ДЛ": "АА-1", "Оборудование": "MT-5", "geozone_imei": "1"}
+    assert hardware.create_object_with_all_params("sid", "url", unit, 1, True) == 10
+    assert sent == ["core/duplicate", "core/batch"]
@@ -0,0 +1,108 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+import jobs
+import tasks
+from checkpoint import Checkpoint
+from config import app
+from progress import JobProgress
+
+
+def test_job_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    monkeypatch.setattr(jobs, "start_workers", lambda: None)
+    jobs.register("test", lambda job: f'строк: {job["filename"]}')
+    path = jobs.upload_path("test.xlsx")
+    open(path, "w").close()
+    job_id = jobs.submit_job("test", 1, path, "test.xlsx", "test@test.ru")
+    assert jobs.get_job(job_id)["status"] == jobs.QUEUED
+    job = jobs._claim()
+    assert job["id"] == job_id
+    assert jobs._claim() is None
+    jobs.run_job(job)
+    job = jobs.get_job(job_id)
+    assert job["status"] == jobs.DONE
+    assert job["report"] == "строк: test.xlsx"
+    assert jobs.job_progress(job)["done"] == 0
+    assert not os.path.exists(path)
+
+
+def test_job_progress():
+    progress = JobProgress(total=10)
+    progress.add(4, errors=1)
+    with progress.stage("update"):
+        pass
+    snapshot = progress.snapshot()
+    assert snapshot["done"] == 4
+    assert snapshot["total"] == 10
+    assert snapshot["errors"] == 1
+    assert "update" in snapshot["stages"]
+
+
+def test_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    rows = [{"IMEI": "1", "ИНН": "5"}, {"IMEI": "2", "ИНН": "6"}]
+    with Checkpoint("fill_inn", 1) as checkpoint:
+        assert list(checkpoint.pending(rows)) == rows
+        checkpoint.done(dict(rows[0], uid=10))
+    skipped = []
+    checkpoint = Checkpoint("fill_inn", 1)
+    assert list(checkpoint.pending(rows, skipped.append)) == [rows[1]]
+    assert skipped == [rows[0]]
+    assert list(Checkpoint("fill_inn", 2).pending(rows)) == rows
+    assert list(Checkpoint("fill_inn", 1).pending([dict(rows[0], ИНН="7")]))
+
+
+def test_export_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("logging")
+    rows = [
+        {"geozone_imei": "1", "ЛИЗИНГ": "Лизинг"},
+        {"geozone_imei": "2", "ЛИЗИНГ": "Лизинг"},
+    ]
+    results = {"1": {"uid": 10, "errors": []}, "2": {"uid": 20, "errors": [7]}}
+    monkeypatch.setattr(tasks, "get_sid", lambda fms: "sid")
+    monkeypatch.setattr(tasks, "load_imei_map", lambda sid, url, fms: {})
+    monkeypatch.setattr(tasks, "read_xlsx", lambda path: iter(rows))
+    monkeypatch.setattr(
+        tasks,
+        "stream_export",
+        lambda rows, *args: ((row, results[row["geozone_imei"]]) for row in rows),
+    )
+    monkeypatch.setattr(tasks, "group_update", lambda *args: None)
+    monkeypatch.setattr(tasks, "send_mail", lambda *args: None)
+    job = {"id": 1, "kind": "export", "fms": 1, "path": "", "email": "test@test.ru"}
+    report = tasks.export_job(dict(job, progress=JobProgress()))
+    assert "Строк с ошибками записи: 1" in report
+    assert list(Checkpoint("export", 1).pending(rows)) == [rows[1]]
+
+
+def test_requeue_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    monkeypatch.setattr(jobs, "start_workers", lambda: None)
+    ids = [jobs.submit_job("test", 1, "path", "test.xlsx", "") for _ in range(3)]
+    for _ in ids:
+        jobs._claim()
+    connection = jobs._connect()
+    with connection:
+        # a live process of another host and a dead process of this host
+        connection.execute(
+            "UPDATE jobs SET owner = 'other:1' WHERE id = ?", (ids[0],)
+        )
+        connection.execute(
+            "UPDATE jobs SET owner = ? WHERE id = ?", (f"{jobs.HOST}:0", ids[1])
+        )
+    connection.close()
+    monkeypatch.setattr(jobs, "_owner_alive", lambda owner: owner != f"{jobs.HOST}:0")
+    assert jobs.requeue_lost() == 1
+    assert [jobs.get_job(job_id)["status"] for job_id in ids] == [
+        jobs.RUNNING,
+        jobs.QUEUED,
+        jobs.RUNNING,
+    ]
+    monkeypatch.setattr(jobs, "JOB_STALE", -1)
+    assert jobs.requeue_lost() == 2
+    assert jobs._claim()["owner"] == jobs.job_owner()
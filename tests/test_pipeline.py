@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+import batch
+import engine
+import group_catalog
+import pipeline
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def test_fill_info_units(monkeypatch):
+    sent = []
+
+    def post(url, data):
+        requests_list = json.loads(data["params"])["params"]
+        sent.append(requests_list)
+        return Response(
+            [
+                {"error": 7} if request["params"]["itemId"] == 20 else [1, {}]
+                for request in requests_list
+            ]
+        )
+
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(pipeline, "preload_fields", lambda *args: None)
+    monkeypatch.setattr(
+        pipeline,
+        "check_admin_fields_list",
+        lambda sid, unit_id, names, url: [(number, "") for number in range(4)],
+    )
+    rows = [
+        {"IMEI": "1", "РДДБ": "А", "ИНН": "5"},
+        {"IMEI": "2", "РДДБ": "Б"},
+        {"IMEI": "3", "РДДБ": "В"},
+    ]
+    results = pipeline.fill_info_units("sid", rows, "url", {"1": 10, "2": 20})
+    assert len(sent) == 1
+    assert len(sent[0]) == 3
+    assert [result["uid"] for result in results] == [10, 20, -1]
+    assert [result["errors"] for result in results] == [[], [7], []]
+
+
+def test_group_update_reads_members(monkeypatch):
+    sent = []
+
+    def post(url, data):
+        requests_list = json.loads(data["params"])["params"]
+        sent.append(requests_list)
+        if requests_list[0]["svc"] == "core/search_item":
+            return Response([{"item": {"id": 7, "u": [1, 2]}}])
+        return Response([{"u": requests_list[0]["params"]["units"]}])
+
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(engine, "group_additions", lambda *args: {7: {2, 3}})
+    engine.group_update("sid", [], "url", 1)
+    assert len(sent) == 2
+    assert sent[1][0]["params"] == {"itemId": 7, "units": [1, 2, 3]}
+
+
+def test_locked_groups():
+    with group_catalog.locked_groups(1, [7, 5]):
+        assert group_catalog._group_locks[(1, 7)].locked()
+        assert group_catalog._group_locks[(1, 5)].locked()
+    assert not group_catalog._group_locks[(1, 7)].locked()
+
+
+def test_create_units_finds_by_part(monkeypatch):
+    def post(url, data):
+        requests_list = json.loads(data["params"])["params"]
+        return Response(
+            [
+                {"items": [{"id": 30}]}
+                if request["params"]["spec"]["propValueMask"] == "*123*"
+                else {"items": []}
+                for request in requests_list
+            ]
+        )
+
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(pipeline, "get_sids", lambda fms, count: ["sid"])
+    monkeypatch.setattr(pipeline, "get_hardware_id", lambda unit, fms: -1)
+    imei_map = {"10": 10}
+    units = [
+        {"geozone_imei": "010", "Оборудование": "MT-5"},
+        {"geozone_imei": 123.0, "Оборудование": "MT-5"},
+        {"geozone_imei": "456", "Оборудование": "MT-5"},
+    ]
+    created = pipeline.create_units(units, "url", 1, imei_map)
+    assert created == {2: {"uid": -1, "errors": [-1]}}
+    assert imei_map == {"10": 10, "123": 30}
+
+
+def test_fill_inn_units_field_error(monkeypatch):
+    sent = []
+
+    def post(url, data):
+        requests_list = json.loads(data["params"])["params"]
+        sent.append(requests_list)
+        return Response([[1, {}] for request in requests_list])
+
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(pipeline, "preload_fields", lambda *args: None)
+    monkeypatch.setattr(
+        pipeline,
+        "check_admin_fields",
+        lambda sid, unit_id, name, url: None if unit_id == 20 else (1, ""),
+    )
+    rows = [{"IMEI": "1", "ИНН": "5"}, {"IMEI": "2", "ИНН": "6"}]
+    results = pipeline.fill_inn_units("sid", rows, "url", {"1": 10, "2": 20})
+    assert len(sent[0]) == 1
+    assert [result["errors"] for result in results] == [[], [-1]]
+
+
+def test_create_units_takes_create_slots(monkeypatch):
+    def create_unit(sid, unit, url, fms):
+        assert pipeline._create_slots[1]._value == 0
+        return {"uid": 10, "errors": []}
+
+    monkeypatch.setattr(pipeline, "find_units", lambda *args: {})
+    monkeypatch.setattr(pipeline, "get_sids", lambda fms, count: ["sid"])
+    monkeypatch.setattr(pipeline, "get_hardware_id", lambda unit, fms: 2)
+    monkeypatch.setattr(pipeline, "create_unit", create_unit)
+    monkeypatch.setitem(pipeline._create_slots, 1, threading.BoundedSemaphore(1))
+    imei_map = {}
+    units = [{"geozone_imei": "1", "Оборудование": "MT-5"}]
+    assert pipeline.create_units(units, "url", 1, imei_map)[0]["uid"] == 10
+    assert imei_map == {"1": 10}
+
+
+def test_create_units_without_session(monkeypatch):
+    monkeypatch.setattr(pipeline, "get_sids", lambda fms, count: [])
+    units = [{"geozone_imei": "1", "Оборудование": "MT-5"}]
+    assert pipeline.create_units(units, "url", 1, {}) == {
+        0: {"uid": -1, "errors": [-1]}
+    }
+
+
+def test_update_units_spreads_sessions(monkeypatch):
+    sent = []
+
+    def post(url, data):
+        requests_list = json.loads(data["params"])["params"]
+        sent.append(data["sid"])
+        return Response([{} for request in requests_list])
+
+    monkeypatch.setattr(batch, "post", post)
+    monkeypatch.setattr(pipeline, "get_sids", lambda fms, count: ["a", "b"])
+    monkeypatch.setattr(pipeline, "preload_fields", lambda *args: None)
+    monkeypatch.setattr(pipeline, "id_fields", lambda sid, uid, url: {})
+    monkeypatch.setattr(pipeline, "remember_card", lambda *args: None)
+    resolved = [({"uid": uid, "ДЛ": f"АА-{uid}"}, None) for uid in (10, 20, 30)]
+    results = pipeline.update_units(resolved, "url", 1)
+    assert sorted(sent) == ["a", "b"]
+    assert [result["errors"] for _, result in results] == [[], [], []]
+    monkeypatch.setattr(pipeline, "get_sids", lambda fms, count: [])
+    results = pipeline.update_units(resolved, "url", 1)
+    assert [result["errors"] for _, result in results] == [[-1], [-1], [-1]]
+
+
+def test_remember_fields_copy_on_write():
+    engine._store_fields("url", 10, {"aflds": {"1": {"id": 1, "n": "ИНН"}}, "flds": {}})
+    fields = engine.cached_fields("sid", 10, "url")
+    engine._remember_fields("url", 10, "aflds", {"КПП": (2, "7")})
+    assert list(fields["aflds"]) == ["1"]
+    assert list(engine.cached_fields("sid", 10, "url")["aflds"]) == ["1", "2"]
@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+import plan
+from plan import CREATE, NOT_CREATED, NOT_FOUND, RENAME, REGROUP, UNCHANGED, UPDATE
+
+
+def test_plan_rename(monkeypatch):
+    cards = {10: {"nm": "АА-1", "aflds": {"1": {"id": 1, "n": "ИНН", "v": "5"}}}}
+    monkeypatch.setattr(plan, "get_cards", lambda sid, unit_ids, url: cards)
+    imei_map = {"1": 10}
+    rows = [{"IMEI": "1", "ДЛ": "АА-2 ", "ИНН": "5"}, {"IMEI": "2", "ДЛ": "ББ-1"}]
+    result = plan.plan_rename("sid", rows, "url", imei_map)
+    assert result.actions == [("1", RENAME, "АА-1 -> АА-2"), ("2", NOT_FOUND, "")]
+    assert result.requests == 1
+    assert result.calls == 1
+    result = plan.plan_fill_inn("sid", rows, "url", imei_map)
+    assert result.counts[UNCHANGED] == 1
+    assert result.counts[NOT_FOUND] == 1
+
+
+def test_plan_export(monkeypatch):
+    card = {
+        "nm": "АА-1",
+        "ph": "+79001234567",
+        "cnm": 0,
+        "cneh": 0,
+        "aflds": {
+            "1": {"id": 1, "n": "geozone_imei", "v": "150317175645805"},
+            "2": {"id": 2, "n": "geozone_sim", "v": "79001234567"},
+            "3": {"id": 3, "n": "Инфо4", "v": ""},
+            "4": {"id": 4, "n": "Пин", "v": "1"},
+        },
+        "flds": {
+            "1": {"id": 1, "n": "Vin", "v": "VIN1"},
+            "2": {"id": 2, "n": "Марка", "v": "Лада"},
+            "3": {"id": 3, "n": "Модель", "v": "Гранта"},
+        },
+    }
+    row = {
+        "ДЛ": "АА-1",
+        "geozone_sim": "79001234567",
+        "geozone_imei": "150317175645805",
+        "Vin": "VIN1",
+        "Инфо4": None,
+        "Марка": "Лада",
+        "Модель": "Веста",
+        "Пин": "1",
+        "ТИП": "0",
+        "РИСК": "0",
+        "ШАБЛОН КОНФИГУРАЦИИ": "",
+        "ЛИЗИНГ": "Лизинг",
+    }
+    catalog = {7: {"id": 7, "nm": "Лизинг", "u": set()}}
+    monkeypatch.setattr(plan, "get_cards", lambda sid, unit_ids, url: {10: card})
+    monkeypatch.setattr(plan, "load_catalog", lambda sid, url, fms: catalog)
+    monkeypatch.setattr(
+        plan,
+        "group_requests",
+        lambda sid, data, url, fms: {
+            7: {"params": {"units": [unit["uid"] for unit in data]}}
+        },
+    )
+    result = plan.plan_export("sid", [row], "url", 1, {"150317175645805": 10})
+    assert result.actions == [
+        ("150317175645805", UPDATE, "Модель"),
+        ("150317175645805", REGROUP, "Лизинг"),
+    ]
+    assert result.unchanged == result.requests - 2
+
+
+def test_plan_export_bad_rows(monkeypatch):
+    def setup_requests(sid, url, obj_id, hardware_id, unit, fms):
+        if unit.get("ШАБЛОН КОНФИГУРАЦИИ") == "нет":
+            raise KeyError((fms, hardware_id, 5))
+        return [("phone", {})]
+
+    monkeypatch.setattr(plan, "setup_requests", setup_requests)
+    monkeypatch.setattr(plan, "get_cards", lambda sid, unit_ids, url: {})
+    monkeypatch.setattr(plan, "group_requests", lambda *args: {})
+    monkeypatch.setattr(plan, "load_catalog", lambda *args: {})
+    row = {"ДЛ": "АА-1", "Оборудование": "MT-5", "ШАБЛОН КОНФИГУРАЦИИ": ""}
+    rows = [
+        dict(row, geozone_imei="1", **{"ШАБЛОН КОНФИГУРАЦИИ": "нет"}),
+        dict(row, geozone_imei="2", Оборудование=None),
+        dict(row, geozone_imei="3"),
+    ]
+    result = plan.plan_export("sid", rows, "url", 1, {})
+    assert [action[:2] for action in result.actions] == [
+        ("1", NOT_CREATED),
+        ("2", NOT_CREATED),
+        ("3", CREATE),
+    ]
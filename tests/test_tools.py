@@ -3,10 +3,12 @@ import sys
 
 sys.path.append(os.path.join(os.getcwd(), ""))
 
+from snapshot import changed_rows, save_rows
 from tools import (
     xls_to_json,
     is_xlsx,
     read_json,
+    read_xlsx,
     get_headers,
     update_bd,
     get_diff_in_upload_file
@@ -20,6 +22,12 @@ def test_xls_to_json():
     assert f"{to_json}.json" in list_dir
 
 
+def test_read_xlsx():
+    rows = list(read_xlsx("tests/fixtures/Test export INN.xlsx"))
+    assert len(rows) == 3
+    assert rows[0] == {"ИНН": "7056565656", "IMEI": "162059064497822"}
+
+
 def test_is_xlsx():
     not_xls = "tests/fixtures/fill_inn.json"
     xls = "tests/fixtures/load_rddb.xlsx"
@@ -39,3 +47,16 @@ def test_get_headers():
     result = get_headers(f)
     assert result[2] == "ИНН"
     assert result[4] == "IMEI"
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / "last_db.db")
+    rows = [
+        {"IMEI": "1", "РДДБ": "a", "Специалист": "b", "ИНН": "1", "КПП": "2"},
+        {"IMEI": "2", "РДДБ": "a", "Специалист": "b", "ИНН": "1", "КПП": "2"},
+    ]
+    assert changed_rows(rows, path) == rows
+    save_rows(rows, path)
+    assert changed_rows(rows, path) == []
+    new_row = dict(rows[1], КПП="3")
+    assert changed_rows([rows[0], new_row], path) == [new_row]
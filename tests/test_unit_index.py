@@ -0,0 +1,81 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.getcwd(), ""))
+
+import batch
+import engine
+import unit_index
+from config import app
+
+
+def test_refresh_index_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    units = [{"id": 10, "uid": "150317175645805", "nm": "АА-1"}]
+    monkeypatch.setattr(unit_index, "get_units", lambda *args: units)
+    assert unit_index.refresh_index("sid", "url", 1) == 1
+    connection = unit_index._connect(1)
+    full_sync = unit_index._get_meta(connection, "last_full_sync")
+    connection.close()
+    monkeypatch.setattr(unit_index, "UNIT_INDEX_FULL_SYNC", -1)
+    monkeypatch.setattr(unit_index, "get_units", lambda *args: None)
+    assert unit_index.refresh_index("sid", "url", 1) == 0
+    assert unit_index.load_imei_map("sid", "url", 1) == {"150317175645805": 10}
+    connection = unit_index._connect(1)
+    assert unit_index._get_meta(connection, "last_full_sync") == full_sync
+    connection.close()
+
+
+def test_provision_object_setup_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    monkeypatch.setattr(engine, "get_hardware_id", lambda unit, fms: 1)
+    monkeypatch.setattr(engine, "create_unit", lambda *args: {"item": {"id": 10}})
+
+    def setup_requests(*args):
+        raise KeyError("MT-5")
+
+    monkeypatch.setattr(engine, "setup_requests", setup_requests)
+    unit = {"geozone_imei": "150317175645805", "ДЛ": "АА-1", "Оборудование": "MT-5"}
+    result = engine.provision_object("sid", unit, "url", 1)
+    assert result["uid"] == 10
+    assert result["errors"]["setup"] == [-1]
+    connection = unit_index._connect(1)
+    rows = connection.execute("SELECT id, imei, name FROM units").fetchall()
+    connection.close()
+    assert rows == [(10, "150317175645805", "АА-1")]
+
+
+def test_provision_object_from_template(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "instance_path", str(tmp_path))
+    monkeypatch.setattr(engine, "get_hardware_id", lambda unit, fms: 1)
+    monkeypatch.setattr(engine, "template_unit", lambda *args: 5)
+    monkeypatch.setattr(
+        engine,
+        "clone_object",
+        lambda sid, url, template_id, name, fms: {"item": {"id": 10, "nm": name}},
+    )
+
+    def create_unit(*args):
+        raise AssertionError("the object is copied")
+
+    monkeypatch.setattr(engine, "create_unit", create_unit)
+    monkeypatch.setattr(engine, "id_fields", lambda sid, uid, url: {"Пин": 3})
+    plans = []
+
+    def send_plan(sid, url, plan):
+        plans.append([step for step, request in plan])
+        return batch.BatchCoalescer(sid, url)
+
+    monkeypatch.setattr(engine, "send_plan", send_plan)
+    unit = {
+        "geozone_imei": "150317175645805",
+        "geozone_sim": "79001234567",
+        "ДЛ": "АА-1",
+        "Оборудование": "MT-5",
+        "Пин": "1",
+    }
+    result = engine.provision_object("sid", unit, "url", 1)
+    assert result["uid"] == 10
+    assert result["errors"] == {}
+    assert plans[0] == ["device_type", "phone", "calc_flags"]
+    assert "card" in plans[1]
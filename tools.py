@@ -1,7 +1,7 @@
 """Additional tools module.
 
 This module contains such functions as:
-sending email, reading xlsx file and reading json into a dictionary,
+sending email, reading xlsx file row by row or through json into a dictionary,
 file comparison and snapshot of the latest wialon database state etc.
 """
 
@@ -9,11 +9,15 @@ import json
 import os
 import smtplib
 from datetime import datetime
+from itertools import chain, repeat
+from typing import Iterator
 
 import pandas as pd
 from dotenv import load_dotenv
+from openpyxl import load_workbook
 
 from config import fstart_stop, logger
+from snapshot import changed_rows, save_rows
 
 load_dotenv()
 
@@ -83,6 +87,81 @@ def xls_to_json(xls_file) -> str:
     return new_file_name
 
 
+def _cell_value(value) -> str | None:
+    """Cell value as str, the same as pandas.read_excel(dtype=str).
+
+    Args:
+        value: value of the cell read by openpyxl
+
+    Returns:
+        str | None: value of the cell, None for an empty cell
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+@fstart_stop
+def read_xlsx(xls_file) -> Iterator[dict]:
+    """Read rows of an Excel file one by one.
+
+    The first sheet is read with openpyxl in read-only mode, so neither
+    the whole workbook nor a json copy of it is kept in memory.
+    The first row is the header, empty rows are skipped.
+    Values are str or None, as after xls_to_json and read_json.
+
+    Args:
+        xls_file (file.xlsx): Excel file
+
+    Yields:
+        dict: {column header: cell value} for every row
+    """
+    logger.info(f"Чтение файла {xls_file}")
+    workbook = load_workbook(xls_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        headers = [
+            f"Unnamed: {number}" if name is None else str(name)
+            for number, name in enumerate(header)
+        ]
+        count = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            count += 1
+            yield {
+                name: _cell_value(value)
+                for name, value in zip(headers, chain(row, repeat(None)))
+            }
+        logger.debug(f"Прочитано строк: {count}")
+    finally:
+        workbook.close()
+
+
+@fstart_stop
+@logger.catch
+def count_rows(xls_file) -> int | None:
+    """Number of rows of an Excel file without reading it.
+
+    The number is taken from the dimension of the first sheet,
+    so empty rows are counted too.
+
+    Args:
+        xls_file (file.xlsx): Excel file
+
+    Returns:
+        int | None: number of rows without the header, None if the
+        sheet has no dimension
+    """
+    workbook = load_workbook(xls_file, read_only=True)
+    try:
+        max_row = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+    return max_row - 1 if max_row else None
+
+
 @fstart_stop
 @logger.catch
 def is_xlsx(input_file) -> bool:
@@ -109,7 +188,7 @@ def read_json(file_path) -> dict:
     logger.info(f"{file_path}")
     with open(f"{file_path}.json", "r", encoding="UTF-8") as f:
         json_file = json.loads(f.read())
-        logger.debug(f"Файл преобразованный в json формат - {json_file}")
+        logger.debug(f"Файл преобразован в json формат, записей: {len(json_file)}")
         return json_file
 
 
@@ -136,39 +215,13 @@ def get_headers(json_file: dict) -> list[str]:
 def update_bd(data: list[dict]) -> None:
     """Get snapshot carcade data.
 
-    The function reads the incoming carcade file and saves the data
-    to a separate json file.
+    The function writes the rows of the incoming carcade file
+    to the snapshot, see snapshot.save_rows. Only the rows that
+    changed need to be passed.
     """
-    logger.debug(f"На входе функции словарь - {data}")
-    bd = {}
-    for value in data:
-        imei = None
-        inn = None
-        if type(value.get("IMEI")) is float:
-            imei = int(value.get("IMEI"))
-            logger.debug("Если ИМЕЙ float, преобразуем в integer")
-        else:
-            imei = value.get("IMEI")
-        if type(value.get("ИНН")) is float:
-            inn = int(value.get("ИНН"))
-            logger.debug("Если ИНН float, преобразуем в integer")
-        else:
-            inn = value.get("ИНН")
-        bd.update(
-            {
-                imei: {
-                    "РДДБ": value.get("РДДБ"),
-                    "Специалист": value.get("Специалист"),
-                    "IMEI": imei,
-                    "ИНН": inn,
-                    "КПП": value.get("КПП"),
-                }
-            }
-        )
-        logger.debug("Снимок базы данных каркаде готов")
-        logger.debug('Записан в файл "data_carcade/last_db.json"')
-    with open("data_carcade/last_db.json", "w") as f:
-        json.dump(bd, f, ensure_ascii=False)
+    logger.debug(f"На входе функции строк - {len(data)}")
+    save_rows(data)
+    logger.debug("Снимок базы данных каркаде обновлён")
 
 
 @fstart_stop
@@ -176,9 +229,9 @@ def update_bd(data: list[dict]) -> None:
 def get_diff_in_upload_file(new_file: list[dict]) -> list[dict]:
     """Comparing an input file with a snapshot.
 
-    The function compares the data from the input file with the data stored
-    since the last update and returns a list of objects that do not exist or
-    have changed relative to the snapshot.
+    The function compares hashes of the rows of the input file with the
+    hashes stored since the last update and returns a list of objects
+    that do not exist or have changed relative to the snapshot.
 
     Args:
         new_file(list[dict]): incoming data
@@ -187,28 +240,9 @@ def get_diff_in_upload_file(new_file: list[dict]) -> list[dict]:
         to_update(list[dict]): data to be added or changed on wialon server
     """
     logger.debug("На входе функции свежий словарь с объектам Каркаде")
-    to_update = []
-    last_db = read_json("data_carcade/last_db")
-    for value in new_file:
-        imei = str(value.get("IMEI"))
-        inn = None
-        if type(value.get("ИНН")) is float:
-            inn = int(value.get("ИНН"))
-        else:
-            inn = value.get("ИНН")
-        if imei in last_db:
-            if (
-                value.get("РДДБ") != last_db[imei].get("РДДБ")
-                or value.get("Специалист") != last_db[imei].get("Специалист")
-                or inn != last_db[imei].get("ИНН")
-                or value.get("КПП") != last_db[imei].get("КПП")
-            ):
-                last_db[imei].update(value)
-                to_update.append(value)
-        else:
-            to_update.append(value)
+    to_update = changed_rows(new_file)
     logger.debug(
-        "Если данные между локальной базой и входящей хотя бы в одном поле отлиачются, данный объект записывается в новый список словарей, который и возращает функция т.о из более 15к строк, новый список объектов содержит только актуальные значения, в среднем от 200 до 600 объектов."
+        f"Изменившихся или новых объектов: {len(to_update)} из {len(new_file)}"
     )
     return to_update
 
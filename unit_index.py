@@ -0,0 +1,160 @@
+"""Local index of objects on the wialon servers.
+
+For every FMS an SQLite file is kept in the instance folder with
+imei, name and id of all objects and the time of the last sync.
+Jobs read imei -> id from the index and download from the server
+only objects created since the last sync. Once in
+UNIT_INDEX_FULL_SYNC seconds the index is downloaded in full to
+catch deleted objects and changed imei.
+
+An incremental sync sees only new objects: an object deleted or an
+imei changed on the server stays in the index until the next full
+sync, so UNIT_INDEX_FULL_SYNC is kept short. If the server returns an
+error the index and the time of the sync are left as they are.
+"""
+
+import os
+import sqlite3
+import time
+
+from config import app, fstart_stop, logger
+from constant import UNIT_INDEX_FULL_SYNC
+from engine import get_units, normalize_imei
+
+# the clocks of the server and the application may differ
+SYNC_MARGIN = 10 * 60
+
+
+def _connect(fms: int) -> sqlite3.Connection:
+    """Open the index of the server, create tables if necessary.
+
+    Args:
+        fms (int): server number
+
+    Returns:
+        sqlite3.Connection: connection to the index
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    path = os.path.join(app.instance_path, f"units_fms{fms}.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY,
+            imei TEXT,
+            name TEXT
+        )"""
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS units_imei ON units (imei)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)"
+    )
+    return connection
+
+
+def _get_meta(connection: sqlite3.Connection, key: str) -> float:
+    row = connection.execute(
+        "SELECT value FROM meta WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _set_meta(connection: sqlite3.Connection, key: str, value: float) -> None:
+    connection.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+@fstart_stop
+@logger.catch
+def refresh_index(sid: str, URL: str, fms: int) -> int:
+    """Bring the index of the server up to date.
+
+    If the last full sync is older than UNIT_INDEX_FULL_SYNC, all objects
+    are downloaded and the index is rewritten. Otherwise only objects
+    created since the last sync are requested (search by
+    rel_creation_time) and added to the index.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+
+    Returns:
+        int: number of objects written to the index, 0 if the objects
+        were not loaded
+    """
+    now = time.time()
+    connection = _connect(fms)
+    last_sync = _get_meta(connection, "last_sync")
+    full = now - _get_meta(connection, "last_full_sync") > UNIT_INDEX_FULL_SYNC
+    if full:
+        logger.debug(f"полная загрузка индекса объектов FMS {fms}")
+        units = get_units(sid, URL)
+    else:
+        logger.debug(
+            f"загрузка объектов FMS {fms}, созданных после {time.ctime(last_sync)}"
+        )
+        units = get_units(
+            sid, URL, "rel_creation_time", f">={int(last_sync - SYNC_MARGIN)}"
+        )
+    if units is None:
+        connection.close()
+        logger.error(f"индекс объектов FMS {fms} не обновлён")
+        return 0
+    with connection:
+        if full:
+            connection.execute("DELETE FROM units")
+        connection.executemany(
+            "INSERT OR REPLACE INTO units (id, imei, name) VALUES (?, ?, ?)",
+            [
+                (unit.get("id"), str(unit.get("uid") or ""), unit.get("nm"))
+                for unit in units
+            ],
+        )
+        _set_meta(connection, "last_sync", now)
+        if full:
+            _set_meta(connection, "last_full_sync", now)
+    connection.close()
+    logger.debug(f"в индекс FMS {fms} записано объектов: {len(units)}")
+    return len(units)
+
+
+@fstart_stop
+@logger.catch
+def load_imei_map(sid: str, URL: str, fms: int) -> dict[str, int]:
+    """Get id of all objects by imei from the index.
+
+    Args:
+        sid (str): session id
+        URL (str): server address
+        fms (int): server number
+
+    Returns:
+        dict: {imei: object id}
+    """
+    refresh_index(sid, URL, fms)
+    connection = _connect(fms)
+    rows = connection.execute(
+        "SELECT imei, id FROM units WHERE imei != '' ORDER BY id"
+    ).fetchall()
+    connection.close()
+    return {normalize_imei(imei): unit_id for imei, unit_id in rows}
+
+
+@fstart_stop
+@logger.catch
+def remember_unit(fms: int, unit_id: int, imei: str, name: str) -> None:
+    """Add an object created by the application to the index.
+
+    Args:
+        fms (int): server number
+        unit_id (int): object id
+        imei (str): object imei
+        name (str): object name
+    """
+    with _connect(fms) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO units (id, imei, name) VALUES (?, ?, ?)",
+            (unit_id, str(imei), name),
+        )
+    connection.close()